@@ -1,62 +1,63 @@
 import pandas as pd
-import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.rates import compile_rate_bands, resolve_rate_bands
+from overflight.store import load_master
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, result_line
+from overflight.results import record_results
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 def verify_charges():
     # 1. Load Data
-    vendor_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\ASB\Vendor Master.csv"
-    rate_master_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\ASB\Rate Master.csv"
+    stage('load')
+    vendor_file = invoice_path(os.path.join(BASE_DIR, "Vendor Master.csv"))
+    rate_master_file = os.path.join(BASE_DIR, "Rate Master.csv")
 
-    df_vendor = pd.read_csv(vendor_file)
-    df_rates = pd.read_csv(rate_master_file)
+    df_vendor = working_frame(pd.read_csv(vendor_file))
+    df_rates = load_master(rate_master_file, columns=['MTOW', 'Unit Rate'], numeric=['MTOW', 'Unit Rate'])
 
     # 2. Clean Column Names
     df_vendor.columns = df_vendor.columns.str.strip().str.replace('\n', '')
     df_rates.columns = df_rates.columns.str.strip().str.replace('\n', '')
 
-    # 3. Prepare Rate Master
-    # Select relevant columns and convert to numeric
-    rate_cols = ['MTOW', 'Unit Rate']
-    df_rates_clean = df_rates[rate_cols].dropna().copy()
-    df_rates_clean['MTOW'] = pd.to_numeric(df_rates_clean['MTOW'], errors='coerce')
-    df_rates_clean['Unit Rate'] = pd.to_numeric(df_rates_clean['Unit Rate'], errors='coerce')
-
-    # 4. Define Lookup Function (Finds closest MTOW)
-    def get_unit_rate(tonn):
-        if pd.isna(tonn):
-            return np.nan
-        
-        # Try exact match first
-        match = df_rates_clean[df_rates_clean['MTOW'] == tonn]
-        if not match.empty:
-            return float(match.iloc[0]['Unit Rate'])
-        
-        # If no exact match, find the closest MTOW
-        df_rates_clean['diff'] = abs(df_rates_clean['MTOW'] - tonn)
-        closest_idx = df_rates_clean['diff'].idxmin()
-        return float(df_rates_clean.loc[closest_idx, 'Unit Rate'])
+    # 3. Prepare Rate Master (loaded with only the numeric MTOW and Unit Rate columns)
+    stage('lookup', rows=len(df_vendor))
+    df_rates_clean = df_rates.dropna()
+
+    # 4. Compile Rate Bands (exact MTOW, else closest MTOW)
+    rate_bands = compile_rate_bands(df_rates_clean, 'MTOW', 'Unit Rate')
 
     # 5. Apply Logic
     # Map Unit Rate
-    df_vendor['Mapped_Unit_Rate'] = df_vendor['tonn'].apply(get_unit_rate)
+    df_vendor['Mapped_Unit_Rate'] = resolve_rate_bands(df_vendor['tonn'], rate_bands, match='nearest')['Unit Rate']
     
     # Calculate Charge: Unit Rate * (Distance / 100)
+    stage('compute', rows=len(df_vendor))
     df_vendor['Calculated_Amount'] = df_vendor['Mapped_Unit_Rate'] * (df_vendor['Dist.'] / 100)
     df_vendor['Calculated_Amount'] = df_vendor['Calculated_Amount'].round(2)
     
     # 6. Verify
-    df_vendor['Status'] = np.where(
-        abs(df_vendor['Calculated_Amount'] - df_vendor['Amount']) <= 0.5,
-        'Matched',
-        'Not Matched'
-    )
+    stage('compare', rows=len(df_vendor))
+    _, df_vendor['Status'] = compare_charges(df_vendor['Calculated_Amount'], df_vendor['Amount'], station='ASB')
     
     # 7. Save Results
+    stage('write', rows=len(df_vendor))
     output_cols = ['Invoice Number', 'Ident', 'Reg', 'Dist.', 'tonn', 'Amount', 
                    'Mapped_Unit_Rate', 'Calculated_Amount', 'Status']
     
-    output_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\ASB\Vendor_Data_Verified.csv"
+    output_file = output_path(os.path.join(BASE_DIR, "Vendor_Data_Verified.csv"))
     df_vendor[output_cols].to_csv(output_file, index=False)
+    record_results('ASB', df_vendor[output_cols].assign(Flight_Date=df_vendor.get('Date')), vendor_file)
     print("Verification complete. Results saved.")
+    result_line('ASB', df_vendor['Status'], output_file)
 
 if __name__ == "__main__":
+    configure_report()
     verify_charges()
\ No newline at end of file
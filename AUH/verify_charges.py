@@ -1,20 +1,35 @@
 import pandas as pd
-import numpy as np
 import os
-import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.mtow import build_registration_index, lookup_mtow
+from overflight.rates import compile_rate_index, pair_rate_keys, resolve_rate_index
+from overflight.parsing import extract_numeric_column
+from overflight.store import AIRPORTS_FILE, load_airports, load_master
+from overflight.airports import airport_index
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.incremental import RowCache, fingerprint_rows
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import record_results
+
+configure_report()
 
 # File paths
-vendor_file = "1900373598.csv"
-iata_mapping_file = "IATA ICAO Mapping.xlsx - Sheet1.csv"
+vendor_file = invoice_path("1900373598.csv")
 mtow_master_file = "MTOW Master.xlsx - Sheet1.csv"
 rate_master_file = "Rate Master.csv"
 
 # Read files
+stage('load')
 print("Loading files...")
 df_vendor = pd.read_csv(vendor_file)
-df_iata = pd.read_csv(iata_mapping_file)
-df_mtow_master = pd.read_csv(mtow_master_file)
-df_rate_master = pd.read_csv(rate_master_file)
+df_iata = load_airports()
+df_mtow_master = load_master(mtow_master_file)
+df_rate_master = load_master(rate_master_file)
 
 print(f"Vendor data loaded: {len(df_vendor)} records")
 print(f"IATA-ICAO Mapping loaded: {len(df_iata)} airports")
@@ -29,51 +44,36 @@ df_rate_master.columns = df_rate_master.columns.str.strip()
 
 print(f"\nVendor columns: {list(df_vendor.columns)}")
 
-# Create working dataframe
-df_working = df_vendor.copy()
-
-# Helper function to extract numeric values
-def extract_numeric_value(val):
-    """Extract first numeric value from a cell"""
-    if pd.isna(val):
-        return np.nan
-    val_str = str(val).strip().replace('\n', ' ').replace('\r', ' ')
-    match = re.search(r'(\d+\.?\d*)', val_str)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            return np.nan
-    return np.nan
+# Create working dataframe of the rows that are new or changed since the last run
+# (a re-issued invoice only re-verifies its corrected lines)
+row_cache = RowCache('AUH', vendor_file, [__file__, mtow_master_file, rate_master_file, AIRPORTS_FILE])
+fingerprints = fingerprint_rows(df_vendor, ['From', 'To', 'Info', 'Charge'])
+todo = row_cache.todo(fingerprints)
+row_cache.report(todo)
+df_working = working_frame(df_vendor, todo)
 
 print("\n" + "="*100)
 print("STEP 1: IATA CODE EXTRACTION AND AIRPORT MAPPING")
 print("="*100)
 
-# Extract IATA codes from From and To columns
+# From and To hold airport codes (ICAO, e.g. VIDP / OTHH, or IATA), first word of the cell
 from_col = 'From'
 to_col = 'To'
 
-# Extract From IATA code - take first 4 characters or until space
-def extract_iata(val):
-    if pd.isna(val):
-        return None
-    iata_str = str(val).strip().upper()
-    # Take first part (before space if exists)
-    if ' ' in iata_str:
-        return iata_str.split()[0][:4]
-    return iata_str[:4]
+from_codes = df_working[from_col].astype('string').str.strip().str.split().str[0]
+to_codes = df_working[to_col].astype('string').str.strip().str.split().str[0]
 
-df_working['FROM_IATA'] = df_working[from_col].apply(extract_iata)
-df_working['TO_IATA'] = df_working[to_col].apply(extract_iata)
+# Resolve both columns to integer airport ids in one lookup each (see overflight.airports)
+stage('lookup', rows=len(df_working))
+airports = airport_index()
+df_working['FROM_ID'] = airports.encode(from_codes)
+df_working['TO_ID'] = airports.encode(to_codes)
 
-# Create IATA to Airport name lookup
-iata_lookup = dict(zip(df_iata['IATA'], df_iata['Airport']))
-iata_to_icao = dict(zip(df_iata['IATA'], df_iata['ICAO']))
-
-df_working['FROM_AIRPORT'] = df_working['FROM_IATA'].map(iata_lookup)
-df_working['TO_AIRPORT'] = df_working['TO_IATA'].map(iata_lookup)
-df_working['TO_ICAO'] = df_working['TO_IATA'].map(iata_to_icao)
+df_working['FROM_IATA'] = airports.iata(df_working['FROM_ID']).fillna(from_codes.str.upper())
+df_working['TO_IATA'] = airports.iata(df_working['TO_ID']).fillna(to_codes.str.upper())
+df_working['FROM_AIRPORT'] = airports.name(df_working['FROM_ID'])
+df_working['TO_AIRPORT'] = airports.name(df_working['TO_ID'])
+df_working['TO_ICAO'] = airports.icao(df_working['TO_ID'])
 
 print(f"IATA mapping completed:")
 print(f"  From airport mapped: {df_working['FROM_AIRPORT'].notna().sum()}/{len(df_working)}")
@@ -84,17 +84,20 @@ print("\n" + "="*100)
 print("STEP 2: LANDING DETECTION")
 print("="*100)
 
-# Landing in AUH if destination is AUH
-df_working['LANDED_IN_AUH'] = df_working['TO_IATA'].str.upper() == 'AUH'
-df_working['FLIGHT_TYPE'] = df_working['LANDED_IN_AUH'].apply(
-    lambda x: 'With landing' if x else 'Without landing (Overflight)'
+# The Abu Dhabi FIR covers the UAE: a flight lands if it arrives at or departs from
+# a UAE airport (OMAA, OMDB, OMSJ, ...), and overflies it otherwise
+uae = airports.country([airports.code_id('AUH')])[0]
+df_working['LANDED_IN_UAE'] = ((airports.country(df_working['FROM_ID']) == uae)
+                               | (airports.country(df_working['TO_ID']) == uae)).fillna(False).astype(bool)
+df_working['FLIGHT_TYPE'] = df_working['LANDED_IN_UAE'].map(
+    {True: 'With landing', False: 'Without landing (Overflight)'}
 )
 
-landing_count = df_working['LANDED_IN_AUH'].sum()
+landing_count = df_working['LANDED_IN_UAE'].sum()
 overflight_count = len(df_working) - landing_count
 
 print(f"Flight Type Distribution:")
-print(f"  With landing (to AUH): {landing_count}")
+print(f"  With landing (to / from the UAE): {landing_count}")
 print(f"  Without landing (Overflight): {overflight_count}")
 print(f"  Total: {len(df_working)}")
 
@@ -107,19 +110,10 @@ print("="*100)
 info_col = 'Info'
 df_working['AIRCRAFT_REG'] = df_working[info_col].apply(lambda x: str(x).strip() if pd.notna(x) else None)
 
-# Lookup MTOW from master file
-def get_mtow_from_master(reg):
-    """Get MTOW from master file using aircraft registration"""
-    if pd.isna(reg) or reg is None:
-        return np.nan
-    matches = df_mtow_master[df_mtow_master['Aircraft'].str.strip() == str(reg).strip()]
-    if len(matches) > 0:
-        return matches.iloc[0]['MTOW_in_KGs']
-    return np.nan
+# Lookup MTOW from master file (one hash join over the whole column)
+mtow_index = build_registration_index(df_mtow_master)
 
-df_working['MTOW_tonnes'] = df_working['AIRCRAFT_REG'].apply(get_mtow_from_master)
-# Convert to tonnes (divide by 1000) only if numeric
-df_working['MTOW_tonnes'] = pd.to_numeric(df_working['MTOW_tonnes'], errors='coerce') / 1000
+df_working['MTOW_tonnes'] = lookup_mtow(df_working['AIRCRAFT_REG'], mtow_index) / 1000
 
 print(f"MTOW lookup results:")
 print(f"  Valid MTOW values: {df_working['MTOW_tonnes'].notna().sum()}/{len(df_working)}")
@@ -129,39 +123,32 @@ print("\n" + "="*100)
 print("STEP 4: RATE MASTER LOOKUP")
 print("="*100)
 
-# For each flight, find the matching rate based on MTOW
-def get_rate_from_master(mtow_tonnes):
-    """Find the charge rate for a given MTOW"""
-    if pd.isna(mtow_tonnes):
-        return np.nan
-    
-    mtow_kg = mtow_tonnes * 1000
-    
-    # Try exact match first
-    matching_rates = df_rate_master[df_rate_master['Mtow'] == mtow_kg]
-    
-    if len(matching_rates) > 0:
-        return matching_rates.iloc[0]['Charge']
-    
-    # If no exact match, use closest match
-    rate_master_copy = df_rate_master.copy()
-    rate_master_copy['MTOW_diff'] = abs(rate_master_copy['Mtow'] - mtow_kg)
-    best_match = rate_master_copy.loc[rate_master_copy['MTOW_diff'].idxmin()]
-    
-    return best_match['Charge']
-
-df_working['Unit_Rate_mapped'] = df_working['MTOW_tonnes'].apply(get_rate_from_master)
+# Compile the rate master once, keyed by (flight type, MTOW), then price every flight in one pass.
+# The Rate Master has no landing column: it lists two charges per MTOW (e.g. 227930 -> 200 and 90),
+# the lower for flights landing in the UAE and the higher for overflights.
+if 'Landing/takeoff' in df_rate_master.columns:
+    rate_keys = df_rate_master['Landing/takeoff']
+else:
+    rate_keys = pair_rate_keys(df_rate_master, 'Mtow', 'Charge', ('With landing', 'Without landing (Overflight)'))
+rate_index = compile_rate_index(df_rate_master.assign(FLIGHT_TYPE=rate_keys), 'FLIGHT_TYPE', 'Mtow', 'Charge')
+rate_match = resolve_rate_index(df_working['FLIGHT_TYPE'], df_working['MTOW_tonnes'] * 1000, rate_index,
+                                match='nearest')
+df_working['Unit_Rate_mapped'] = rate_match['Charge']
+df_working['Rate_Candidates'] = rate_match['Rate_Candidates']
 
 print(f"Rate master matching results:")
 print(f"  Matched rates: {df_working['Unit_Rate_mapped'].notna().sum()}/{len(df_working)}")
+print(f"  No rate band: {(df_working['MTOW_tonnes'].notna() & rate_match['Band_MTOW'].isna()).sum()}")
+print(f"  Ambiguous rate (several charges for one flight type and MTOW, first one used): {rate_match['Rate_Ambiguous'].sum()}")
 
 # STEP 5: Extract Vendor Charge
+stage('load', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 5: VENDOR CHARGE EXTRACTION")
 print("="*100)
 
 charge_col = 'Charge'
-df_working['Vendor_Charge'] = df_working[charge_col].apply(extract_numeric_value)
+df_working['Vendor_Charge'] = extract_numeric_column(df_working[charge_col], station='AUH', label='vendor charge')
 
 print(f"Vendor charge extraction:")
 print(f"  Valid charges: {df_working['Vendor_Charge'].notna().sum()}/{len(df_working)}")
@@ -172,30 +159,23 @@ print("STEP 6: CHARGE VERIFICATION")
 print("="*100)
 
 # Calculated charge equals mapped unit rate for flat rate verification
+stage('compute', rows=len(df_working))
 df_working['Calculated_Charge'] = df_working['Unit_Rate_mapped']
 
 # Compare charges
-tolerance = 0.01
-
-def check_match(calculated, vendor):
-    """Check if calculated charge matches vendor charge within tolerance"""
-    if pd.isna(calculated) or pd.isna(vendor):
-        return "Not Matched"
-    diff = abs(calculated - vendor)
-    if diff <= tolerance:
-        return "Matched"
-    else:
-        return "Not Matched"
-
-df_working['Difference'] = abs(df_working['Calculated_Charge'] - df_working['Vendor_Charge'])
-df_working['Status'] = df_working.apply(
-    lambda row: check_match(row['Calculated_Charge'], row['Vendor_Charge']),
-    axis=1
+stage('compare', rows=len(df_working))
+df_working['Difference'], df_working['Status'] = compare_charges(
+    df_working['Calculated_Charge'], df_working['Vendor_Charge'], station='AUH'
 )
 
+# Add back the unchanged rows verified in earlier runs
+df_working = row_cache.merge(df_vendor, fingerprints, df_working)
+row_cache.save(fingerprints, df_working)
+
 # Summary statistics
 matched_count = (df_working['Status'] == 'Matched').sum()
 not_matched_count = (df_working['Status'] == 'Not Matched').sum()
+missing_count = (df_working['Status'] == 'Missing Input').sum()
 total_records = len(df_working)
 success_rate = (matched_count / total_records) * 100 if total_records > 0 else 0
 
@@ -204,6 +184,7 @@ print("VERIFICATION SUMMARY")
 print("="*100)
 print(f"[MATCHED]     {matched_count}")
 print(f"[NOT MATCHED] {not_matched_count}")
+print(f"[MISSING INPUT] {missing_count}")
 print(f"Total Records: {total_records}")
 print(f"Success Rate:  {success_rate:.1f}%")
 
@@ -235,19 +216,19 @@ for flight_type in df_working['FLIGHT_TYPE'].unique():
 
 # Detailed verification results
 print("\n" + "="*100)
-print("DETAILED VERIFICATION RESULTS (First 30 rows):")
+print("DETAILED VERIFICATION RESULTS:")
 print("="*100)
 display_cols = ['AIRCRAFT_REG', 'MTOW_tonnes', 'FLIGHT_TYPE', 'Unit_Rate_mapped', 'Vendor_Charge', 'Difference', 'Status']
-print(df_working[display_cols].head(30).to_string())
+preview(df_working, display_cols)
 
 # Mismatch analysis
-mismatches = df_working[df_working['Status'] == 'Not Matched'].copy()
+mismatches = df_working[df_working['Status'] == 'Not Matched']
 if len(mismatches) > 0:
-    valid_mismatches = mismatches[mismatches['Unit_Rate_mapped'].notna()].copy()
+    valid_mismatches = mismatches[mismatches['Unit_Rate_mapped'].notna()]
     if len(valid_mismatches) > 0:
         print(f"\n[FOUND {len(valid_mismatches)} MISMATCHES]")
-        print(f"\nMismatch Details (first 15):")
-        print(valid_mismatches[['AIRCRAFT_REG', 'MTOW_tonnes', 'FLIGHT_TYPE', 'Unit_Rate_mapped', 'Vendor_Charge', 'Difference']].head(15).to_string())
+        print(f"\nMismatch Details:")
+        list_mismatches(valid_mismatches, ['AIRCRAFT_REG', 'MTOW_tonnes', 'FLIGHT_TYPE', 'Unit_Rate_mapped', 'Vendor_Charge', 'Difference'])
         
         print(f"\nDifference Analysis (valid mismatches):")
         print(f"  Total valid mismatches: {len(valid_mismatches)}")
@@ -257,12 +238,16 @@ if len(mismatches) > 0:
         print(f"  Total vendor difference: {valid_mismatches['Vendor_Charge'].sum():.2f}")
 
 # Save results
-output_file = "1900373598_Verified.csv"
+stage('write', rows=len(df_working))
+output_file = output_path("1900373598_Verified.csv")
 
 output_cols = ['AIRCRAFT_REG', 'FROM_IATA', 'TO_IATA', 'MTOW_tonnes', 'FLIGHT_TYPE', 
-               'Unit_Rate_mapped', 'Vendor_Charge', 'Difference', 'Status']
-df_output = df_working[output_cols].copy()
+               'Unit_Rate_mapped', 'Rate_Candidates', 'Vendor_Charge', 'Difference', 'Status']
+df_output = df_working[output_cols]
 df_output.to_csv(output_file, index=False)
+record_results('AUH', df_output.assign(Flight_Date=df_working.get('Date')), vendor_file)
 
 print(f"\n\nResults saved to: {os.path.abspath(output_file)}")
 print("="*100)
+
+result_line('AUH', df_output['Status'], os.path.abspath(output_file))
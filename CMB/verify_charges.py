@@ -1,18 +1,36 @@
 import pandas as pd
 import numpy as np
 import os
-import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.parsing import extract_numeric_column
+from overflight.store import load_master
+from overflight.columns import resolve_columns
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.distance import check_distance, distance_line
+from overflight.formulas import compile_formula, evaluate_formula
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import record_results
+
+configure_report()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # File paths
-mtow_master = r"c:\Users\Anurag\Downloads\Assignment\Assignment\CMB\MTOW Master.csv"
-rate_master = r"c:\Users\Anurag\Downloads\Assignment\Assignment\CMB\Rate Master.csv"
-vendor_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\CMB\Vendor Data.csv"
+mtow_master = os.path.join(BASE_DIR, "MTOW Master.csv")
+rate_master = os.path.join(BASE_DIR, "Rate Master.csv")
+vendor_file = invoice_path(os.path.join(BASE_DIR, "Vendor data.csv"))
 
 # Read files
+stage('load')
 print("Loading files...")
 df_vendor = pd.read_csv(vendor_file)
-df_mtow_master = pd.read_csv(mtow_master)
-df_rate_master = pd.read_csv(rate_master)
+df_mtow_master = load_master(mtow_master)
+df_rate_master = load_master(rate_master)
 
 print(f"Vendor data loaded: {len(df_vendor)} records")
 print(f"MTOW Master loaded: {len(df_mtow_master)} aircraft")
@@ -25,22 +43,8 @@ df_rate_master.columns = df_rate_master.columns.str.strip()
 
 print(f"\nVendor columns: {list(df_vendor.columns)}")
 
-# Create working dataframe
-df_working = df_vendor.copy()
-
-# Helper function to extract numeric values
-def extract_numeric_value(val):
-    """Extract first numeric value from a cell"""
-    if pd.isna(val):
-        return np.nan
-    val_str = str(val).strip().replace('\n', ' ').replace('\r', ' ')
-    match = re.search(r'(\d+\.?\d*)', val_str)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            return np.nan
-    return np.nan
+# Create working dataframe (shares the vendor columns, see overflight.frames)
+df_working = working_frame(df_vendor)
 
 print("\n" + "="*100)
 print("STEP 1: DATA EXTRACTION")
@@ -50,36 +54,24 @@ print("="*100)
 reg_col = 'Registration No'
 df_working['Aircraft_Reg'] = df_working[reg_col].apply(lambda x: str(x).strip() if pd.notna(x) else None)
 
-# Extract distance (in NM - Nautical Miles)
-distance_col = None
-for col in df_working.columns:
-    if 'Distance' in col and 'NM' in col:
-        distance_col = col
-        break
+# Vendor column roles (worked out once per header layout, see overflight.columns)
+vendor_columns = resolve_columns(df_working, 'CMB')
 
-if distance_col is None:
-    # Try to find distance column by checking for numeric column with large values
-    for col in df_working.columns:
-        if 'Distance' in col or 'distance' in col:
-            distance_col = col
-            break
+# Extract distance (in NM - Nautical Miles), else any distance column
+distance_col = vendor_columns['distance']
 
 print(f"Distance column identified: {distance_col}")
-df_working['Distance_NM'] = df_working[distance_col].apply(extract_numeric_value)
+df_working['Distance_NM'] = extract_numeric_column(df_working[distance_col], station='CMB', label='distance')
 
 # Extract MTOW (in M.Ton or tonnes)
-mtow_col = None
-for col in df_working.columns:
-    if 'MTOW' in col and 'Ton' in col:
-        mtow_col = col
-        break
+mtow_col = vendor_columns['mtow']
 
 print(f"MTOW column identified: {mtow_col}")
-df_working['MTOW_tonnes'] = df_working[mtow_col].apply(extract_numeric_value)
+df_working['MTOW_tonnes'] = extract_numeric_column(df_working[mtow_col], station='CMB', label='MTOW')
 
 # Extract vendor charge
 charge_col = 'Charge'
-df_working['Vendor_Charge'] = df_working[charge_col].apply(extract_numeric_value)
+df_working['Vendor_Charge'] = extract_numeric_column(df_working[charge_col], station='CMB', label='vendor charge')
 
 print(f"\nData Quality Check:")
 print(f"  Records with valid Distance: {df_working['Distance_NM'].notna().sum()}/{len(df_working)}")
@@ -87,6 +79,7 @@ print(f"  Records with valid MTOW: {df_working['MTOW_tonnes'].notna().sum()}/{le
 print(f"  Records with valid Vendor Charge: {df_working['Vendor_Charge'].notna().sum()}/{len(df_working)}")
 
 # STEP 2: DISTANCE CAPPING
+stage('compute', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 2: DISTANCE CAPPING LOGIC")
 print("="*100)
@@ -95,18 +88,10 @@ print("="*100)
 # - If distance < 300, use 300
 # - If distance > 600, use 600
 # - Otherwise use actual distance
-def cap_distance(distance):
-    """Apply distance capping rules"""
-    if pd.isna(distance):
-        return np.nan
-    if distance < 300:
-        return 300
-    elif distance > 600:
-        return 600
-    else:
-        return distance
-
-df_working['Distance_Capped'] = df_working['Distance_NM'].apply(cap_distance)
+formula = compile_formula('CMB', rate_master=df_rate_master)
+df_working['Distance_Capped'] = evaluate_formula(
+    formula, outputs=['distance_capped'], distance=df_working['Distance_NM']
+)['distance_capped']
 
 print(f"\nDistance Capping Results:")
 below_300 = (df_working['Distance_NM'] < 300).sum()
@@ -122,9 +107,9 @@ print("STEP 3: CHARGE CALCULATION: (Capped Distance + MTOW) / 3")
 print("="*100)
 
 # Calculate charge: (Capped Distance + MTOW) / 3
-df_working['Calculated_Charge'] = (
-    (df_working['Distance_Capped'] + df_working['MTOW_tonnes']) / 3
-).round(2)
+df_working['Calculated_Charge'] = evaluate_formula(
+    formula, distance=df_working['Distance_NM'], mtow=df_working['MTOW_tonnes']
+)['charge']
 
 print(f"\nFormula Verification (Sample Calculation):")
 if len(df_working[df_working['Calculated_Charge'].notna()]) > 0:
@@ -135,39 +120,43 @@ if len(df_working[df_working['Calculated_Charge'].notna()]) > 0:
     print(f"  Calculation: ({sample['Distance_Capped']} + {sample['MTOW_tonnes']}) / 3 = {sample['Calculated_Charge']:.2f}")
 
 # STEP 4: VERIFICATION
+stage('compare', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 4: CHARGE VERIFICATION")
 print("="*100)
 
 # Compare calculated vs vendor charges with tolerance
-tolerance = 0.01
-
-def check_match(calculated, vendor):
-    """Check if calculated charge matches vendor charge within tolerance"""
-    if pd.isna(calculated) or pd.isna(vendor):
-        return "Not Matched"
-    diff = abs(calculated - vendor)
-    if diff <= tolerance:
-        return "Matched"
-    else:
-        return "Not Matched"
-
-df_working['Difference'] = abs(df_working['Calculated_Charge'] - df_working['Vendor_Charge'])
-df_working['Status'] = df_working.apply(
-    lambda row: check_match(row['Calculated_Charge'], row['Vendor_Charge']),
-    axis=1
+df_working['Difference'], df_working['Status'] = compare_charges(
+    df_working['Calculated_Charge'], df_working['Vendor_Charge'], station='CMB'
 )
 
+# Cross-check the billed distance against the great-circle distance of the route (see overflight.distance)
+origin_col, destination_col = vendor_columns['origin'], vendor_columns['destination']
+if origin_col and destination_col:
+    checked = check_distance(df_working[origin_col], df_working[destination_col],
+                             df_working['Distance_NM'], unit='nm', station='CMB')
+    df_working['GC_Distance_km'] = checked['GC_Distance_km']
+    df_working['Distance_Flag'] = checked['Distance_Flag']
+else:
+    print("WARNING: Could not find origin/destination columns, distance check skipped")
+    checked = None
+    df_working['GC_Distance_km'] = np.nan
+    df_working['Distance_Flag'] = False
+
 # Summary statistics
 matched_count = (df_working['Status'] == 'Matched').sum()
 not_matched_count = (df_working['Status'] == 'Not Matched').sum()
+missing_count = (df_working['Status'] == 'Missing Input').sum()
 total_records = len(df_working)
 success_rate = (matched_count / total_records) * 100 if total_records > 0 else 0
 
 print(f"\n[MATCHED]     {matched_count}")
 print(f"[NOT MATCHED] {not_matched_count}")
+print(f"[MISSING INPUT] {missing_count}")
 print(f"Total Records: {total_records}")
 print(f"Success Rate:  {success_rate:.1f}%")
+if checked is not None:
+    distance_line(checked, station='CMB')
 
 # Data quality metrics
 print("\nData Quality:")
@@ -188,21 +177,21 @@ if len(matched_data) > 0:
 
 # Detailed verification results
 print("\n" + "="*100)
-print("DETAILED VERIFICATION RESULTS (First 20 rows):")
+print("DETAILED VERIFICATION RESULTS:")
 print("="*100)
 display_cols = ['Aircraft_Reg', 'Distance_NM', 'Distance_Capped', 'MTOW_tonnes', 
                 'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status']
-print(df_working[display_cols].head(20).to_string())
+preview(df_working, display_cols)
 
 # Mismatch analysis
-mismatches = df_working[df_working['Status'] == 'Not Matched'].copy()
+mismatches = df_working[df_working['Status'] == 'Not Matched']
 if len(mismatches) > 0:
-    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()].copy()
+    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()]
     if len(valid_mismatches) > 0:
         print(f"\n[FOUND {len(valid_mismatches)} MISMATCHES]")
-        print(f"\nMismatch Details (first 15):")
-        print(valid_mismatches[['Aircraft_Reg', 'Distance_NM', 'Distance_Capped', 'MTOW_tonnes',
-                                'Calculated_Charge', 'Vendor_Charge', 'Difference']].head(15).to_string())
+        print(f"\nMismatch Details:")
+        list_mismatches(valid_mismatches, ['Aircraft_Reg', 'Distance_NM', 'Distance_Capped', 'MTOW_tonnes',
+                                           'Calculated_Charge', 'Vendor_Charge', 'Difference'])
         
         print(f"\nDifference Analysis (valid mismatches):")
         print(f"  Total valid mismatches: {len(valid_mismatches)}")
@@ -212,12 +201,17 @@ if len(mismatches) > 0:
         print(f"  Total vendor difference: {valid_mismatches['Vendor_Charge'].sum():.2f}")
 
 # Save results
+stage('write', rows=len(df_working))
 
 output_cols = ['Aircraft_Reg', 'Distance_NM', 'Distance_Capped', 'MTOW_tonnes', 
-               'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status']
-df_output = df_working[output_cols].copy()
-output_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\CMB\Vendor_Data_Verified.csv"
+               'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status',
+               'GC_Distance_km', 'Distance_Flag']
+df_output = df_working[output_cols]
+output_file = output_path(os.path.join(BASE_DIR, "Vendor_Data_Verified.csv"))
 df_output.to_csv(output_file, index=False)
+record_results('CMB', df_output.assign(Flight_Date=df_working.get(vendor_columns['date'])), vendor_file)
 
 print(f"\n\nResults saved to: {os.path.abspath(output_file)}")
 print("="*100)
+
+result_line('CMB', df_output['Status'], os.path.abspath(output_file))
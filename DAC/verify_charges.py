@@ -1,17 +1,31 @@
 import pandas as pd
-import numpy as np
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.rates import compile_rate_bands, resolve_rate_bands
+from overflight.store import load_master
+from overflight.columns import resolve_columns
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, result_line
+from overflight.results import record_results
+
+configure_report()
 
 # File paths
-vendor_file = "Vendor data.csv"
+vendor_file = invoice_path("Vendor data.csv")
 mtow_master_file = "MTOW Master.xlsx - Sheet1.csv"
 rate_master_file = "Rate Master.csv"
 
 # Read files
+stage('load')
 print("Loading files...")
 df_vendor = pd.read_csv(vendor_file)
-df_mtow_master = pd.read_csv(mtow_master_file)
-df_rate_master = pd.read_csv(rate_master_file)
+df_mtow_master = load_master(mtow_master_file)
+df_rate_master = load_master(rate_master_file)
 
 print(f"Vendor data loaded: {len(df_vendor)} records")
 print(f"MTOW Master loaded: {len(df_mtow_master)} aircraft")
@@ -23,12 +37,9 @@ df_vendor.columns = [col.replace(' ', '_') for col in df_vendor.columns]
 
 print(f"\nVendor columns: {list(df_vendor.columns)}")
 
-# Identify the columns
-vendor_charge_col = None
-for col in df_vendor.columns:
-    if 'RNC' in col.upper() or 'USD' in col.upper():
-        vendor_charge_col = col
-        break
+# Identify the columns (worked out once per header layout, see overflight.columns)
+vendor_columns = resolve_columns(df_vendor, 'DAC')
+vendor_charge_col = vendor_columns['charge']
 
 if vendor_charge_col is None:
     print("ERROR: Could not find RNC(USD) column")
@@ -37,17 +48,12 @@ if vendor_charge_col is None:
 
 print(f"Vendor charge column identified: {vendor_charge_col}")
 
-# Create working dataframe
-df_working = df_vendor.copy()
+# Create working dataframe (shares the vendor columns, see overflight.frames)
+df_working = working_frame(df_vendor)
 
 # Column mappings - find the actual column names
-regn_col = None
-mtow_col = None
-for col in df_working.columns:
-    if 'Regn' in col or 'Registration' in col or 'Acft_Reg' in col:
-        regn_col = col
-    if 'MTOW' in col and 'KG' in col:
-        mtow_col = col
+regn_col = vendor_columns['registration']
+mtow_col = vendor_columns['mtow']
 
 print(f"\nIdentified columns:")
 print(f"  Registration: {regn_col}")
@@ -67,53 +73,27 @@ print(f"\nData preparation:")
 print(f"  Valid MTOW values: {df_working['MTOW_numeric'].notna().sum()}/{len(df_working)}")
 print(f"  Valid Vendor charges: {df_working['Vendor_Charge'].notna().sum()}/{len(df_working)}")
 
-# Map MTOW to rate master - direct lookup
-def get_rate_for_mtow(mtow_value):
-    """Find the charge for a given MTOW value"""
-    if pd.isna(mtow_value):
-        return np.nan
-    
-    # Try exact match first
-    matching_rates = df_rate_master[df_rate_master['MTOW (KG)'] == mtow_value]
-    
-    if len(matching_rates) > 0:
-        return matching_rates.iloc[0]['Charge']
-    
-    # If no exact match, try closest match
-    rate_master_copy = df_rate_master.copy()
-    rate_master_copy['MTOW_diff'] = abs(rate_master_copy['MTOW (KG)'] - mtow_value)
-    closest = rate_master_copy.loc[rate_master_copy['MTOW_diff'].idxmin()]
-    
-    return closest['Charge']
+# Map MTOW to rate master - exact MTOW, else closest MTOW
+stage('lookup', rows=len(df_working))
+rate_bands = compile_rate_bands(df_rate_master, 'MTOW (KG)', 'Charge')
 
 print("\nMapping MTOW to rates...")
-df_working['Rate_Master_Charge'] = df_working['MTOW_numeric'].apply(get_rate_for_mtow)
+rate_match = resolve_rate_bands(df_working['MTOW_numeric'], rate_bands, match='nearest')
+df_working['Rate_Master_Charge'] = rate_match['Charge']
 
 print(f"  Rate master matches: {df_working['Rate_Master_Charge'].notna().sum()}/{len(df_working)}")
+print(f"  No rate band: {(df_working['MTOW_numeric'].notna() & rate_match['Band_MTOW'].isna()).sum()}")
 
 # Verification: Compare calculated charge with vendor charge
-tolerance = 0.01
-
-def check_match(calculated, vendor):
-    """Check if calculated charge matches vendor charge within tolerance"""
-    if pd.isna(calculated) or pd.isna(vendor):
-        return "Not Matched"
-    
-    diff = abs(calculated - vendor)
-    if diff <= tolerance:
-        return "Matched"
-    else:
-        return "Not Matched"
-
-df_working['Difference'] = abs(df_working['Rate_Master_Charge'] - df_working['Vendor_Charge'])
-df_working['Status'] = df_working.apply(
-    lambda row: check_match(row['Rate_Master_Charge'], row['Vendor_Charge']),
-    axis=1
+stage('compare', rows=len(df_working))
+df_working['Difference'], df_working['Status'] = compare_charges(
+    df_working['Rate_Master_Charge'], df_working['Vendor_Charge'], station='DAC'
 )
 
 # Summary statistics
 matched_count = (df_working['Status'] == 'Matched').sum()
 not_matched_count = (df_working['Status'] == 'Not Matched').sum()
+missing_count = (df_working['Status'] == 'Missing Input').sum()
 total_records = len(df_working)
 success_rate = (matched_count / total_records) * 100 if total_records > 0 else 0
 
@@ -122,6 +102,7 @@ print("VERIFICATION SUMMARY")
 print("="*80)
 print(f"[MATCHED]     {matched_count}")
 print(f"[NOT MATCHED] {not_matched_count}")
+print(f"[MISSING INPUT] {missing_count}")
 print(f"Total Records: {total_records}")
 print(f"Success Rate:  {success_rate:.1f}%")
 
@@ -142,13 +123,13 @@ if len(matched_data) > 0:
     print(f"  Total: {matched_data['Vendor_Charge'].sum():.2f}")
 
 # Mismatch analysis
-mismatches = df_working[df_working['Status'] == 'Not Matched'].copy()
+mismatches = df_working[df_working['Status'] == 'Not Matched']
 if len(mismatches) > 0:
-    valid_mismatches = mismatches[mismatches['Rate_Master_Charge'].notna()].copy()
+    valid_mismatches = mismatches[mismatches['Rate_Master_Charge'].notna()]
     if len(valid_mismatches) > 0:
         print(f"\n[FOUND {len(valid_mismatches)} MISMATCHES]")
-        print(f"\nMismatch Details (first 20):")
-        print(valid_mismatches[[regn_col, 'MTOW_numeric', 'Rate_Master_Charge', 'Vendor_Charge', 'Difference']].head(20).to_string())
+        print(f"\nMismatch Details:")
+        list_mismatches(valid_mismatches, [regn_col, 'MTOW_numeric', 'Rate_Master_Charge', 'Vendor_Charge', 'Difference'])
         
         print(f"\nDifference Analysis (valid mismatches):")
         print(f"  Total valid mismatches: {len(valid_mismatches)}")
@@ -158,7 +139,8 @@ if len(mismatches) > 0:
         print(f"  Total vendor difference: {valid_mismatches['Vendor_Charge'].sum():.2f}")
 
 # Save results
-output_file = "Vendor_Data_Verified.csv"
+stage('write', rows=len(df_working))
+output_file = output_path("Vendor_Data_Verified.csv")
 
 # Select relevant columns for output
 output_cols = []
@@ -166,8 +148,11 @@ if regn_col:
     output_cols.append(regn_col)
 output_cols.extend(['MTOW_numeric', 'Rate_Master_Charge', 'Vendor_Charge', 'Difference', 'Status'])
 
-df_output = df_working[output_cols].copy()
+df_output = df_working[output_cols]
 df_output.to_csv(output_file, index=False)
+record_results('DAC', df_output.assign(Flight_Date=df_working.get(vendor_columns['date'])), vendor_file)
 
 print(f"\n\nResults saved to: {os.path.abspath(output_file)}")
 print("="*80)
+
+result_line('DAC', df_output['Status'], os.path.abspath(output_file))
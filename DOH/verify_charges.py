@@ -1,63 +1,77 @@
 import pandas as pd
 import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.mtow import build_registration_index, lookup_mtow
+from overflight.rates import compile_rate_index, resolve_rate_index
+from overflight.store import load_airports, load_master
+from overflight.airports import airport_index
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, result_line
+from overflight.results import record_results
+
+configure_report()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Load data
-vendor_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\DOH\Vendor Data.csv"
-iata_mapping_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\DOH\IATA ICAO Mapping.xlsx - Sheet1.csv"
-mtow_master_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\DOH\MTOW Master.csv"
-rate_master_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\DOH\Rate Master.csv"
+stage('load')
+vendor_file = invoice_path(os.path.join(BASE_DIR, "Vendor Data.csv"))
+mtow_master_file = os.path.join(BASE_DIR, "MTOW Master.csv")
+rate_master_file = os.path.join(BASE_DIR, "Rate Master.csv")
 
 df_vendor = pd.read_csv(vendor_file)
-df_iata = pd.read_csv(iata_mapping_file)
-df_mtow = pd.read_csv(mtow_master_file)
-df_rates = pd.read_csv(rate_master_file)
+df_iata = load_airports()
+df_mtow = load_master(mtow_master_file)
+df_rates = load_master(rate_master_file)
 
 #Map flight type based on DOH presence in Dep or Arr
-def determine_flight_type(row):
-    dep = str(row['IATA']).upper().strip()
-    arr = str(row['IATA.1']).upper().strip()
-    # Logic: If DOH is involved in either end, it's a landing charge
-    if dep == 'DOH' or arr == 'DOH':
-        return 'With landing'
-    else:
-        return 'Without landing rate'
-
-df_vendor['FLIGHT_TYPE'] = df_vendor.apply(determine_flight_type, axis=1)
+# Logic: If DOH is involved in either end, it's a landing charge
+# (departure and arrival codes resolved to airport ids, see overflight.airports)
+airports = airport_index()
+doh_id = airports.code_id('DOH')
+dep_doh = airports.encode(df_vendor['IATA']) == doh_id
+arr_doh = airports.encode(df_vendor['IATA.1']) == doh_id
+df_vendor['FLIGHT_TYPE'] = np.where(dep_doh | arr_doh, 'With landing', 'Without landing rate')
 
 #Clean
 df_vendor = df_vendor.dropna(subset=['Invoice number']).reset_index(drop=True)
 df_vendor = df_vendor.loc[:, ~df_vendor.columns.str.contains('^Unnamed')]
 
 #Get MTOW and convert to Tonnes
-df_mtow['Reg_Clean'] = df_mtow['Aircraft '].str.strip()
-df_vendor['Reg_Clean'] = df_vendor['Registration'].str.strip()
-df_working = df_vendor.merge(df_mtow[['Reg_Clean', 'MTOW_in_KGs']], on='Reg_Clean', how='left')
+stage('lookup', rows=len(df_vendor))
+mtow_index = build_registration_index(df_mtow)
+df_working = working_frame(df_vendor)
+df_working['Reg_Clean'] = df_working['Registration'].str.strip()
+df_working['MTOW_in_KGs'] = lookup_mtow(df_working['Reg_Clean'], mtow_index)
 
 ac_type_mtow = {'A20N': 77000.0, 'A21N': 97000.0, 'B77W': 351534.0, 'B788': 227930.0}
-df_working['MTOW_in_KGs'] = df_working.apply(
-    lambda r: ac_type_mtow.get(r['AC Type'], r['MTOW_in_KGs']) if pd.isna(r['MTOW_in_KGs']) else r['MTOW_in_KGs'], axis=1
-)
+df_working['MTOW_in_KGs'] = df_working['MTOW_in_KGs'].fillna(df_working['AC Type'].map(ac_type_mtow))
 df_working['MTOW_Tonnes'] = pd.to_numeric(df_working['MTOW_in_KGs'], errors='coerce') / 1000
 
-# Rate Master Lookup
-def get_charge(mtow, f_type):
-    if pd.isna(mtow): return np.nan
-    # Clean rate master and filter by exact flight type
-    rates = df_rates.copy()
-    rates['Landing/takeoff'] = rates['Landing/takeoff'].str.strip()
-    match = rates[rates['Landing/takeoff'] == f_type].copy()
-    # Find closest MTOW match
-    match['diff'] = abs(pd.to_numeric(match['MTOW']) - mtow)
-    return float(match.loc[match['diff'].idxmin()]['Charge'])
-
-df_working['CALCULATED_CHARGE'] = df_working.apply(
-    lambda r: get_charge(r['MTOW_Tonnes'], r['FLIGHT_TYPE']), axis=1
-)
+# Rate Master Lookup - keyed by (flight type, closest MTOW), compiled once
+rate_index = compile_rate_index(df_rates, 'Landing/takeoff', 'MTOW', 'Charge')
+rate_match = resolve_rate_index(df_working['FLIGHT_TYPE'], df_working['MTOW_Tonnes'], rate_index, match='nearest')
+df_working['CALCULATED_CHARGE'] = rate_match['Charge']
+df_working['RATE_AMBIGUOUS'] = rate_match['Rate_Ambiguous']
+df_working['RATE_CANDIDATES'] = rate_match['Rate_Candidates']
+if df_working['RATE_AMBIGUOUS'].any():
+    print(f"Ambiguous rate master entries for {df_working['RATE_AMBIGUOUS'].sum()} rows (same flight type and MTOW, different charges)")
 
 # 4. Compare and Save
+stage('compare', rows=len(df_working))
 df_working['TOTAL_BILL_NUM'] = pd.to_numeric(df_working['Total Bill'], errors='coerce')
-df_working['STATUS'] = np.where(abs(df_working['CALCULATED_CHARGE'] - df_working['TOTAL_BILL_NUM']) <= 0.01, 'Matched', 'Not Matched')
+_, df_working['STATUS'] = compare_charges(df_working['CALCULATED_CHARGE'], df_working['TOTAL_BILL_NUM'], station='DOH')
 
-output_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\DOH\Vendor_Data_Verified.csv"
+stage('write', rows=len(df_working))
+output_file = output_path(os.path.join(BASE_DIR, "Vendor_Data_Verified.csv"))
 df_working.to_csv(output_file, index=False)
-print("Verification complete. Results saved.")
\ No newline at end of file
+record_results('DOH', df_working, vendor_file)
+print("Verification complete. Results saved.")
+
+result_line('DOH', df_working['STATUS'], output_file)
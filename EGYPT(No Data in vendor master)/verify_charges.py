@@ -1,18 +1,36 @@
 import pandas as pd
 import numpy as np
 import os
-import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.mtow import build_registration_index, lookup_mtow
+from overflight.parsing import extract_numeric_column
+from overflight.store import load_master
+from overflight.columns import resolve_columns
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.formulas import compile_formula, evaluate_formula
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import record_results
+
+configure_report()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Load data
-vendor_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\EGYPT\Vendor Data.csv"
-mtow_master_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\EGYPT\MTOW Master.csv"
-rate_master_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\EGYPT\Rate Master.csv"
+vendor_file = invoice_path(os.path.join(BASE_DIR, "Vendor data.csv"))
+mtow_master_file = os.path.join(BASE_DIR, "MTOW Master.csv")
+rate_master_file = os.path.join(BASE_DIR, "Rate Master.csv")
 
 # Read files
+stage('load')
 print("Loading files...")
 df_vendor = pd.read_csv(vendor_file)
-df_mtow_master = pd.read_csv(mtow_master_file)
-df_rate_master = pd.read_csv(rate_master_file)
+df_mtow_master = load_master(mtow_master_file)
+df_rate_master = load_master(rate_master_file)
 
 print(f"Vendor data loaded: {len(df_vendor)} records")
 print(f"MTOW Master loaded: {len(df_mtow_master)} aircraft")
@@ -22,22 +40,8 @@ print(f"Rate Master loaded: {len(df_rate_master)} rate entries")
 df_vendor.columns = df_vendor.columns.str.strip()
 print(f"\nVendor columns: {list(df_vendor.columns)}")
 
-# Create working dataframe
-df_working = df_vendor.copy()
-
-# Helper function to extract numeric values
-def extract_numeric_value(val):
-    """Extract first numeric value from a cell, handling various formats"""
-    if pd.isna(val):
-        return np.nan
-    val_str = str(val).strip().replace('\n', ' ').replace('\r', ' ')
-    match = re.search(r'(\d+\.?\d*)', val_str)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            return np.nan
-    return np.nan
+# Create working dataframe (shares the vendor columns, see overflight.frames)
+df_working = working_frame(df_vendor)
 
 # Helper function to extract aircraft registration
 def extract_aircraft_reg(flight_info):
@@ -78,43 +82,31 @@ def extract_mtow_from_flight(flight_info):
 df_working['Aircraft_Type'] = df_working.iloc[:, 2].apply(extract_mtow_from_flight)
 
 # Lookup MTOW from master file using registration
+stage('lookup', rows=len(df_working))
 print("\nLooking up MTOW from master file...")
 
-def get_mtow_from_master(reg):
-    """Get MTOW from master file using aircraft registration"""
-    if pd.isna(reg) or reg is None:
-        return np.nan
-    matches = df_mtow_master[df_mtow_master['Aircraft'].str.strip() == str(reg).strip()]
-    if len(matches) > 0:
-        return matches.iloc[0]['MTOW_in_KGs']
-    return np.nan
+mtow_index = build_registration_index(df_mtow_master)
 
-df_working['MTOW_numeric'] = df_working['Aircraft_Reg'].apply(get_mtow_from_master)
+df_working['MTOW_numeric'] = lookup_mtow(df_working['Aircraft_Reg'], mtow_index)
 
 # Extract distance
-distance_col = None
-for col in df_working.columns:
-    if 'DIST' in col.upper() or 'KM' in col.upper():
-        distance_col = col
-        break
+stage('load', rows=len(df_working))
+vendor_columns = resolve_columns(df_vendor, 'EGYPT')  # worked out once per header layout
+distance_col = vendor_columns['distance']
 
 if distance_col:
     print(f"Distance column identified: {distance_col}")
-    df_working['Distance_numeric'] = df_working[distance_col].apply(extract_numeric_value)
+    df_working['Distance_numeric'] = extract_numeric_column(df_working[distance_col], station='EGYPT', label='distance')
 else:
     print("WARNING: Distance column not found, attempting to extract from first numeric column")
-    df_working['Distance_numeric'] = df_working.iloc[:, -3].apply(extract_numeric_value)
+    df_working['Distance_numeric'] = extract_numeric_column(df_working.iloc[:, -3], station='EGYPT', label='distance')
 
 # Extract vendor charge - looking for currency values
-vendor_charge_col = None
-for col in df_working.columns:
-    if 'CHARGE' in col.upper() or 'COST' in col.upper() or 'PRICE' in col.upper():
-        vendor_charge_col = col
-        break
+vendor_charge_col = vendor_columns['charge']
 
 if vendor_charge_col:
     print(f"Vendor charge column identified: {vendor_charge_col}")
-    df_working['Vendor_Charge'] = df_working[vendor_charge_col].apply(extract_numeric_value)
+    df_working['Vendor_Charge'] = extract_numeric_column(df_working[vendor_charge_col], station='EGYPT', label='vendor charge')
 else:
     print("WARNING: Vendor charge column not found")
     df_working['Vendor_Charge'] = np.nan
@@ -125,30 +117,26 @@ print(f"  Records with valid Distance: {df_working['Distance_numeric'].notna().s
 print(f"  Records with valid Vendor Charge: {df_working['Vendor_Charge'].notna().sum()}/{len(df_working)}")
 
 # CALCULATION WORKFLOW
+stage('compute', rows=len(df_working))
 print("\n" + "="*80)
 print("CALCULATION WORKFLOW")
 print("="*80)
 
 # Step 1: Calculate Weight Factor = SQRT(MTOW) / 50
 print("\nStep 1: Calculate Weight Factor = SQRT(MTOW) / 50")
-df_working['Weight_Factor'] = (np.sqrt(df_working['MTOW_numeric']) / 50).round(6)
-
 # Step 2: Calculate Distance Factor = Distance / 100
 print("Step 2: Calculate Distance Factor = Distance / 100")
-df_working['Distance_Factor'] = (df_working['Distance_numeric'] / 100).round(4)
-
 # Step 3: Apply constant Unit Rate = 21.38
 print("Step 3: Apply constant Unit Rate = 21.38")
-UNIT_RATE = 21.38
-df_working['Unit_Rate'] = UNIT_RATE
-
+formula = compile_formula('EGYPT', rate_master=df_rate_master)
+UNIT_RATE = formula['constants']['unit_rate']
 # Step 4: Calculate Final Charges = Unit Rate * Distance Factor * Weight Factor
 print("Step 4: Calculate Final Charges = Unit Rate * Distance Factor * Weight Factor")
-df_working['Calculated_Charge'] = (
-    df_working['Unit_Rate'] * 
-    df_working['Distance_Factor'] * 
-    df_working['Weight_Factor']
-).round(2)
+charges = evaluate_formula(formula, mtow=df_working['MTOW_numeric'], distance=df_working['Distance_numeric'])
+df_working['Weight_Factor'] = charges['weight_factor']
+df_working['Distance_Factor'] = charges['distance_factor']
+df_working['Unit_Rate'] = UNIT_RATE
+df_working['Calculated_Charge'] = charges['charge']
 
 print("\nFormula Verification (Sample Calculation):")
 if len(df_working[df_working['Calculated_Charge'].notna()]) > 0:
@@ -161,37 +149,26 @@ if len(df_working[df_working['Calculated_Charge'].notna()]) > 0:
     print(f"  Final Charge: {UNIT_RATE} × {sample['Distance_Factor']:.4f} × {sample['Weight_Factor']:.6f} = {sample['Calculated_Charge']:.2f}")
 
 # VERIFICATION
+stage('compare', rows=len(df_working))
 print("\n" + "="*80)
 print("CHARGE VERIFICATION")
 print("="*80)
 
 # Compare calculated vs vendor charges with tolerance
-tolerance = 0.01
-
-def check_match(calculated, vendor):
-    """Check if calculated charge matches vendor charge within tolerance"""
-    if pd.isna(calculated) or pd.isna(vendor):
-        return "Not Matched"
-    diff = abs(calculated - vendor)
-    if diff <= tolerance:
-        return "Matched"
-    else:
-        return "Not Matched"
-
-df_working['Difference'] = abs(df_working['Calculated_Charge'] - df_working['Vendor_Charge'])
-df_working['Status'] = df_working.apply(
-    lambda row: check_match(row['Calculated_Charge'], row['Vendor_Charge']),
-    axis=1
+df_working['Difference'], df_working['Status'] = compare_charges(
+    df_working['Calculated_Charge'], df_working['Vendor_Charge'], station='EGYPT'
 )
 
 # Summary statistics
 matched_count = (df_working['Status'] == 'Matched').sum()
 not_matched_count = (df_working['Status'] == 'Not Matched').sum()
+missing_count = (df_working['Status'] == 'Missing Input').sum()
 total_records = len(df_working)
 success_rate = (matched_count / total_records) * 100 if total_records > 0 else 0
 
 print(f"\n[MATCHED]     {matched_count}")
 print(f"[NOT MATCHED] {not_matched_count}")
+print(f"[MISSING INPUT] {missing_count}")
 print(f"Total Records: {total_records}")
 print(f"Success Rate:  {success_rate:.1f}%")
 
@@ -214,21 +191,21 @@ if len(matched_data) > 0:
 
 # Detailed verification results
 print("\n" + "="*80)
-print("DETAILED VERIFICATION RESULTS (First 20 rows):")
+print("DETAILED VERIFICATION RESULTS:")
 print("="*80)
 display_cols = ['Aircraft_Reg', 'MTOW_numeric', 'Distance_numeric', 'Weight_Factor', 
                 'Distance_Factor', 'Unit_Rate', 'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status']
-print(df_working[display_cols].head(20).to_string())
+preview(df_working, display_cols)
 
 # Mismatch analysis
-mismatches = df_working[df_working['Status'] == 'Not Matched'].copy()
+mismatches = df_working[df_working['Status'] == 'Not Matched']
 if len(mismatches) > 0:
-    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()].copy()
+    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()]
     if len(valid_mismatches) > 0:
         print(f"\n[FOUND {len(valid_mismatches)} MISMATCHES]")
-        print(f"\nMismatch Details (first 15):")
-        print(valid_mismatches[['Aircraft_Reg', 'MTOW_numeric', 'Distance_numeric', 
-                                'Calculated_Charge', 'Vendor_Charge', 'Difference']].head(15).to_string())
+        print(f"\nMismatch Details:")
+        list_mismatches(valid_mismatches, ['Aircraft_Reg', 'MTOW_numeric', 'Distance_numeric', 
+                                           'Calculated_Charge', 'Vendor_Charge', 'Difference'])
         
         print(f"\nDifference Analysis (valid mismatches):")
         print(f"  Total valid mismatches: {len(valid_mismatches)}")
@@ -246,11 +223,15 @@ if len(mismatches) > 0:
                 print(f"  Difference {low:>4} - {high:>5}: {count:>4} records")
 
 # Save results
-output_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\EGYPT\Vendor_Data_Verified.csv"
+stage('write', rows=len(df_working))
+output_file = output_path(os.path.join(BASE_DIR, "Vendor_Data_Verified.csv"))
 output_cols = ['Aircraft_Reg', 'MTOW_numeric', 'Distance_numeric', 'Weight_Factor', 
                'Distance_Factor', 'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status']
-df_output = df_working[output_cols].copy()
+df_output = df_working[output_cols]
 df_output.to_csv(output_file, index=False)
+record_results('EGYPT', df_output, vendor_file)
 
 print(f"\n\nResults saved to: {os.path.abspath(output_file)}")
 print("="*80)
+
+result_line('EGYPT', df_output['Status'], os.path.abspath(output_file))
@@ -1,44 +1,56 @@
 import pandas as pd
 import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.formulas import compile_formula, evaluate_formula
+from overflight.incremental import RowCache, fingerprint_rows
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import record_results
+
+configure_report()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Read the CSV file
-csv_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\IKA\1900357153.csv"
+stage('load')
+csv_file = invoice_path(os.path.join(BASE_DIR, "1900357153.csv"))
 df = pd.read_csv(csv_file)
 
 print(f"Total rows in file: {len(df)}")
 print("\n" + "="*100)
 
-# Define constants
-UNIT_RATE = 0.00286
-ADDITIONAL_CHARGE = 0.18
-MTOW_THRESHOLD = 150
-NM_TO_KM = 1.852
-
-# Create a working copy
-result_df = df.copy()
+# Create a working copy of the rows that are new or changed since the last run
+# (a re-issued invoice only re-verifies its corrected lines)
+row_cache = RowCache('IKA', csv_file, [__file__])
+fingerprints = fingerprint_rows(df, ['MTOW', 'Distance(NM)', 'Charge'])
+todo = row_cache.todo(fingerprints)
+row_cache.report(todo)
+result_df = working_frame(df, todo)
 
 # Step 1: Convert Distance from Nautical Miles to KMs
-result_df['DISTANCE_KM'] = result_df['Distance(NM)'] * NM_TO_KM
-
+stage('compute', rows=len(result_df))
 # Step 2: Calculate Final Unit Rate based on MTOW
 # If MTOW > 150: Final_unit_rate = (MTOW * 0.00286) + 0.18
 # Otherwise: Final_unit_rate = MTOW * 0.00286
-result_df['FINAL_UNIT_RATE'] = result_df['MTOW'].apply(
-    lambda mtow: (mtow * UNIT_RATE) + ADDITIONAL_CHARGE if mtow > MTOW_THRESHOLD else mtow * UNIT_RATE
-)
-
-# Step 3: Calculate Charges
-result_df['CALCULATED_CHARGE'] = result_df['FINAL_UNIT_RATE'] * result_df['DISTANCE_KM']
-
-# Round to 2 decimal places for comparison
-result_df['CALCULATED_CHARGE'] = result_df['CALCULATED_CHARGE'].round(2)
+# Step 3: Calculate Charges, rounded to 2 decimal places for comparison
+charges = evaluate_formula(compile_formula('IKA'), distance_nm=result_df['Distance(NM)'], mtow=result_df['MTOW'])
+result_df['DISTANCE_KM'] = charges['distance_km']
+result_df['FINAL_UNIT_RATE'] = charges['final_unit_rate']
+result_df['CALCULATED_CHARGE'] = charges['charge']
 
 # Step 4: Compare with existing Charge column
-tolerance = 0.01
-result_df['VERIFICATION_STATUS'] = result_df.apply(
-    lambda row: 'Matched' if abs(row['Charge'] - row['CALCULATED_CHARGE']) <= tolerance else 'Not Matched',
-    axis=1
-)
+stage('compare', rows=len(result_df))
+_, result_df['VERIFICATION_STATUS'] = compare_charges(result_df['CALCULATED_CHARGE'], result_df['Charge'], station='IKA')
+
+# Add back the unchanged rows verified in earlier runs
+result_df = row_cache.merge(df, fingerprints, result_df)
+row_cache.save(fingerprints, result_df)
 
 # Create output dataframe with relevant columns
 output_df = result_df[['No.', 'Type', 'MTOW', 'Flight No.', 'REG', 'Distance(NM)', 'DISTANCE_KM', 
@@ -49,31 +61,34 @@ print("\nVERIFICATION SUMMARY")
 print("="*100)
 matched = (output_df['VERIFICATION_STATUS'] == 'Matched').sum()
 not_matched = (output_df['VERIFICATION_STATUS'] == 'Not Matched').sum()
+missing = (output_df['VERIFICATION_STATUS'] == 'Missing Input').sum()
 
 print(f"Matched:     {matched}")
 print(f"Not Matched: {not_matched}")
+print(f"Missing Input: {missing}")
 print(f"Total:       {len(output_df)}")
 print("\n" + "="*100)
 
 # Display detailed results
 print("\nDETAILED VERIFICATION RESULTS:")
 print("="*100)
-pd.set_option('display.max_rows', None)
-pd.set_option('display.max_columns', None)
-pd.set_option('display.width', None)
-print(output_df.to_string(index=False))
+preview(output_df, index=False)
 
 # Save the results to a new CSV file
-output_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\IKA\1900357153_Verified.csv"
+stage('write', rows=len(output_df))
+output_file = output_path(os.path.join(BASE_DIR, "1900357153_Verified.csv"))
 output_df.to_csv(output_file, index=False)
+record_results('IKA', output_df.assign(Flight_Date=result_df.get('Flight Date')), csv_file)
 print(f"\n\nResults saved to: {output_file}")
 
 # Display mismatches if any
 print("\n" + "="*100)
-if not_matched > 0:
-    print(f"\n⚠️  FOUND {not_matched} MISMATCHES:")
+if not_matched + missing > 0:
+    print(f"\n⚠️  FOUND {not_matched} MISMATCHES, {missing} MISSING INPUT:")
     print("="*100)
-    mismatches = output_df[output_df['VERIFICATION_STATUS'] == 'Not Matched']
-    print(mismatches.to_string(index=False))
+    mismatches = output_df[output_df['VERIFICATION_STATUS'] != 'Matched']
+    list_mismatches(mismatches, index=False)
 else:
     print("\n✓ All charges matched successfully!")
+
+result_line('IKA', output_df['VERIFICATION_STATUS'], output_file)
@@ -1,10 +1,24 @@
 import pandas as pd
-import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.parsing import extract_numeric_column
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.distance import check_distance, distance_line
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, preview, result_line
+from overflight.results import record_results
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 def verify_jed_charges():
     # 1. Load Data
+    stage('load')
     print("Loading files...")
-    vendor_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\JED\Vendor Master.csv"
+    vendor_file = invoice_path(os.path.join(BASE_DIR, "Vendor Master.csv"))
 
     df_vendor = pd.read_csv(vendor_file)
 
@@ -12,7 +26,7 @@ def verify_jed_charges():
     df_vendor.columns = df_vendor.columns.str.replace('\n', ' ').str.strip()
 
     # 2. Prepare Data
-    df_working = df_vendor.copy()
+    df_working = working_frame(df_vendor)
 
     # Convert required columns to numeric
     df_working['Weight Factor'] = pd.to_numeric(df_working['Weight Factor'], errors='coerce')
@@ -20,37 +34,46 @@ def verify_jed_charges():
     df_working['En-Route Charge'] = pd.to_numeric(df_working['En-Route Charge'], errors='coerce')
 
     # 3. Calculate Charge
+    stage('compute', rows=len(df_working))
     UNIT_RATE = 118.0
 
-    def calculate_formula(row):
-        if pd.isna(row['Weight Factor']) or pd.isna(row['Distance Factor']):
-            return np.nan
-        charge = row['Weight Factor'] * row['Distance Factor'] * UNIT_RATE
-        return round(charge, 2)
-
-    df_working['Calculated_Charge'] = df_working.apply(calculate_formula, axis=1)
+    # Weight Factor x Distance Factor x Unit Rate over whole columns (NaN where a factor is missing),
+    # rounded per value as before: Python's round keeps the vendor's half-cent results
+    charge = df_working['Weight Factor'] * df_working['Distance Factor'] * UNIT_RATE
+    df_working['Calculated_Charge'] = charge.map(lambda value: round(value, 2))
 
     # 4. Compare with Vendor En-Route Charge
+    stage('compare', rows=len(df_working))
     df_working['Vendor_Charge'] = df_working['En-Route Charge']
 
-    df_working['Status'] = np.where(
-        abs(df_working['Calculated_Charge'] - df_working['Vendor_Charge']) <= 0.5,
-        'Matched',
-        'Not Matched'
+    _, df_working['Status'] = compare_charges(
+        df_working['Calculated_Charge'], df_working['Vendor_Charge'], station='JED'
     )
 
+    # Cross-check the billed distance against the great-circle distance of the route (see overflight.distance)
+    billed_km = extract_numeric_column(df_working['Distance Km'], station='JED')
+    checked = check_distance(df_working['Origin Code'], df_working['Dest. Code'], billed_km,
+                             unit='km', station='JED')
+    df_working['GC_Distance_km'] = checked['GC_Distance_km']
+    df_working['Distance_Flag'] = checked['Distance_Flag']
+    distance_line(checked, station='JED')
+
     # 5. Save Output
+    stage('write', rows=len(df_working))
     output_cols = [
         'Invoice No', 'Flight Number', 'Aircraft ID', 'Origin Code', 'Dest. Code',
         'Weight Factor', 'Distance Factor',
-        'Calculated_Charge', 'Vendor_Charge', 'Status'
+        'Calculated_Charge', 'Vendor_Charge', 'Status', 'GC_Distance_km', 'Distance_Flag'
     ]
 
-    output_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\JED\Vendor_Data_Verified.csv"
+    output_file = output_path(os.path.join(BASE_DIR, "Vendor_Data_Verified.csv"))
     df_working[output_cols].to_csv(output_file, index=False)
+    record_results('JED', df_working[output_cols].assign(Flight_Date=df_working.get('Date')), vendor_file)
 
     print(f"Verification Complete. Results saved to {output_file}")
-    print(df_working[output_cols].head())
+    preview(df_working, output_cols)
+    result_line('JED', df_working['Status'], output_file)
 
 if __name__ == "__main__":
+    configure_report()
     verify_jed_charges()
@@ -1,47 +1,46 @@
 import pandas as pd
 import numpy as np
 import os
-import re
-import glob
-
-# File paths - detect files automatically
-vendor_files = glob.glob("*.csv")
-mtow_master = r"c:\Users\Anurag\Downloads\Assignment\Assignment\KAZ\MTOW Master.csv"
-rate_master = r"c:\Users\Anurag\Downloads\Assignment\Assignment\KAZ\Rate Master.csv"
-vendor_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\KAZ\Vendor Data.csv"
-
-# Identify files
-for f in vendor_files:
-    f_lower = f.lower()
-    if 'mtow' in f_lower and 'master' in f_lower:
-        mtow_master_file = f
-    elif 'rate' in f_lower and 'master' in f_lower:
-        rate_master_file = f
-    elif 'vendor' in f_lower and 'master' in f_lower:
-        vendor_file = f
-
-# If vendor master not found, use the remaining CSV file
-if vendor_file is None and len(vendor_files) >= 3:
-    for f in vendor_files:
-        f_lower = f.lower()
-        if 'mtow' not in f_lower and 'rate' not in f_lower:
-            vendor_file = f
-            break
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.mtow import build_registration_index, lookup_mtow
+from overflight.rates import compile_rate_bands, resolve_rate_bands
+from overflight.parsing import extract_numeric_column
+from overflight.store import load_master
+from overflight.manifest import load_manifest, station_file
+from overflight.columns import resolve_columns
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.distance import check_distance, distance_line
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import record_results
+
+configure_report()
+
+# File paths - by role, from the cached manifest of this folder
+manifest = load_manifest(os.path.dirname(os.path.abspath(__file__)))
+vendor_file = invoice_path() or station_file(manifest, 'vendor')
+mtow_master_file = station_file(manifest, 'fleet')
+rate_master_file = station_file(manifest, 'rates')
 
 print(f"Detected files:")
-print(f"  Vendor: {vendor_file}")
-print(f"  MTOW Master: {mtow_master_file}")
-print(f"  Rate Master: {rate_master_file}")
+print(f"  Vendor: {vendor_file and os.path.basename(vendor_file)}")
+print(f"  MTOW Master: {mtow_master_file and os.path.basename(mtow_master_file)}")
+print(f"  Rate Master: {rate_master_file and os.path.basename(rate_master_file)}")
 
 if not all([vendor_file, mtow_master_file, rate_master_file]):
     print("ERROR: Could not detect all required files")
     exit(1)
 
 # Read files
+stage('load')
 print("\nLoading files...")
 df_vendor = pd.read_csv(vendor_file)
-df_mtow_master = pd.read_csv(mtow_master_file)
-df_rate_master = pd.read_csv(rate_master_file)
+df_mtow_master = load_master(mtow_master_file)
+df_rate_master = load_master(rate_master_file)
 
 print(f"Vendor data loaded: {len(df_vendor)} records")
 print(f"MTOW Master loaded: {len(df_mtow_master)} aircraft")
@@ -54,44 +53,18 @@ df_rate_master.columns = df_rate_master.columns.str.strip()
 
 print(f"\nVendor columns: {list(df_vendor.columns)}")
 
-# Create working dataframe
-df_working = df_vendor.copy()
-
-# Helper function to extract numeric values
-def extract_numeric_value(val):
-    """Extract numeric value from a cell, handling currency formats"""
-    if pd.isna(val):
-        return np.nan
-    val_str = str(val).strip().replace('\n', ' ').replace('\r', ' ')
-    # Remove currency symbols and commas
-    val_str = val_str.replace('$', '').replace(',', '').replace('USD', '')
-    match = re.search(r'(\d+\.?\d*)', val_str)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            return np.nan
-    return np.nan
+# Create working dataframe (shares the vendor columns, see overflight.frames)
+df_working = working_frame(df_vendor)
 
 print("\n" + "="*100)
 print("STEP 1: DATA EXTRACTION AND MTOW LOOKUP")
 print("="*100)
 
+# Vendor column roles (worked out once per header layout, see overflight.columns)
+vendor_columns = resolve_columns(df_working, 'KAZ')
+
 # Find registration column
-reg_col = None
-for col in df_working.columns:
-    col_lower = col.lower()
-    if 'reg' in col_lower and 'no' in col_lower:
-        reg_col = col
-        break
-
-if reg_col is None:
-    # Try alternate patterns
-    for col in df_working.columns:
-        col_lower = col.lower()
-        if 'reg' in col_lower or 'aircraft' in col_lower:
-            reg_col = col
-            break
+reg_col = vendor_columns['registration']
 
 print(f"Registration column: {reg_col}")
 
@@ -102,33 +75,17 @@ else:
     df_working['Aircraft_Reg'] = None
 
 # Find MTOW column in vendor file
-mtow_col = None
-for col in df_working.columns:
-    col_lower = col.lower()
-    if 'mtow' in col_lower:
-        mtow_col = col
-        break
+mtow_col = vendor_columns['mtow']
 
 if mtow_col:
-    df_working['MTOW_vendor'] = df_working[mtow_col].apply(extract_numeric_value)
+    df_working['MTOW_vendor'] = extract_numeric_column(df_working[mtow_col], station='KAZ', label='vendor MTOW')
 else:
     df_working['MTOW_vendor'] = np.nan
 
-# If vendor MTOW is missing, lookup from master (in kg, needs conversion)
-def get_mtow(reg, vendor_mtow):
-    """Get MTOW in tonnes - prefer vendor data, fallback to master"""
-    if pd.notna(vendor_mtow):
-        return vendor_mtow
-    # Lookup from master (returns kg, convert to tonnes)
-    if pd.isna(reg) or reg is None:
-        return np.nan
-    matches = df_mtow_master[df_mtow_master['Aircraft'].str.strip() == str(reg).strip()]
-    if len(matches) > 0:
-        mtow_kg = matches.iloc[0]['MTOW_in_KGs']
-        return mtow_kg / 1000.0  # Convert kg to tonnes
-    return np.nan
-
-df_working['MTOW'] = df_working.apply(lambda row: get_mtow(row['Aircraft_Reg'], row['MTOW_vendor']), axis=1)
+# If vendor MTOW is missing, lookup from master (in kg, convert to tonnes)
+stage('lookup', rows=len(df_working))
+mtow_index = build_registration_index(df_mtow_master)
+df_working['MTOW'] = df_working['MTOW_vendor'].fillna(lookup_mtow(df_working['Aircraft_Reg'], mtow_index) / 1000.0)
 
 print(f"\nMTOW Lookup Results:")
 print(f"  From vendor: {df_working['MTOW_vendor'].notna().sum()}")
@@ -136,40 +93,23 @@ print(f"  From master (converted kg->tonnes): {(df_working['MTOW'].notna() & df_
 print(f"  Total successfully obtained: {df_working['MTOW'].notna().sum()}/{len(df_working)}")
 
 # Find vendor charge column
-charge_col = None
-for col in df_working.columns:
-    col_lower = col.lower()
-    if any(term in col_lower for term in ['charge', 'cost', 'amount', 'total']):
-        if 'holiday' not in col_lower and 'ot' not in col_lower and 'vat' not in col_lower:
-            charge_col = col
-            break
-
-if charge_col is None:
-    # Use last numeric column if not found
-    for col in reversed(df_working.columns):
-        if df_working[col].dtype in ['float64', 'int64']:
-            charge_col = col
-            break
+stage('load', rows=len(df_working))
+charge_col = vendor_columns['charge']
 
 print(f"Vendor charge column: {charge_col}")
 
 if charge_col:
-    df_working['Vendor_Charge'] = df_working[charge_col].apply(extract_numeric_value)
+    df_working['Vendor_Charge'] = extract_numeric_column(df_working[charge_col], station='KAZ', label='vendor charge')
 else:
     df_working['Vendor_Charge'] = np.nan
 
 print(f"  Valid vendor charges: {df_working['Vendor_Charge'].notna().sum()}/{len(df_working)}")
 
 # Extract distance
-distance_col = None
-for col in df_working.columns:
-    col_lower = col.lower()
-    if col_lower == 'dist' or ('distance' in col_lower and 'km' in col_lower):
-        distance_col = col
-        break
+distance_col = vendor_columns['distance']
 
 if distance_col:
-    df_working['Distance_km'] = df_working[distance_col].apply(extract_numeric_value)
+    df_working['Distance_km'] = extract_numeric_column(df_working[distance_col], station='KAZ', label='distance')
 else:
     print("WARNING: Could not find distance column")
     df_working['Distance_km'] = np.nan
@@ -177,6 +117,7 @@ else:
 print(f"  Valid distances: {df_working['Distance_km'].notna().sum()}/{len(df_working)}")
 
 # STEP 2: RATE MASTER LOOKUP
+stage('lookup', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 2: RATE LOOKUP FROM RATE MASTER")
 print("="*100)
@@ -192,55 +133,25 @@ for col in df_rate_master.columns:
         charge_rate_col = col
 
 if mtow_col and charge_rate_col:
-    for idx, row in df_rate_master.iterrows():
-        print(f"  MTOW {row[mtow_col]:<15} -> Charge {row[charge_rate_col]}")
-
-# Lookup charge based on MTOW
-def get_unit_rate(mtow):
-    """Get unit rate from rate master based on MTOW (tonnes - no conversion needed)"""
-    if pd.isna(mtow):
-        return np.nan
-    
-    try:
-        mtow = float(mtow)
-    except (ValueError, TypeError):
-        return np.nan
-    
-    # Find numeric columns in rate master
-    numeric_cols = df_rate_master.select_dtypes(include=[np.number]).columns
-    
-    if len(numeric_cols) < 2:
-        return np.nan
-    
-    # First numeric column is usually MTOW, second is Rate
-    mtow_col = numeric_cols[0]
-    rate_col = numeric_cols[1]
-    
-    # MTOW from vendor is already in tonnes, use directly
-    # Try exact match
-    matching_rates = df_rate_master[df_rate_master[mtow_col] == mtow]
-    if len(matching_rates) > 0:
-        return matching_rates.iloc[0][rate_col]
-    
-    # Try closest match
-    rate_copy = df_rate_master.copy()
-    rate_copy[mtow_col] = pd.to_numeric(rate_copy[mtow_col], errors='coerce')
-    rate_copy = rate_copy[rate_copy[mtow_col].notna()]
-    
-    if len(rate_copy) == 0:
-        return np.nan
-    
-    rate_copy['MTOW_diff'] = abs(rate_copy[mtow_col] - mtow)
-    best_match = rate_copy.loc[rate_copy['MTOW_diff'].idxmin()]
-    
-    return best_match[rate_col]
-
-df_working['Unit_Rate'] = df_working['MTOW'].apply(get_unit_rate)
+    preview(df_rate_master, [mtow_col, charge_rate_col], index=False)
+
+# Compile the rate master once (first numeric column is usually MTOW, second is Rate)
+rate_numeric_cols = df_rate_master.select_dtypes(include=[np.number]).columns
+if len(rate_numeric_cols) >= 2:
+    rate_bands = compile_rate_bands(df_rate_master, rate_numeric_cols[0], rate_numeric_cols[1])
+    rate_match = resolve_rate_bands(df_working['MTOW'], rate_bands, match='nearest')
+    df_working['Unit_Rate'] = rate_match[rate_numeric_cols[1]]
+    no_band = (df_working['MTOW'].notna() & rate_match['Band_MTOW'].isna()).sum()
+else:
+    df_working['Unit_Rate'] = np.nan
+    no_band = df_working['MTOW'].notna().sum()
 
 print(f"\nUnit Rate Lookup Results:")
 print(f"  Successfully mapped: {df_working['Unit_Rate'].notna().sum()}/{len(df_working)}")
+print(f"  No rate band: {no_band}")
 
 # STEP 3: CHARGE CALCULATION
+stage('compute', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 3: CHARGE CALCULATION: (Distance/100) * Rate")
 print("="*100)
@@ -252,38 +163,42 @@ print(f"\nCharge Calculation Results:")
 print(f"  Successfully calculated: {df_working['Calculated_Charge'].notna().sum()}/{len(df_working)}")
 
 # STEP 4: VERIFICATION
+stage('compare', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 4: CHARGE VERIFICATION")
 print("="*100)
 
-tolerance = 0.01
-
-def check_match(calculated, vendor):
-    """Check if calculated charge matches vendor charge within tolerance"""
-    if pd.isna(calculated) or pd.isna(vendor):
-        return "Not Matched"
-    diff = abs(calculated - vendor)
-    if diff <= tolerance:
-        return "Matched"
-    else:
-        return "Not Matched"
-
-df_working['Difference'] = abs(df_working['Calculated_Charge'] - df_working['Vendor_Charge'])
-df_working['Status'] = df_working.apply(
-    lambda row: check_match(row['Calculated_Charge'], row['Vendor_Charge']),
-    axis=1
+df_working['Difference'], df_working['Status'] = compare_charges(
+    df_working['Calculated_Charge'], df_working['Vendor_Charge'], station='KAZ'
 )
 
+# Cross-check the billed distance against the great-circle distance of the route (see overflight.distance)
+origin_col, destination_col = vendor_columns['origin'], vendor_columns['destination']
+if origin_col and destination_col:
+    checked = check_distance(df_working[origin_col], df_working[destination_col],
+                             df_working['Distance_km'], unit='km', station='KAZ')
+    df_working['GC_Distance_km'] = checked['GC_Distance_km']
+    df_working['Distance_Flag'] = checked['Distance_Flag']
+else:
+    print("WARNING: Could not find origin/destination columns, distance check skipped")
+    checked = None
+    df_working['GC_Distance_km'] = np.nan
+    df_working['Distance_Flag'] = False
+
 # Summary
 matched_count = (df_working['Status'] == 'Matched').sum()
 not_matched_count = (df_working['Status'] == 'Not Matched').sum()
+missing_count = (df_working['Status'] == 'Missing Input').sum()
 total_records = len(df_working)
 success_rate = (matched_count / total_records) * 100 if total_records > 0 else 0
 
 print(f"\n[MATCHED]     {matched_count}")
 print(f"[NOT MATCHED] {not_matched_count}")
+print(f"[MISSING INPUT] {missing_count}")
 print(f"Total Records: {total_records}")
 print(f"Success Rate:  {success_rate:.1f}%")
+if checked is not None:
+    distance_line(checked, station='KAZ')
 
 print("\nData Quality:")
 print(f"- Records with valid MTOW: {df_working['MTOW'].notna().sum()}/{total_records} ({(df_working['MTOW'].notna().sum()/total_records)*100:.1f}%)")
@@ -302,20 +217,20 @@ if len(matched_data) > 0:
 
 # Detailed results (first 20)
 print("\n" + "="*100)
-print("DETAILED VERIFICATION RESULTS (First 20 rows):")
+print("DETAILED VERIFICATION RESULTS:")
 print("="*100)
 display_cols = [col for col in ['Aircraft_Reg', 'Distance_km', 'Unit_Rate', 'MTOW', 'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status'] 
                 if col in df_working.columns]
-print(df_working[display_cols].head(20).to_string())
+preview(df_working, display_cols)
 
 # Mismatch analysis
-mismatches = df_working[df_working['Status'] == 'Not Matched'].copy()
+mismatches = df_working[df_working['Status'] == 'Not Matched']
 if len(mismatches) > 0:
-    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()].copy()
+    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()]
     if len(valid_mismatches) > 0:
         print(f"\n[FOUND {len(valid_mismatches)} MISMATCHES]")
-        print(f"\nMismatch Details (first 15):")
-        print(valid_mismatches[display_cols].head(15).to_string())
+        print(f"\nMismatch Details:")
+        list_mismatches(valid_mismatches, display_cols)
         
         print(f"\nDifference Analysis (valid mismatches):")
         print(f"  Total valid mismatches: {len(valid_mismatches)}")
@@ -325,11 +240,15 @@ if len(mismatches) > 0:
         print(f"  Total vendor difference: ${valid_mismatches['Vendor_Charge'].sum():.2f}")
 
 # Save results - only include records with valid vendor charges
-output_file = "Verification_Results.csv"
+stage('write', rows=len(df_working))
+output_file = output_path("Verification_Results.csv")
 # Filter to only rows with valid vendor charge data
-df_output = df_working[df_working['Vendor_Charge'].notna()][display_cols].copy()
+df_output = df_working[df_working['Vendor_Charge'].notna()][display_cols + ['GC_Distance_km', 'Distance_Flag']]
 df_output.to_csv(output_file, index=False)
+record_results('KAZ', df_output.assign(Flight_Date=df_working.get(vendor_columns['date'])), vendor_file)
 
 print(f"\n\nResults saved to: {os.path.abspath(output_file)}")
 print(f"Output contains {len(df_output)} records (filtered from {len(df_working)} total)")
 print("="*100)
+
+result_line('KAZ', df_output['Status'], os.path.abspath(output_file))
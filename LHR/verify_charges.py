@@ -1,32 +1,34 @@
 import pandas as pd
 import numpy as np
 import os
-import re
-import glob
+import sys
 
-# File paths - detect files automatically
-vendor_files = glob.glob("*.csv")
-vendor_file = None
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.parsing import extract_numeric_column
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import record_results
+from overflight.manifest import load_manifest, station_file
+from overflight.columns import resolve_columns
 
-# Look for specific vendor file first
-if os.path.exists("1900374945.csv"):
-    vendor_file = "1900374945.csv"
-else:
-    # Identify vendor file (should be the main data file, not master files)
-    for f in vendor_files:
-        f_lower = f.lower()
-        if 'mtow' not in f_lower and 'rate' not in f_lower:
-            vendor_file = f
-            break
+configure_report()
+
+# File paths - by role, from the cached manifest of this folder
+manifest = load_manifest(os.path.dirname(os.path.abspath(__file__)))
+vendor_file = invoice_path() or station_file(manifest, 'vendor')
 
 print(f"Detected files:")
-print(f"  Vendor: {vendor_file}")
+print(f"  Vendor: {vendor_file and os.path.basename(vendor_file)}")
 
 if not vendor_file:
     print("ERROR: Could not detect vendor file")
     exit(1)
 
 # Read files
+stage('load')
 print("\nLoading files...")
 df_vendor = pd.read_csv(vendor_file)
 
@@ -37,24 +39,8 @@ df_vendor.columns = df_vendor.columns.str.replace('\xa0', ' ').str.strip()
 
 print(f"\nVendor columns: {list(df_vendor.columns)}")
 
-# Create working dataframe
-df_working = df_vendor.copy()
-
-# Helper function to extract numeric values
-def extract_numeric_value(val):
-    """Extract numeric value from a cell, handling currency formats"""
-    if pd.isna(val):
-        return np.nan
-    val_str = str(val).strip().replace('\n', ' ').replace('\r', ' ')
-    # Remove currency symbols and commas
-    val_str = val_str.replace('$', '').replace(',', '').replace('USD', '')
-    match = re.search(r'(\d+\.?\d*)', val_str)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            return np.nan
-    return np.nan
+# Create working dataframe (shares the vendor columns, see overflight.frames)
+df_working = working_frame(df_vendor)
 
 print("\n" + "="*100)
 print("LHR CHARGE VERIFICATION - FLAT RATE SUM")
@@ -71,34 +57,27 @@ print(f"  Satellite Data Charge: {SATELLITE_DATA_CHARGE}")
 print(f"  Total Flat Rate = {FLAT_RATE}")
 print(f"\nFormula: Total Charge = NATS Charge + Satellite Data Charge")
 
+# Vendor column roles (worked out once per header layout, see overflight.columns)
+vendor_columns = resolve_columns(df_working, 'LHR')
+
 # Find Core NATS Charge column
-nats_col = None
-for col in df_working.columns:
-    col_lower = col.lower()
-    if 'nats' in col_lower and 'core' in col_lower:
-        nats_col = col
-        break
+nats_col = vendor_columns['nats_charge']
 
 print(f"\nCore NATS Charge column: {nats_col}")
 
 if nats_col:
-    df_working['NATS_Charge_Value'] = df_working[nats_col].apply(extract_numeric_value)
+    df_working['NATS_Charge_Value'] = extract_numeric_column(df_working[nats_col], station='LHR', label='NATS charge')
 else:
     print("ERROR: Could not find NATS charge column")
     df_working['NATS_Charge_Value'] = np.nan
 
 # Find Satellite Data Charge column
-sat_col = None
-for col in df_working.columns:
-    col_lower = col.lower()
-    if 'satellite' in col_lower and 'data' in col_lower:
-        sat_col = col
-        break
+sat_col = vendor_columns['satellite_charge']
 
 print(f"Satellite Data Charge column: {sat_col}")
 
 if sat_col:
-    df_working['Satellite_Charge_Value'] = df_working[sat_col].apply(extract_numeric_value)
+    df_working['Satellite_Charge_Value'] = extract_numeric_column(df_working[sat_col], station='LHR', label='satellite charge')
 else:
     print("ERROR: Could not find Satellite Data charge column")
     df_working['Satellite_Charge_Value'] = np.nan
@@ -107,23 +86,19 @@ print(f"  Valid NATS charges: {df_working['NATS_Charge_Value'].notna().sum()}/{l
 print(f"  Valid Satellite charges: {df_working['Satellite_Charge_Value'].notna().sum()}/{len(df_working)}")
 
 # Find vendor charge column (Total charge)
-charge_col = None
-for col in df_working.columns:
-    col_lower = col.lower()
-    if 'total' in col_lower and 'charge' in col_lower:
-        charge_col = col
-        break
+charge_col = vendor_columns['charge']
 
 print(f"Vendor charge column: {charge_col}")
 
 if charge_col:
-    df_working['Vendor_Charge'] = df_working[charge_col].apply(extract_numeric_value)
+    df_working['Vendor_Charge'] = extract_numeric_column(df_working[charge_col], station='LHR', label='vendor charge')
 else:
     df_working['Vendor_Charge'] = np.nan
 
 print(f"  Valid vendor charges: {df_working['Vendor_Charge'].notna().sum()}/{len(df_working)}")
 
 # STEP 2: CHARGE CALCULATION
+stage('compute', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 2: CHARGE CALCULATION")
 print("="*100)
@@ -146,36 +121,25 @@ print(f"\nCharge Calculation Results:")
 print(f"  Successfully calculated: {df_working['Calculated_Charge'].notna().sum()}/{len(df_working)}")
 
 # STEP 3: VERIFICATION
+stage('compare', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 3: CHARGE VERIFICATION")
 print("="*100)
 
-tolerance = 0.01
-
-def check_match(calculated, vendor):
-    """Check if calculated charge matches vendor charge within tolerance"""
-    if pd.isna(calculated) or pd.isna(vendor):
-        return "Not Matched"
-    diff = abs(calculated - vendor)
-    if diff <= tolerance:
-        return "Matched"
-    else:
-        return "Not Matched"
-
-df_working['Difference'] = abs(df_working['Calculated_Charge'] - df_working['Vendor_Charge'])
-df_working['Status'] = df_working.apply(
-    lambda row: check_match(row['Calculated_Charge'], row['Vendor_Charge']),
-    axis=1
+df_working['Difference'], df_working['Status'] = compare_charges(
+    df_working['Calculated_Charge'], df_working['Vendor_Charge'], station='LHR'
 )
 
 # Summary
 matched_count = (df_working['Status'] == 'Matched').sum()
 not_matched_count = (df_working['Status'] == 'Not Matched').sum()
+missing_count = (df_working['Status'] == 'Missing Input').sum()
 total_records = len(df_working)
 success_rate = (matched_count / total_records) * 100 if total_records > 0 else 0
 
 print(f"\n[MATCHED]     {matched_count}")
 print(f"[NOT MATCHED] {not_matched_count}")
+print(f"[MISSING INPUT] {missing_count}")
 print(f"Total Records: {total_records}")
 print(f"Success Rate:  {success_rate:.1f}%")
 
@@ -197,20 +161,20 @@ if len(matched_data) > 0:
 
 # Detailed results (first 20)
 print("\n" + "="*100)
-print("DETAILED VERIFICATION RESULTS (First 20 rows):")
+print("DETAILED VERIFICATION RESULTS:")
 print("="*100)
 display_cols = [col for col in ['NATS_Charge_Value', 'Satellite_Charge_Value', 'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status'] 
                 if col in df_working.columns]
-print(df_working[display_cols].head(20).to_string())
+preview(df_working, display_cols)
 
 # Mismatch analysis
-mismatches = df_working[df_working['Status'] == 'Not Matched'].copy()
+mismatches = df_working[df_working['Status'] == 'Not Matched']
 if len(mismatches) > 0:
-    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()].copy()
+    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()]
     if len(valid_mismatches) > 0:
         print(f"\n[FOUND {len(valid_mismatches)} MISMATCHES]")
-        print(f"\nMismatch Details (first 15):")
-        print(valid_mismatches[display_cols].head(15).to_string())
+        print(f"\nMismatch Details:")
+        list_mismatches(valid_mismatches, display_cols)
         
         print(f"\nDifference Analysis (valid mismatches):")
         print(f"  Total valid mismatches: {len(valid_mismatches)}")
@@ -220,9 +184,13 @@ if len(mismatches) > 0:
         print(f"  Total vendor difference: ${valid_mismatches['Vendor_Charge'].sum():.2f}")
 
 # Save results
-output_file = "Verification_Results.csv"
-df_output = df_working[display_cols].copy()
+stage('write', rows=len(df_working))
+output_file = output_path("Verification_Results.csv")
+df_output = df_working[display_cols]
 df_output.to_csv(output_file, index=False)
+record_results('LHR', df_output.assign(Flight_Date=df_working.get(vendor_columns['date'])), vendor_file)
 
 print(f"\n\nResults saved to: {os.path.abspath(output_file)}")
 print("="*100)
+
+result_line('LHR', df_output['Status'], os.path.abspath(output_file))
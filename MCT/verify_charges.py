@@ -1,212 +1,253 @@
 import pandas as pd
-import numpy as np
-import re
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.rates import compile_rate_bands, resolve_rate_bands
+from overflight.parsing import extract_numeric_column
+from overflight.streaming import (DEFAULT_CHUNK_SIZE, ChunkWriter, HeadCollector,
+                                  RunningStats, read_csv_chunks)
+from overflight.store import load_master
+from overflight.frames import working_frame
+from overflight.incremental import RowCache, fingerprint_rows
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.distance import (check_distance, distance_counts, distance_line,
+                                 distance_unit, location_code)
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import ResultsWriter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser(description="MCT airport charge verification")
+parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                    help=f"Vendor rows verified per chunk (default: {DEFAULT_CHUNK_SIZE})")
+args, _ = parser.parse_known_args()
+report = configure_report()
 
 # Read the main data file
-main_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\MCT\MDETLST-0320860591.csv"
-mtow_master_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\MCT\MTOW Master.xlsx - Sheet1.csv"
-rate_master_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\MCT\Rate Master.csv"
+main_file = invoice_path(os.path.join(BASE_DIR, "MDETLST-0320860591.csv"))
+mtow_master_file = os.path.join(BASE_DIR, "MTOW Master.xlsx - Sheet1.csv")
+rate_master_file = os.path.join(BASE_DIR, "Rate Master.csv")
+output_file = output_path(os.path.join(BASE_DIR, "MDETLST_Verified.csv"))
 
-# Load data
-df_main = pd.read_csv(main_file)
-df_mtow = pd.read_csv(mtow_master_file)
-df_rates = pd.read_csv(rate_master_file)
+# Load masters (the main file is streamed in chunks below)
+stage('load')
+df_mtow = load_master(mtow_master_file)
+df_rates = load_master(rate_master_file)
+main_columns = pd.read_csv(main_file, nrows=0).columns.tolist()
 
 print("="*120)
 print("MCT AIRPORT CHARGE VERIFICATION WORKFLOW")
 print("="*120)
-print(f"\nMain Data Records: {len(df_main)}")
-print(f"MTOW Master Records: {len(df_mtow)}")
+print(f"\nMTOW Master Records: {len(df_mtow)}")
 print(f"Rate Master Records: {len(df_rates)}")
 
 # Display column names to understand structure
 print("\n" + "-"*120)
 print("Main Data Columns:")
 print("-"*120)
-print(df_main.columns.tolist())
+print(main_columns)
 
 # Display Rate Master
 print("\n" + "="*120)
 print("RATE MASTER (Pricing Structure):")
 print("="*120)
-print(df_rates.to_string(index=False))
-
-# Create working copy
-df_working = df_main.copy()
-
-# Step 1: Extract and clean MTOW (already in numeric format with @ UOM)
-print("\n" + "="*120)
-print("STEP 1: Extracting MTOW")
-print("="*120)
-
-def extract_numeric_value(val):
-    """Extract numeric value from string like '280.0000  @ TON' or multiline formats"""
-    if pd.isna(val):
-        return np.nan
-    val_str = str(val).strip()
-    # Remove newlines and extra spaces
-    val_str = val_str.replace('\n', ' ').replace('\r', ' ')
-    # Extract first complete number (decimal or integer)
-    match = re.search(r'(\d+\.?\d*)', val_str)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            return np.nan
-    return np.nan
-
-# Extract MTOW
-df_working['MTOW_numeric'] = df_working['Max. Take Off Weight @UOM'].apply(extract_numeric_value)
-
-# Convert MTOW from TON to KG for matching with Rate Master
-df_working['MTOW_kg'] = df_working['MTOW_numeric'] * 1000
-
-print(f"MTOW extracted successfully for {df_working['MTOW_numeric'].notna().sum()}/{len(df_working)} records")
-
-# Step 2: Extract Distance
-print("\n" + "="*120)
-print("STEP 2: Extracting Distance")
-print("="*120)
+preview(df_rates, index=False)
 
 # Distance column appears to be "Distance @ UOM" with format like "774.000  @  KM"
-distance_col = [col for col in df_main.columns if 'Distance' in col][0]
-print(f"Found distance column: '{distance_col}'")
-
-df_working['Distance_numeric'] = df_working[distance_col].apply(extract_numeric_value)
-print(f"Distance extracted successfully for {df_working['Distance_numeric'].notna().sum()}/{len(df_working)} records")
-
-# Step 3: Calculate Distance Factor
-print("\n" + "="*120)
-print("STEP 3: Calculating Distance Factor (Distance / 100)")
-print("="*120)
-
-df_working['Distance_Factor'] = df_working['Distance_numeric'] / 100
-print(f"Distance Factor calculated for {df_working['Distance_Factor'].notna().sum()}/{len(df_working)} records")
-
-# Step 4: Map Rate Master to get Unit Rate and Weight Factor
-print("\n" + "="*120)
-print("STEP 4: Mapping Unit Rate and Weight Factor from Rate Master")
-print("="*120)
-
-# Clean rate master data
-df_rates['Mtow'] = pd.to_numeric(df_rates['Mtow'], errors='coerce')
-df_rates['Unit Rate'] = pd.to_numeric(df_rates['Unit Rate'], errors='coerce')
-df_rates['Weight Factor'] = pd.to_numeric(df_rates['Weight Factor'], errors='coerce')
-
-def find_rate_master_match(mtow_kg):
-    """Find matching rate master entry based on MTOW"""
-    if pd.isna(mtow_kg):
-        return np.nan, np.nan
-    
-    # Find exact match in Rate Master
-    matches = df_rates[df_rates['Mtow'] == mtow_kg]
-    
-    if len(matches) > 0:
-        return float(matches.iloc[0]['Unit Rate']), float(matches.iloc[0]['Weight Factor'])
-    else:
-        # If no exact match, find closest
-        df_rates['MTOW_diff'] = abs(df_rates['Mtow'] - mtow_kg)
-        closest = df_rates.loc[df_rates['MTOW_diff'].idxmin()]
-        return float(closest['Unit Rate']), float(closest['Weight Factor'])
-
-# Map rate and weight factors
-df_working[['Unit_Rate_mapped', 'Weight_Factor_mapped']] = df_working['MTOW_kg'].apply(
-    lambda x: pd.Series(find_rate_master_match(x))
-)
-
-matched_rates = df_working['Unit_Rate_mapped'].notna().sum()
-print(f"Rate Master matches found for {matched_rates}/{len(df_working)} records")
-
-# Step 5: Calculate Charges
-print("\n" + "="*120)
-print("STEP 5: Calculating Charges (Unit rate × Distance factor × Weight factor)")
-print("="*120)
-
-df_working['Calculated_Charge'] = (
-    df_working['Unit_Rate_mapped'] * 
-    df_working['Distance_Factor'] * 
-    df_working['Weight_Factor_mapped']
-)
-
-# Round to 2 decimal places
-df_working['Calculated_Charge'] = df_working['Calculated_Charge'].round(2)
-
-print(f"Charges calculated for {df_working['Calculated_Charge'].notna().sum()}/{len(df_working)} records")
-
-# Step 6: Extract and compare with existing Charge Amount
+distance_col = [col for col in main_columns if 'Distance' in col][0]
+
+# Compile rate master once (exact MTOW, else closest MTOW)
+rate_bands = compile_rate_bands(df_rates, 'Mtow', ['Unit Rate', 'Weight Factor'])
+
+# Re-issued invoices only re-verify their new or changed rows, chunk by chunk
+# (a row's charge, status and distance check depend on these columns)
+row_cache = RowCache('MCT', main_file, [__file__, mtow_master_file, rate_master_file])
+pricing_columns = ['Max. Take Off Weight @UOM', distance_col, 'Location Code @ Type', 'Charge Amount']
+
+def verify_chunk(df_chunk):
+    """Verify the new or changed rows of one chunk against the preloaded rate bands
+
+    Returns the chunk with its computed columns (the unchanged rows taken
+    from the row cache), its output rows and the mask of rows verified.
+    """
+    fingerprints = fingerprint_rows(df_chunk, pricing_columns)
+    todo = row_cache.todo(fingerprints)
+    df_working = working_frame(df_chunk, todo)
+
+    # Step 1: Extract MTOW (TON) and convert to KG for matching with Rate Master
+    stage('load')
+    df_working['MTOW_numeric'] = extract_numeric_column(df_working['Max. Take Off Weight @UOM'], station='MCT')
+    df_working['MTOW_kg'] = df_working['MTOW_numeric'] * 1000
+
+    # Step 2: Extract Distance
+    df_working['Distance_numeric'] = extract_numeric_column(df_working[distance_col], station='MCT')
+
+    # Step 3: Distance Factor (Distance / 100)
+    df_working['Distance_Factor'] = df_working['Distance_numeric'] / 100
+
+    # Step 4: Map rate and weight factors
+    stage('lookup')
+    rate_match = resolve_rate_bands(df_working['MTOW_kg'], rate_bands, match='nearest')
+    df_working['Unit_Rate_mapped'] = rate_match['Unit Rate']
+    df_working['Weight_Factor_mapped'] = rate_match['Weight Factor']
+    df_working['No_Rate_Band'] = df_working['MTOW_kg'].notna() & rate_match['Band_MTOW'].isna()
+
+    # Step 5: Unit rate x Distance factor x Weight factor, rounded to 2 decimal places
+    stage('compute')
+    df_working['Calculated_Charge'] = (
+        df_working['Unit_Rate_mapped'] * 
+        df_working['Distance_Factor'] * 
+        df_working['Weight_Factor_mapped']
+    ).round(2)
+
+    # Step 6: Compare with existing Charge Amount
+    stage('compare')
+    df_working['Existing_Charge'] = pd.to_numeric(df_working['Charge Amount'], errors='coerce')
+    _, df_working['Verification_Status'] = compare_charges(
+        df_working['Calculated_Charge'], df_working['Existing_Charge'], station='MCT'
+    )
+
+    # Cross-check the billed distance against the great-circle distance of the route (see overflight.distance)
+    checked = check_distance(
+        location_code(df_working['Location Code @ Type'], 'Origin'),
+        location_code(df_working['Location Code @ Type'], 'Destination'),
+        df_working['Distance_numeric'], unit=distance_unit(df_working[distance_col]), station='MCT'
+    )
+    df_working['GC_Distance_km'] = checked['GC_Distance_km']
+    df_working['Distance_Flag'] = checked['Distance_Flag']
+
+    df_working = row_cache.merge(df_chunk, fingerprints, df_working)
+    row_cache.add(fingerprints, df_working)
+
+    # Create output dataframe
+    output_df = df_working[[
+        'Flight Date Time',
+        'Flt. #',
+        'Acft. Reg.',
+        'Acft. Type Code',
+        'MTOW_numeric',
+        'MTOW_kg',
+        'Distance_numeric',
+        'Distance_Factor',
+        'Unit_Rate_mapped',
+        'Weight_Factor_mapped',
+        'Calculated_Charge',
+        'Existing_Charge',
+        'Verification_Status',
+        'GC_Distance_km',
+        'Distance_Flag'
+    ]]
+
+    # Rename columns for clarity
+    output_df.columns = [
+        'Flight_DateTime',
+        'Flight_No',
+        'Aircraft_Reg',
+        'Aircraft_Type',
+        'MTOW_Tonnes',
+        'MTOW_kg',
+        'Distance_km',
+        'Distance_Factor',
+        'Unit_Rate',
+        'Weight_Factor',
+        'Calculated_Charge',
+        'Vendor_Charge',
+        'Status',
+        'GC_Distance_km',
+        'Distance_Flag'
+    ]
+    return df_working, output_df, todo
+
+
+# Stream the main file: verify each chunk and append it to the output,
+# keeping only running counts and previews in memory
 print("\n" + "="*120)
-print("STEP 6: Comparing with Existing Charges")
+print(f"STREAMING VERIFICATION (chunks of {args.chunk_size} rows)")
 print("="*120)
 
-df_working['Existing_Charge'] = pd.to_numeric(df_working['Charge Amount'], errors='coerce')
-
-# Verify
-tolerance = 0.01
-df_working['Verification_Status'] = df_working.apply(
-    lambda row: 'Matched' if pd.notna(row['Calculated_Charge']) and pd.notna(row['Existing_Charge'])
-                and abs(row['Calculated_Charge'] - row['Existing_Charge']) <= tolerance
-                else 'Not Matched',
-    axis=1
-)
-
-# Create output dataframe
-output_df = df_working[[
-    'Flight Date Time',
-    'Flt. #',
-    'Acft. Reg.',
-    'Acft. Type Code',
-    'MTOW_numeric',
-    'MTOW_kg',
-    'Distance_numeric',
-    'Distance_Factor',
-    'Unit_Rate_mapped',
-    'Weight_Factor_mapped',
-    'Calculated_Charge',
-    'Existing_Charge',
-    'Verification_Status'
-]]
-
-# Rename columns for clarity
-output_df.columns = [
-    'Flight_DateTime',
-    'Flight_No',
-    'Aircraft_Reg',
-    'Aircraft_Type',
-    'MTOW_Tonnes',
-    'MTOW_kg',
-    'Distance_km',
-    'Distance_Factor',
-    'Unit_Rate',
-    'Weight_Factor',
-    'Calculated_Charge',
-    'Vendor_Charge',
-    'Status'
-]
+writer = ChunkWriter(output_file)
+counts = {'mtow': 0, 'distance': 0, 'rates': 0, 'no_band': 0, 'charges': 0,
+          'existing': 0, 'matched': 0, 'not_matched': 0, 'missing': 0, 'invalid': 0}
+route_counts = {'lines': 0, 'known': 0, 'flagged': 0}
+matched_stats = RunningStats()
+difference_stats = RunningStats()
+results_head = HeadCollector(report['top'])
+mismatch_head = HeadCollector(report['mismatches'])
+todo_masks = []
+
+# The results dataset only publishes the run's files if the whole stream verifies
+with ResultsWriter('MCT', main_file) as results:
+    for df_chunk in read_csv_chunks(main_file, args.chunk_size):
+        df_working, output_df, todo = verify_chunk(df_chunk)
+        todo_masks.append(todo)
+        stage('write')
+        writer.write(output_df)
+        results.write(output_df)
+        stage('compare')
+
+        counts['mtow'] += df_working['MTOW_numeric'].notna().sum()
+        counts['distance'] += df_working['Distance_numeric'].notna().sum()
+        counts['rates'] += df_working['Unit_Rate_mapped'].notna().sum()
+        counts['no_band'] += df_working['No_Rate_Band'].sum()
+        counts['charges'] += df_working['Calculated_Charge'].notna().sum()
+        counts['existing'] += df_working['Existing_Charge'].notna().sum()
+        for key, value in distance_counts(output_df).items():
+            route_counts[key] += value
+
+        is_matched = output_df['Status'] == 'Matched'
+        counts['matched'] += is_matched.sum()
+        counts['not_matched'] += (output_df['Status'] == 'Not Matched').sum()
+        counts['missing'] += (output_df['Status'] == 'Missing Input').sum()
+        matched_stats.update(output_df.loc[is_matched, 'Calculated_Charge'])
+
+        # Unmatched rows, less the NaN rows (header/footer lines repeated inside the file)
+        mismatches = output_df[~is_matched]
+        mismatches_valid = mismatches[mismatches['Flight_No'].notna() & mismatches['Aircraft_Reg'].notna()]
+        counts['invalid'] += len(mismatches) - len(mismatches_valid)
+        difference_stats.update((mismatches_valid['Calculated_Charge'] - mismatches_valid['Vendor_Charge']).abs())
+
+        results_head.update(output_df)
+        mismatch_head.update(mismatches_valid)
+        print(f"  Chunk {writer.chunks}: {len(output_df)} rows ({writer.rows} total), "
+              f"{is_matched.sum()} matched")
+        stage('load')  # reading the next chunk
+    stage('write')
+    row_cache.save()
+row_cache.report(pd.concat(todo_masks, ignore_index=True))
+
+stage('compare', rows=writer.rows)
+total = writer.rows
+matched = counts['matched']
+not_matched = counts['not_matched']
+missing = counts['missing']
+
+print(f"\nMain Data Records: {total}")
+print(f"MTOW extracted successfully for {counts['mtow']}/{total} records")
+print(f"Distance extracted successfully for {counts['distance']}/{total} records")
+print(f"Rate Master matches found for {counts['rates']}/{total} records")
+print(f"MTOW values with no rate band: {counts['no_band']}")
+print(f"Charges calculated for {counts['charges']}/{total} records")
 
 # Display summary
 print("\nVERIFICATION SUMMARY")
 print("="*120)
-matched = (output_df['Status'] == 'Matched').sum()
-not_matched = (output_df['Status'] == 'Not Matched').sum()
-
 print(f"[MATCHED]     {matched}")
 print(f"[NOT MATCHED] {not_matched}")
-print(f"Total Records: {len(output_df)}")
-print(f"Success Rate:  {(matched/len(output_df)*100):.1f}%")
+print(f"[MISSING INPUT] {missing}")
+print(f"Total Records: {total}")
+print(f"Success Rate:  {(matched/total*100):.1f}%")
+distance_line(route_counts, station='MCT')
 
 # Display sample results
 print("\n" + "="*120)
-print("DETAILED VERIFICATION RESULTS (First 30 rows):")
+print("DETAILED VERIFICATION RESULTS:")
 print("="*120)
-pd.set_option('display.max_rows', None)
-pd.set_option('display.max_columns', None)
-pd.set_option('display.width', None)
-pd.set_option('display.max_colwidth', None)
-print(output_df.head(30).to_string(index=False))
-
-# Save results
-output_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\MCT\MDETLST_Verified.csv"
-output_df.to_csv(output_file, index=False)
+preview(results_head.frame(), index=False)
+
 print(f"\n\nResults saved to: {output_file}")
 
 # Show summary statistics
@@ -215,48 +256,38 @@ print("SUMMARY STATISTICS")
 print("="*120)
 
 # Data quality
-valid_mtow = df_working['MTOW_numeric'].notna().sum()
-valid_distance = df_working['Distance_numeric'].notna().sum()
-valid_rates = df_working['Unit_Rate_mapped'].notna().sum()
-valid_charges = df_working['Existing_Charge'].notna().sum()
-
-print(f"Records with valid MTOW:             {valid_mtow}/{len(df_working)}")
-print(f"Records with valid Distance:         {valid_distance}/{len(df_working)}")
-print(f"Records with Rate Master matches:    {valid_rates}/{len(df_working)}")
-print(f"Records with existing charges:       {valid_charges}/{len(df_working)}")
+print(f"Records with valid MTOW:             {counts['mtow']}/{total}")
+print(f"Records with valid Distance:         {counts['distance']}/{total}")
+print(f"Records with Rate Master matches:    {counts['rates']}/{total}")
+print(f"Records with existing charges:       {counts['existing']}/{total}")
 
 # Charge analysis
 if matched > 0:
-    matched_df = output_df[output_df['Status'] == 'Matched']
     print(f"\nMatched Charges:")
-    print(f"  Count: {len(matched_df)}")
-    print(f"  Min: {matched_df['Calculated_Charge'].min():.2f}")
-    print(f"  Max: {matched_df['Calculated_Charge'].max():.2f}")
-    print(f"  Mean: {matched_df['Calculated_Charge'].mean():.2f}")
-    print(f"  Total: {matched_df['Calculated_Charge'].sum():.2f}")
-
-if not_matched > 0:
-    print(f"\n[FOUND {not_matched} MISMATCHES]")
-    mismatches = output_df[output_df['Status'] == 'Not Matched']
-    
-    # Filter out NaN rows
-    mismatches_valid = mismatches[mismatches['Flight_No'].notna() & mismatches['Aircraft_Reg'].notna()]
-    
-    if len(mismatches_valid) > 0:
-        print(f"\nValid Mismatch Analysis (first 15):")
-        print(mismatches_valid.head(15)[['Flight_No', 'Aircraft_Reg', 'MTOW_Tonnes', 'Distance_km', 
-                                    'Unit_Rate', 'Weight_Factor', 'Calculated_Charge', 'Vendor_Charge']].to_string(index=False))
-        
+    print(f"  Count: {matched_stats.count}")
+    print(f"  Min: {matched_stats.min:.2f}")
+    print(f"  Max: {matched_stats.max:.2f}")
+    print(f"  Mean: {matched_stats.mean:.2f}")
+    print(f"  Total: {matched_stats.total:.2f}")
+
+if not_matched + missing > 0:
+    print(f"\n[FOUND {not_matched} MISMATCHES, {missing} MISSING INPUT]")
+
+    if mismatch_head.rows > 0:
+        print(f"\nValid Mismatch Analysis:")
+        list_mismatches(mismatch_head.frame(), ['Flight_No', 'Aircraft_Reg', 'MTOW_Tonnes', 'Distance_km',
+                                                'Unit_Rate', 'Weight_Factor', 'Calculated_Charge', 'Vendor_Charge'],
+                        index=False)
+
         # Calculate difference
-        mismatches_valid_copy = mismatches_valid.copy()
-        mismatches_valid_copy['Difference'] = abs(mismatches_valid_copy['Calculated_Charge'] - mismatches_valid_copy['Vendor_Charge'])
         print(f"\nDifference Analysis (valid mismatches):")
-        print(f"  Total valid mismatches: {len(mismatches_valid_copy)}")
-        print(f"  Min difference: {mismatches_valid_copy['Difference'].min():.2f}")
-        print(f"  Max difference: {mismatches_valid_copy['Difference'].max():.2f}")
-        print(f"  Mean difference: {mismatches_valid_copy['Difference'].mean():.2f}")
-        print(f"  Total vendor difference: {mismatches_valid_copy['Difference'].sum():.2f}")
-    
+        print(f"  Total valid mismatches: {not_matched + missing - counts['invalid']}")
+        print(f"  Min difference: {difference_stats.min:.2f}")
+        print(f"  Max difference: {difference_stats.max:.2f}")
+        print(f"  Mean difference: {difference_stats.mean:.2f}")
+        print(f"  Total vendor difference: {difference_stats.total:.2f}")
+
     # Count header/footer rows
-    invalid_rows = len(mismatches) - len(mismatches_valid)
-    print(f"\nInvalid/Header/Footer rows: {invalid_rows}")
+    print(f"\nInvalid/Header/Footer rows: {counts['invalid']}")
+
+result_line('MCT', {'Matched': matched, 'Not Matched': not_matched, 'Missing Input': missing}, output_file)
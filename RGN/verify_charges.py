@@ -1,47 +1,45 @@
 import pandas as pd
 import numpy as np
 import os
-import re
-import glob
-
-# File paths - detect files automatically
-vendor_files = glob.glob("*.csv")
-vendor_file = None
-mtow_master_file = None
-rate_master_file = None
-
-# Identify files
-for f in vendor_files:
-    f_lower = f.lower()
-    if 'mtow' in f_lower and 'master' in f_lower:
-        mtow_master_file = f
-    elif 'rate' in f_lower and 'master' in f_lower:
-        rate_master_file = f
-    elif 'vendor' in f_lower and 'master' in f_lower:
-        vendor_file = f
-
-# If vendor master not found, use the remaining CSV file
-if vendor_file is None and len(vendor_files) >= 3:
-    for f in vendor_files:
-        f_lower = f.lower()
-        if 'mtow' not in f_lower and 'rate' not in f_lower:
-            vendor_file = f
-            break
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.mtow import build_registration_index, lookup_mtow, normalize_registration
+from overflight.rates import compile_rate_bands, resolve_rate_bands
+from overflight.parsing import extract_numeric_column
+from overflight.store import load_master
+from overflight.manifest import load_manifest, station_file
+from overflight.columns import resolve_columns
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import record_results
+
+configure_report()
+
+# File paths - by role, from the cached manifest of this folder
+manifest = load_manifest(os.path.dirname(os.path.abspath(__file__)))
+vendor_file = invoice_path() or station_file(manifest, 'vendor')
+mtow_master_file = station_file(manifest, 'fleet')
+rate_master_file = station_file(manifest, 'rates')
 
 print(f"Detected files:")
-print(f"  Vendor: {vendor_file}")
-print(f"  MTOW Master: {mtow_master_file}")
-print(f"  Rate Master: {rate_master_file}")
+print(f"  Vendor: {vendor_file and os.path.basename(vendor_file)}")
+print(f"  MTOW Master: {mtow_master_file and os.path.basename(mtow_master_file)}")
+print(f"  Rate Master: {rate_master_file and os.path.basename(rate_master_file)}")
 
 if not all([vendor_file, mtow_master_file, rate_master_file]):
     print("ERROR: Could not detect all required files")
     exit(1)
 
 # Read files
+stage('load')
 print("\nLoading files...")
 df_vendor = pd.read_csv(vendor_file)
-df_mtow_master = pd.read_csv(mtow_master_file)
-df_rate_master = pd.read_csv(rate_master_file)
+df_mtow_master = load_master(mtow_master_file)
+df_rate_master = load_master(rate_master_file)
 
 print(f"Vendor data loaded: {len(df_vendor)} records")
 print(f"MTOW Master loaded: {len(df_mtow_master)} aircraft")
@@ -54,94 +52,63 @@ df_rate_master.columns = df_rate_master.columns.str.strip()
 
 print(f"\nVendor columns: {list(df_vendor.columns)}")
 
-# Create working dataframe
-df_working = df_vendor.copy()
-
-# Helper function to extract numeric values
-def extract_numeric_value(val):
-    """Extract numeric value from a cell, handling currency formats"""
-    if pd.isna(val):
-        return np.nan
-    val_str = str(val).strip().replace('\n', ' ').replace('\r', ' ')
-    # Remove currency symbols and commas
-    val_str = val_str.replace('$', '').replace(',', '').replace('USD', '')
-    match = re.search(r'(\d+\.?\d*)', val_str)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            return np.nan
-    return np.nan
+# Create working dataframe (shares the vendor columns, see overflight.frames)
+df_working = working_frame(df_vendor)
 
 print("\n" + "="*100)
 print("STEP 1: DATA EXTRACTION AND MTOW LOOKUP")
 print("="*100)
 
+# Vendor column roles (worked out once per header layout, see overflight.columns)
+vendor_columns = resolve_columns(df_working, 'RGN')
+
 # Find registration column
-reg_col = None
-for col in df_working.columns:
-    col_lower = col.lower()
-    if 'reg' in col_lower and 'no' in col_lower:
-        reg_col = col
-        break
-
-if reg_col is None:
-    # Try alternate patterns
-    for col in df_working.columns:
-        col_lower = col.lower()
-        if 'reg' in col_lower or 'aircraft' in col_lower:
-            reg_col = col
-            break
+reg_col = vendor_columns['registration']
 
 print(f"Registration column: {reg_col}")
 
+# Drop page-total rows ("TOTAL  2,48,426"): no flight, only the running total of the invoice.
+# (B/F rows at page breaks are flights; their charge cell also holds the brought-forward
+# total, and only its last line is parsed - see STATION_RULES['RGN'] in overflight.parsing)
+if reg_col:
+    text_cols = [col for col in df_working.columns if col != reg_col]
+    is_total = df_working[reg_col].isna() & df_working[text_cols].apply(
+        lambda values: values.astype('string').str.contains(r'\bTOTAL\b', case=False, na=False)
+    ).any(axis=1)
+    if is_total.any():
+        print(f"Dropped {is_total.sum()} page-total rows")
+        df_working = df_working[~is_total]
+
 if reg_col:
     df_working['Aircraft_Reg'] = df_working[reg_col].apply(lambda x: str(x).strip() if pd.notna(x) else None)
 else:
     print("ERROR: Could not find registration column")
     df_working['Aircraft_Reg'] = None
 
-# Lookup MTOW from master file
-def get_mtow_from_master(reg):
-    """Get MTOW from master file using aircraft registration"""
-    if pd.isna(reg) or reg is None:
-        return np.nan
-    matches = df_mtow_master[df_mtow_master['Aircraft'].str.strip() == str(reg).strip()]
-    if len(matches) > 0:
-        return matches.iloc[0]['MTOW_in_KGs']
-    return np.nan
+# Lookup MTOW from master file (one hash join over the whole column)
+stage('lookup', rows=len(df_working))
+mtow_index = build_registration_index(df_mtow_master)
 
-df_working['MTOW'] = df_working['Aircraft_Reg'].apply(get_mtow_from_master)
+df_working['MTOW'] = lookup_mtow(df_working['Aircraft_Reg'], mtow_index)
 
 print(f"\nMTOW Lookup Results:")
 print(f"  Successfully mapped: {df_working['MTOW'].notna().sum()}/{len(df_working)}")
 
 # Find vendor charge column
-charge_col = None
-for col in df_working.columns:
-    col_lower = col.lower()
-    if any(term in col_lower for term in ['charge', 'cost', 'amount', 'total']):
-        if 'holiday' not in col_lower and 'ot' not in col_lower and 'vat' not in col_lower:
-            charge_col = col
-            break
-
-if charge_col is None:
-    # Use last numeric column if not found
-    for col in reversed(df_working.columns):
-        if df_working[col].dtype in ['float64', 'int64']:
-            charge_col = col
-            break
+stage('load', rows=len(df_working))
+charge_col = vendor_columns['charge']
 
 print(f"Vendor charge column: {charge_col}")
 
 if charge_col:
-    df_working['Vendor_Charge'] = df_working[charge_col].apply(extract_numeric_value)
+    df_working['Vendor_Charge'] = extract_numeric_column(df_working[charge_col], station='RGN', label='vendor charge')
 else:
     df_working['Vendor_Charge'] = np.nan
 
 print(f"  Valid vendor charges: {df_working['Vendor_Charge'].notna().sum()}/{len(df_working)}")
 
 # STEP 2: RATE MASTER LOOKUP
+stage('lookup', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 2: FLAT RATE LOOKUP FROM RATE MASTER")
 print("="*100)
@@ -157,129 +124,49 @@ for col in df_rate_master.columns:
         charge_rate_col = col
 
 if mtow_col and charge_rate_col:
-    for idx, row in df_rate_master.iterrows():
-        print(f"  MTOW {row[mtow_col]:<15} -> Charge {row[charge_rate_col]}")
-
-# Lookup charge based on MTOW (converting to tonnes if needed)
-def get_charge_from_master(aircraft_reg, mtow):
-    """Get flat rate charge from rate master based on aircraft registration or MTOW"""
-    if pd.isna(mtow):
-        return np.nan
-    
-    try:
-        mtow = float(mtow)
-    except (ValueError, TypeError):
-        return np.nan
-    
-    # First, check if there's an exact match by aircraft registration in Rate Master
-    # Some aircraft might have special rates
-    if pd.notna(aircraft_reg):
-        reg_str = str(aircraft_reg).strip()
-        # Look for aircraft registration in the rate master
-        for idx, row in df_rate_master.iterrows():
-            try:
-                # The rate master Location column might contain registration info
-                location = str(row.get('Location', '')).strip()
-                if reg_str in location or location in reg_str:
-                    # Found a match for this aircraft
-                    charge_cols = [col for col in df_rate_master.columns if 'charge' in col.lower()]
-                    if len(charge_cols) > 0:
-                        return float(row[charge_cols[0]])
-            except (ValueError, TypeError):
-                pass
-    
-    # If no aircraft-specific match, proceed with MTOW-based lookup
-    # Find numeric columns in rate master
-    numeric_cols = df_rate_master.select_dtypes(include=[np.number]).columns
-    
-    if len(numeric_cols) < 2:
-        return np.nan
-    
-    # The Rate Master has MTOW columns (in kg and tonnes) and Charge column
-    # Find the MTOW columns and Charge column
-    rate_copy = df_rate_master.copy()
-    
-    # Identify which columns are MTOW and which is Charge
-    mtow_cols = [col for col in rate_copy.columns if 'mtow' in col.lower()]
-    charge_cols = [col for col in rate_copy.columns if 'charge' in col.lower()]
-    
-    if len(charge_cols) == 0 or len(mtow_cols) == 0:
-        return np.nan
-    
-    charge_col = charge_cols[0]
-    
-    # Convert MTOW from kg to tonnes
-    mtow_tonnes = mtow / 1000.0
-    
-    # Try to match with the MTOW values in rate master
-    # The Rate Master has both kg and tonnes versions of MTOW
-    for idx, row in rate_copy.iterrows():
-        # Try matching with each MTOW column
-        for mtow_col in mtow_cols:
-            try:
-                rm_mtow = float(row[mtow_col])
-                # Match either kg or tonnes
-                if (rm_mtow == mtow) or (rm_mtow == mtow_tonnes):
-                    return float(row[charge_col])
-            except (ValueError, TypeError):
-                continue
-    
-    # If no exact match, try closest match using tonnes
-    rate_copy_clean = rate_copy.copy()
-    for col in mtow_cols:
-        rate_copy_clean[col] = pd.to_numeric(rate_copy_clean[col], errors='coerce')
-    
-    # Try closest match - use the smallest MTOW column (which is tonnes)
-    if len(mtow_cols) > 0:
-        mtow_tonnes_col = min(mtow_cols, key=lambda x: rate_copy_clean[x].max())
-        rate_copy_clean['MTOW_diff'] = abs(rate_copy_clean[mtow_tonnes_col] - mtow_tonnes)
-        rate_copy_clean = rate_copy_clean.dropna(subset=['MTOW_diff', charge_col])
-        
-        if len(rate_copy_clean) > 0:
-            best_match = rate_copy_clean.loc[rate_copy_clean['MTOW_diff'].idxmin()]
-            return float(best_match[charge_col])
-    
-    return np.nan
-
-df_working['Calculated_Charge'] = df_working.apply(
-    lambda row: get_charge_from_master(row['Aircraft_Reg'], row['MTOW']),
-    axis=1
-)
+    preview(df_rate_master, [mtow_col, charge_rate_col], index=False)
+
+# Lookup charge based on MTOW
+# The Rate Master has MTOW columns in kg and tonnes; vendor MTOW comes from the master in kg
+rate_mtow_cols = [col for col in df_rate_master.columns if 'mtow' in col.lower()]
+rate_charge_col = [col for col in df_rate_master.columns if 'charge' in col.lower()][0]
+rate_mtow_kg_col = max(rate_mtow_cols, key=lambda col: pd.to_numeric(df_rate_master[col], errors='coerce').max())
+rate_bands = compile_rate_bands(df_rate_master, rate_mtow_kg_col, rate_charge_col)
+rate_match = resolve_rate_bands(df_working['MTOW'], rate_bands, match='nearest')
+df_working['Calculated_Charge'] = rate_match[rate_charge_col]
+
+# Some aircraft might have special rates, listed by registration in the Location column
+if 'Location' in df_rate_master.columns:
+    special_rates = pd.Series(pd.to_numeric(df_rate_master[rate_charge_col], errors='coerce').to_numpy(),
+                              index=normalize_registration(df_rate_master['Location']).to_numpy())
+    special_rates = special_rates[special_rates.index.notna() & ~special_rates.index.duplicated()]
+    special_charge = normalize_registration(df_working['Aircraft_Reg']).map(special_rates)
+    df_working['Calculated_Charge'] = special_charge.where(df_working['MTOW'].notna()).fillna(df_working['Calculated_Charge'])
 
 print(f"\nCharge Mapping Results:")
 print(f"  Successfully mapped: {df_working['Calculated_Charge'].notna().sum()}/{len(df_working)}")
+print(f"  No rate band: {(df_working['MTOW'].notna() & df_working['Calculated_Charge'].isna()).sum()}")
 
 # STEP 3: VERIFICATION
+stage('compare', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 3: CHARGE VERIFICATION")
 print("="*100)
 
-tolerance = 0.01
-
-def check_match(calculated, vendor):
-    """Check if calculated charge matches vendor charge within tolerance"""
-    if pd.isna(calculated) or pd.isna(vendor):
-        return "Not Matched"
-    diff = abs(calculated - vendor)
-    if diff <= tolerance:
-        return "Matched"
-    else:
-        return "Not Matched"
-
-df_working['Difference'] = abs(df_working['Calculated_Charge'] - df_working['Vendor_Charge'])
-df_working['Status'] = df_working.apply(
-    lambda row: check_match(row['Calculated_Charge'], row['Vendor_Charge']),
-    axis=1
+df_working['Difference'], df_working['Status'] = compare_charges(
+    df_working['Calculated_Charge'], df_working['Vendor_Charge'], station='RGN'
 )
 
 # Summary
 matched_count = (df_working['Status'] == 'Matched').sum()
 not_matched_count = (df_working['Status'] == 'Not Matched').sum()
+missing_count = (df_working['Status'] == 'Missing Input').sum()
 total_records = len(df_working)
 success_rate = (matched_count / total_records) * 100 if total_records > 0 else 0
 
 print(f"\n[MATCHED]     {matched_count}")
 print(f"[NOT MATCHED] {not_matched_count}")
+print(f"[MISSING INPUT] {missing_count}")
 print(f"Total Records: {total_records}")
 print(f"Success Rate:  {success_rate:.1f}%")
 
@@ -300,20 +187,20 @@ if len(matched_data) > 0:
 
 # Detailed results (first 20)
 print("\n" + "="*100)
-print("DETAILED VERIFICATION RESULTS (First 20 rows):")
+print("DETAILED VERIFICATION RESULTS:")
 print("="*100)
 display_cols = [col for col in ['Aircraft_Reg', 'MTOW', 'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status'] 
                 if col in df_working.columns]
-print(df_working[display_cols].head(20).to_string())
+preview(df_working, display_cols)
 
 # Mismatch analysis
-mismatches = df_working[df_working['Status'] == 'Not Matched'].copy()
+mismatches = df_working[df_working['Status'] == 'Not Matched']
 if len(mismatches) > 0:
-    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()].copy()
+    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()]
     if len(valid_mismatches) > 0:
         print(f"\n[FOUND {len(valid_mismatches)} MISMATCHES]")
-        print(f"\nMismatch Details (first 15):")
-        print(valid_mismatches[display_cols].head(15).to_string())
+        print(f"\nMismatch Details:")
+        list_mismatches(valid_mismatches, display_cols)
         
         print(f"\nDifference Analysis (valid mismatches):")
         print(f"  Total valid mismatches: {len(valid_mismatches)}")
@@ -323,12 +210,16 @@ if len(mismatches) > 0:
         print(f"  Total vendor difference: ${valid_mismatches['Vendor_Charge'].sum():.2f}")
 
 # Save results
-output_file = "Verification_Results.csv"
-df_output = df_working[display_cols].copy()
+stage('write', rows=len(df_working))
+output_file = output_path("Verification_Results.csv")
+df_output = df_working[display_cols]
 try:
     df_output.to_csv(output_file, index=False)
     print(f"\n\nResults saved to: {os.path.abspath(output_file)}")
 except PermissionError:
     print(f"\n\nNote: Could not save to {output_file} (file is open in another application)")
     print("In-memory results are available above")
+record_results('RGN', df_output.assign(Flight_Date=df_working.get(vendor_columns['date'])), vendor_file)
 print("="*100)
+
+result_line('RGN', df_output['Status'], os.path.abspath(output_file))
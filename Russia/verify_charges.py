@@ -1,19 +1,35 @@
 import pandas as pd
 import numpy as np
 import os
-import re
-import math
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.rates import compile_rate_bands, resolve_rate_bands
+from overflight.parsing import extract_numeric_column
+from overflight.store import load_master
+from overflight.columns import resolve_columns
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.distance import check_distance, distance_line
+from overflight.formulas import compile_formula, evaluate_formula
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import record_results
+
+configure_report()
 
 # File paths
-vendor_file = "1900374834.csv"
+vendor_file = invoice_path("1900374834.csv")
 mtow_master_file = "MTOW Master.xlsx - Sheet1.csv"
 rate_master_file = "Rate Master.csv"
 
 # Read files
+stage('load')
 print("Loading files...")
 df_vendor = pd.read_csv(vendor_file)
-df_mtow_master = pd.read_csv(mtow_master_file)
-df_rate_master = pd.read_csv(rate_master_file)
+df_mtow_master = load_master(mtow_master_file)
+df_rate_master = load_master(rate_master_file)
 
 print(f"Vendor data loaded: {len(df_vendor)} records")
 print(f"MTOW Master loaded: {len(df_mtow_master)} aircraft")
@@ -26,45 +42,19 @@ df_rate_master.columns = df_rate_master.columns.str.strip()
 
 print(f"\nVendor columns: {list(df_vendor.columns)}")
 
-# Create working dataframe
-df_working = df_vendor.copy()
-
-# Helper function to extract numeric values
-def extract_numeric_value(val):
-    """Extract first numeric value from a cell"""
-    if pd.isna(val):
-        return np.nan
-    val_str = str(val).strip().replace('\n', ' ').replace('\r', ' ')
-    # Remove spaces within numbers (e.g., "4 779.40" -> "4779.40")
-    val_str = val_str.replace(' ', '')
-    match = re.search(r'(\d+\.?\d*)', val_str)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            return np.nan
-    return np.nan
+# Create working dataframe (shares the vendor columns, see overflight.frames)
+df_working = working_frame(df_vendor)
 
 print("\n" + "="*100)
 print("STEP 1: DATA EXTRACTION")
 print("="*100)
 
-# Find the correct columns
-distance_col = None
-mtow_col = None
-charge_col = None
-reg_col = None
-
-for col in df_working.columns:
-    col_lower = col.lower()
-    if 'distance' in col_lower and 'km' in col_lower:
-        distance_col = col
-    if 'mtow' in col_lower and ('tons' in col_lower or 'ton' in col_lower):
-        mtow_col = col
-    if 'en-route' in col_lower and 'amount' in col_lower and 'usd' in col_lower:
-        charge_col = col
-    if 'registration' in col_lower or 'registr' in col_lower:
-        reg_col = col
+# Find the correct columns (worked out once per header layout, see overflight.columns)
+vendor_columns = resolve_columns(df_working, 'Russia')
+distance_col = vendor_columns['distance']
+mtow_col = vendor_columns['mtow']
+charge_col = vendor_columns['charge']
+reg_col = vendor_columns['registration']
 
 print(f"Identified columns:")
 print(f"  Distance: {distance_col}")
@@ -73,17 +63,10 @@ print(f"  Registration: {reg_col}")
 print(f"  Vendor Charge: {charge_col}")
 
 # Extract registration number
-if reg_col is None:
-    # Fallback to a column that likely contains registration
-    for col in df_working.columns:
-        if 'registr' in col.lower():
-            reg_col = col
-            break
-
 df_working['Aircraft_Reg'] = df_working[reg_col].apply(lambda x: str(x).strip() if pd.notna(x) else None)
 
 # Extract distance (in km)
-df_working['Distance_km'] = df_working[distance_col].apply(extract_numeric_value)
+df_working['Distance_km'] = extract_numeric_column(df_working[distance_col], station='Russia', label='distance')
 
 # Extract MTOW (in tons)
 mtow_found = False
@@ -93,7 +76,7 @@ for col in df_working.columns:
     if ('mtom' in col_lower or 'mt om' in col_lower or 'mtow' in col_lower):
         if ('tons' in col_lower or 'ton' in col_lower):
             mtow_col = col
-            df_working['MTOW_tons'] = df_working[col].apply(extract_numeric_value)
+            df_working['MTOW_tons'] = extract_numeric_column(df_working[col], station='Russia', label='MTOW')
             mtow_found = True
             print(f"Found MTOW column: {mtow_col}")
             break
@@ -104,7 +87,7 @@ if not mtow_found:
     df_working['MTOW_tons'] = np.nan
 
 # Extract vendor charge
-df_working['Vendor_Charge'] = df_working[charge_col].apply(extract_numeric_value)
+df_working['Vendor_Charge'] = extract_numeric_column(df_working[charge_col], station='Russia', label='vendor charge')
 
 print(f"\nData Quality Check:")
 print(f"  Records with valid Distance: {df_working['Distance_km'].notna().sum()}/{len(df_working)}")
@@ -112,22 +95,17 @@ print(f"  Records with valid MTOW: {df_working['MTOW_tons'].notna().sum()}/{len(
 print(f"  Records with valid Vendor Charge: {df_working['Vendor_Charge'].notna().sum()}/{len(df_working)}")
 
 # STEP 2: DISTANCE ROUNDING
+stage('compute', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 2: DISTANCE ROUNDING (To Nearest Highest Hundred)")
 print("="*100)
 
 # Round distance to nearest highest hundred
-def round_to_nearest_highest_hundred(distance):
-    """Round distance to nearest highest value in hundreds"""
-    if pd.isna(distance):
-        return np.nan
-    # If distance is already a multiple of 100, keep it
-    if distance % 100 == 0:
-        return distance
-    # Otherwise round up to next hundred
-    return math.ceil(distance / 100) * 100
-
-df_working['Distance_Rounded'] = df_working['Distance_km'].apply(round_to_nearest_highest_hundred)
+# (a distance that is already a multiple of 100 is kept)
+formula = compile_formula('Russia', rate_master=df_rate_master)
+df_working['Distance_Rounded'] = evaluate_formula(
+    formula, outputs=['distance_rounded'], distance=df_working['Distance_km']
+)['distance_rounded']
 
 print(f"\nDistance Rounding Examples:")
 sample_distances = df_working[df_working['Distance_km'].notna()].head(10)
@@ -135,6 +113,7 @@ for idx, row in sample_distances.iterrows():
     print(f"  {row['Distance_km']:>8.1f} km -> {row['Distance_Rounded']:>8.1f} km")
 
 # STEP 3: UNIT RATE LOOKUP
+stage('lookup', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 3: UNIT RATE LOOKUP FROM RATE MASTER")
 print("="*100)
@@ -147,42 +126,25 @@ for mtow, rate in mtow_to_rate.items():
     if pd.notna(mtow) and pd.notna(rate):
         print(f"  MTOW {mtow:>10} -> Unit Rate {rate:>8.1f}")
 
-# Lookup unit rate based on MTOW
-def get_unit_rate(mtow):
-    """Get unit rate from rate master based on MTOW (convert tonnes to kg for matching)"""
-    if pd.isna(mtow):
-        return np.nan
-    
-    # Vendor MTOW is in tonnes, convert to kg for matching with rate master
-    mtow_kg = mtow * 1000
-    
-    # Try exact match first
-    if mtow_kg in mtow_to_rate:
-        return mtow_to_rate[mtow_kg]
-    
-    # Try closest match
-    closest_mtow = min(mtow_to_rate.keys(), 
-                       key=lambda x: abs(x - mtow_kg) if pd.notna(x) else float('inf'))
-    if pd.notna(closest_mtow):
-        return mtow_to_rate[closest_mtow]
-    
-    return np.nan
-
-df_working['Unit_Rate_mapped'] = df_working['MTOW_tons'].apply(get_unit_rate)
+# Lookup unit rate based on MTOW (vendor MTOW is in tonnes, rate master in kg)
+rate_bands = compile_rate_bands(df_rate_master, 'MTOW', 'Unit Rate')
+rate_match = resolve_rate_bands(df_working['MTOW_tons'] * 1000, rate_bands, match='nearest')
+df_working['Unit_Rate_mapped'] = rate_match['Unit Rate']
 
 print(f"\nUnit Rate Lookup Results:")
 print(f"  Matched rates: {df_working['Unit_Rate_mapped'].notna().sum()}/{len(df_working)}")
+print(f"  No rate band: {(df_working['MTOW_tons'].notna() & rate_match['Band_MTOW'].isna()).sum()}")
 
 # STEP 4: CHARGE CALCULATION
+stage('compute', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 4: CHARGE CALCULATION: Unit Rate * (Rounded Distance / 100)")
 print("="*100)
 
 # Calculate charge: Unit Rate * (Distance / 100)
-df_working['Calculated_Charge'] = (
-    df_working['Unit_Rate_mapped'] * 
-    (df_working['Distance_Rounded'] / 100)
-).round(2)
+df_working['Calculated_Charge'] = evaluate_formula(
+    formula, distance=df_working['Distance_km'], unit_rate=df_working['Unit_Rate_mapped']
+)['charge']
 
 print(f"\nFormula Verification (Sample Calculation):")
 if len(df_working[df_working['Calculated_Charge'].notna()]) > 0:
@@ -194,39 +156,43 @@ if len(df_working[df_working['Calculated_Charge'].notna()]) > 0:
     print(f"  Calculation: {sample['Unit_Rate_mapped']} * ({sample['Distance_Rounded']}/100) = {sample['Calculated_Charge']:.2f}")
 
 # STEP 5: VERIFICATION
+stage('compare', rows=len(df_working))
 print("\n" + "="*100)
 print("STEP 5: CHARGE VERIFICATION")
 print("="*100)
 
 # Compare calculated vs vendor charges with tolerance
-tolerance = 0.01
-
-def check_match(calculated, vendor):
-    """Check if calculated charge matches vendor charge within tolerance"""
-    if pd.isna(calculated) or pd.isna(vendor):
-        return "Not Matched"
-    diff = abs(calculated - vendor)
-    if diff <= tolerance:
-        return "Matched"
-    else:
-        return "Not Matched"
-
-df_working['Difference'] = abs(df_working['Calculated_Charge'] - df_working['Vendor_Charge'])
-df_working['Status'] = df_working.apply(
-    lambda row: check_match(row['Calculated_Charge'], row['Vendor_Charge']),
-    axis=1
+df_working['Difference'], df_working['Status'] = compare_charges(
+    df_working['Calculated_Charge'], df_working['Vendor_Charge'], station='Russia'
 )
 
+# Cross-check the billed distance against the great-circle distance of the route (see overflight.distance)
+origin_col, destination_col = vendor_columns['origin'], vendor_columns['destination']
+if origin_col and destination_col:
+    checked = check_distance(df_working[origin_col], df_working[destination_col],
+                             df_working['Distance_km'], unit='km', station='Russia')
+    df_working['GC_Distance_km'] = checked['GC_Distance_km']
+    df_working['Distance_Flag'] = checked['Distance_Flag']
+else:
+    print("WARNING: Could not find origin/destination columns, distance check skipped")
+    checked = None
+    df_working['GC_Distance_km'] = np.nan
+    df_working['Distance_Flag'] = False
+
 # Summary statistics
 matched_count = (df_working['Status'] == 'Matched').sum()
 not_matched_count = (df_working['Status'] == 'Not Matched').sum()
+missing_count = (df_working['Status'] == 'Missing Input').sum()
 total_records = len(df_working)
 success_rate = (matched_count / total_records) * 100 if total_records > 0 else 0
 
 print(f"\n[MATCHED]     {matched_count}")
 print(f"[NOT MATCHED] {not_matched_count}")
+print(f"[MISSING INPUT] {missing_count}")
 print(f"Total Records: {total_records}")
 print(f"Success Rate:  {success_rate:.1f}%")
+if checked is not None:
+    distance_line(checked, station='Russia')
 
 # Data quality metrics
 print("\nData Quality:")
@@ -248,21 +214,21 @@ if len(matched_data) > 0:
 
 # Detailed verification results
 print("\n" + "="*100)
-print("DETAILED VERIFICATION RESULTS (First 20 rows):")
+print("DETAILED VERIFICATION RESULTS:")
 print("="*100)
 display_cols = ['Aircraft_Reg', 'Distance_km', 'Distance_Rounded', 'MTOW_tons', 
                 'Unit_Rate_mapped', 'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status']
-print(df_working[display_cols].head(20).to_string())
+preview(df_working, display_cols)
 
 # Mismatch analysis
-mismatches = df_working[df_working['Status'] == 'Not Matched'].copy()
+mismatches = df_working[df_working['Status'] == 'Not Matched']
 if len(mismatches) > 0:
-    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()].copy()
+    valid_mismatches = mismatches[mismatches['Calculated_Charge'].notna()]
     if len(valid_mismatches) > 0:
         print(f"\n[FOUND {len(valid_mismatches)} MISMATCHES]")
-        print(f"\nMismatch Details (first 15):")
-        print(valid_mismatches[['Aircraft_Reg', 'Distance_Rounded', 'MTOW_tons', 'Unit_Rate_mapped',
-                                'Calculated_Charge', 'Vendor_Charge', 'Difference']].head(15).to_string())
+        print(f"\nMismatch Details:")
+        list_mismatches(valid_mismatches, ['Aircraft_Reg', 'Distance_Rounded', 'MTOW_tons', 'Unit_Rate_mapped',
+                                           'Calculated_Charge', 'Vendor_Charge', 'Difference'])
         
         print(f"\nDifference Analysis (valid mismatches):")
         print(f"  Total valid mismatches: {len(valid_mismatches)}")
@@ -272,12 +238,17 @@ if len(mismatches) > 0:
         print(f"  Total vendor difference: {valid_mismatches['Vendor_Charge'].sum():.2f}")
 
 # Save results
-output_file = "1900374834_Verified.csv"
+stage('write', rows=len(df_working))
+output_file = output_path("1900374834_Verified.csv")
 
 output_cols = ['Aircraft_Reg', 'Distance_km', 'Distance_Rounded', 'MTOW_tons', 
-               'Unit_Rate_mapped', 'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status']
-df_output = df_working[output_cols].copy()
+               'Unit_Rate_mapped', 'Calculated_Charge', 'Vendor_Charge', 'Difference', 'Status',
+               'GC_Distance_km', 'Distance_Flag']
+df_output = df_working[output_cols]
 df_output.to_csv(output_file, index=False)
+record_results('Russia', df_output.assign(Flight_Date=df_working.get(vendor_columns['date'])), vendor_file)
 
 print(f"\n\nResults saved to: {os.path.abspath(output_file)}")
 print("="*100)
+
+result_line('Russia', df_output['Status'], os.path.abspath(output_file))
@@ -1,66 +1,96 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from overflight.frames import working_frame
+from overflight.stages import stage
+from overflight.matching import compare_charges
+from overflight.distance import check_distance, distance_line
+from overflight.formulas import compile_formula, evaluate_formula
+from overflight.invoices import invoice_path, output_path
+from overflight.report import configure_report, list_mismatches, preview, result_line
+from overflight.results import record_results
+
+configure_report()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Read the CSV file
-csv_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\YYZ\CS434278DE.csv"
+stage('load')
+csv_file = invoice_path(os.path.join(BASE_DIR, "CS434278DE.csv"))
 df = pd.read_csv(csv_file)
 
 # Filter for Overflight rows only
-overflight_df = df[df['SERVDESC'].str.contains('Overflight', case=False, na=False)].copy()
+overflight_df = working_frame(df, df['SERVDESC'].str.contains('Overflight', case=False, na=False))
 
 print(f"Total rows in file: {len(df)}")
 print(f"Overflight rows found: {len(overflight_df)}")
 print("\n" + "="*80)
 
-# Define constants
-UNIT_RATE = 0.03524
-
 # Calculate expected charges using formula: BILLDIST × Weight Factor × 0.03524
 # The formula uses billing distance (distance flown) × weight factor × unit rate
-overflight_df['CALCULATED_CHARGE'] = overflight_df['BILLDIST'] * overflight_df['WEIGHT FACTOR'] * UNIT_RATE
-
-# Round to 2 decimal places for comparison
-overflight_df['CALCULATED_CHARGE'] = overflight_df['CALCULATED_CHARGE'].round(2)
+stage('compute', rows=len(overflight_df))
+# (rounded to 2 decimal places for comparison - see overflight.formulas)
+charges = evaluate_formula(
+    compile_formula('YYZ'),
+    distance=overflight_df['BILLDIST'],
+    weight_factor=overflight_df['WEIGHT FACTOR'],
+)
+overflight_df['CALCULATED_CHARGE'] = charges['charge']
 
 # Allow for small rounding differences (tolerance of 0.01)
-tolerance = 0.01
-overflight_df['VERIFICATION_STATUS'] = overflight_df.apply(
-    lambda row: 'Matched' if abs(row['TOTAL'] - row['CALCULATED_CHARGE']) <= tolerance else 'Not Matched',
-    axis=1
+stage('compare', rows=len(overflight_df))
+_, overflight_df['VERIFICATION_STATUS'] = compare_charges(
+    overflight_df['CALCULATED_CHARGE'], overflight_df['TOTAL'], station='YYZ'
 )
 
+# Cross-check BILLDIST against the great-circle distance of the route (see overflight.distance)
+checked = check_distance(overflight_df['DEPART'], overflight_df['DEST'], overflight_df['BILLDIST'],
+                         unit='km', station='YYZ')
+overflight_df['GC_DISTANCE_KM'] = checked['GC_Distance_km']
+overflight_df['DISTANCE_FLAG'] = checked['Distance_Flag']
+
 # Create a verification report
 result_df = overflight_df[['UTC_DATE', 'FLIGHT_ID', 'AC_IDENT', 'MTOW', 'WEIGHT FACTOR', 
-                            'BILLDIST', 'AMOUNT', 'TOTAL', 'CALCULATED_CHARGE', 'VERIFICATION_STATUS']]
+                            'BILLDIST', 'AMOUNT', 'TOTAL', 'CALCULATED_CHARGE', 'VERIFICATION_STATUS',
+                            'GC_DISTANCE_KM', 'DISTANCE_FLAG']]
 
 # Display summary statistics
 print("\nVERIFICATION SUMMARY")
 print("="*80)
 matched = (result_df['VERIFICATION_STATUS'] == 'Matched').sum()
 not_matched = (result_df['VERIFICATION_STATUS'] == 'Not Matched').sum()
+missing = (result_df['VERIFICATION_STATUS'] == 'Missing Input').sum()
 
 print(f"Matched:     {matched}")
 print(f"Not Matched: {not_matched}")
+print(f"Missing Input: {missing}")
 print(f"Total:       {len(result_df)}")
+distance_line(checked, station='YYZ')
 print("\n" + "="*80)
 
 # Display detailed results
 print("\nDETAILED VERIFICATION RESULTS:")
 print("="*80)
-print(result_df.to_string(index=False))
+preview(result_df, index=False)
 
 # Save the results to a new CSV file
-output_file = r"c:\Users\Anurag\Downloads\Assignment\Assignment\YYZ\Overflight_Verification_Results.csv"
+stage('write', rows=len(result_df))
+output_file = output_path(os.path.join(BASE_DIR, "Overflight_Verification_Results.csv"))
 result_df.to_csv(output_file, index=False)
+record_results('YYZ', result_df, csv_file)
 print(f"\n\nResults saved to: {output_file}")
 
 # Display mismatches if any
 print("\n" + "="*80)
-if not_matched > 0:
-    print(f"\n FOUND {not_matched} MISMATCHES:")
+if not_matched + missing > 0:
+    print(f"\n FOUND {not_matched} MISMATCHES, {missing} MISSING INPUT:")
     print("="*80)
-    mismatches = result_df[result_df['VERIFICATION_STATUS'] == 'Not Matched']
-    print(mismatches.to_string(index=False))
+    mismatches = result_df[result_df['VERIFICATION_STATUS'] != 'Matched']
+    list_mismatches(mismatches, index=False)
 else:
     print("\n All charges matched successfully!")
+
+result_line('YYZ', result_df['VERIFICATION_STATUS'], output_file)
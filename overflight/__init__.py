@@ -0,0 +1 @@
+"""Shared helpers used by the station verify_charges.py scripts"""
@@ -0,0 +1,103 @@
+"""Airport codes resolved to one integer airport id, IATA or ICAO alike
+
+Vendors write airports as 3-letter IATA codes (DOH: BOM, DMM) or 4-letter
+ICAO codes (AUH: VIDP, OTHH). The airport table in masters/airports.csv
+is compiled once per process into an index where both codes of an
+airport resolve to the same id, its row in the table:
+
+    index = airport_index()
+    ids = index.encode(df['To'])          # VIDP and DEL give the same id
+    df['TO_ID'] = ids                     # small integer column (-1: unknown)
+    df['TO_IATA'] = index.iata(ids)
+    landed = ids == index.code_id('AUH')  # OMAA in the vendor file
+
+A whole column is encoded in one vectorized lookup, and route columns
+kept as ids take a fraction of the memory of repeated code strings and
+join and compare as plain integers.
+"""
+import numpy as np
+import pandas as pd
+
+from overflight.cache import file_hash
+from overflight.store import AIRPORTS_FILE, load_airports
+
+UNKNOWN = -1  # id of a code that is not in the table
+
+_indexes = {}  # airports file hash -> AirportIndex
+
+
+def normalize_codes(codes):
+    """Airport codes as upper-case strings without spaces ('' where missing)"""
+    return pd.Series(codes, dtype=object).astype('string').str.strip().str.upper().fillna('')
+
+
+class AirportIndex:
+    """Bidirectional IATA / ICAO code index over the airport table"""
+
+    def __init__(self, airports):
+        self.airports = airports.reset_index(drop=True)
+        self.dtype = np.int16 if len(self.airports) < np.iinfo(np.int16).max else np.int32
+        self._iata = normalize_codes(self.airports['IATA']).to_numpy(dtype=object)
+        self._icao = normalize_codes(self.airports['ICAO']).to_numpy(dtype=object)
+        self._names = self.airports['Airport'].to_numpy(dtype=object)
+        self._countries = normalize_codes(self.airports['Country_Code']).to_numpy(dtype=object)
+
+        # ICAO (4 letters) and IATA (3 letters) codes never collide; the
+        # first airport listed wins where a code appears twice
+        ids = np.arange(len(self.airports), dtype=self.dtype)
+        codes = pd.concat([pd.Series(ids, index=self._icao), pd.Series(ids, index=self._iata)])
+        codes = codes[codes.index != '']
+        codes = codes[~codes.index.duplicated()]
+        self.codes = codes.index
+        self._ids = codes.to_numpy()
+
+    def __len__(self):
+        return len(self.airports)
+
+    def encode(self, codes):
+        """Airport id of every IATA or ICAO code (UNKNOWN where the code is not in the table)"""
+        # Only the distinct codes are cleaned and looked up; the column takes their ids
+        labels, uniques = pd.factorize(pd.Series(codes, dtype=object))
+        positions = self.codes.get_indexer(normalize_codes(uniques))
+        ids = np.where(positions >= 0, self._ids[positions], UNKNOWN).astype(self.dtype)
+        return np.append(ids, self.dtype(UNKNOWN))[labels]  # label -1 (missing) -> UNKNOWN
+
+    def code_id(self, code):
+        """Airport id of a single code (KeyError if it is not in the table)"""
+        airport_id = self.encode([code])[0]
+        if airport_id == UNKNOWN:
+            raise KeyError(f"Unknown airport code {code}")
+        return airport_id
+
+    def _decode(self, ids, values):
+        index = ids.index if isinstance(ids, pd.Series) else None
+        ids = np.asarray(ids)
+        known = ids >= 0
+        decoded = np.full(len(ids), None, dtype=object)
+        decoded[known] = values[ids[known]]
+        decoded[decoded == ''] = None
+        return pd.Series(decoded, index=index, dtype='string')
+
+    def iata(self, ids):
+        """IATA code of every airport id (missing where unknown or not assigned)"""
+        return self._decode(ids, self._iata)
+
+    def icao(self, ids):
+        """ICAO code of every airport id (missing where unknown or not assigned)"""
+        return self._decode(ids, self._icao)
+
+    def name(self, ids):
+        """Airport name of every airport id"""
+        return self._decode(ids, self._names)
+
+    def country(self, ids):
+        """ISO country code of every airport id (missing where unknown)"""
+        return self._decode(ids, self._countries)
+
+
+def airport_index():
+    """The airport code index, built once per process (again if the table changes)"""
+    key = file_hash(AIRPORTS_FILE)
+    if key not in _indexes:
+        _indexes[key] = AirportIndex(load_airports())
+    return _indexes[key]
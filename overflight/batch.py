@@ -0,0 +1,176 @@
+"""Run the verify_charges.py script of every station in parallel
+
+Usage:
+    python -m overflight.batch
+    python -m overflight.batch --stations ASB DOH JED --workers 4
+
+Each station runs in a worker process from its own directory (so scripts
+that open files by relative name keep working) and its console output goes to
+<STATION>/verify_charges.log. Each worker loads the master store once
+when it starts; the stations it then runs share those in-memory masters.
+A consolidated Batch_Summary.csv is written to the repository root.
+"""
+import argparse
+import contextlib
+import glob
+import os
+import runpy
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from overflight.manifest import load_manifest, station_files
+from overflight.matching import MATCHED, MISSING_INPUT, NOT_MATCHED, status_counts
+from overflight.stages import reset_stages, trace_enabled, write_trace
+from overflight.store import preload_masters
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_NAME = 'verify_charges.py'
+LOG_NAME = 'verify_charges.log'
+SUMMARY_FILE = 'Batch_Summary.csv'
+SUMMARY_COLUMNS = ['Station', 'Status', 'Output_File', 'Records', 'Matched',
+                   'Not_Matched', 'Missing_Input', 'Seconds', 'Error']
+
+
+def find_stations(root=ROOT_DIR):
+    """Find every station directory that has a verify_charges.py script"""
+    scripts = glob.glob(os.path.join(root, '*', SCRIPT_NAME))
+    return sorted(os.path.basename(os.path.dirname(script)) for script in scripts)
+
+
+def find_status_column(df):
+    """Find the Status / STATUS / VERIFICATION_STATUS column of a results file"""
+    for col in df.columns:
+        if str(col).strip().upper().endswith('STATUS'):
+            return col
+    return None
+
+
+def summarize_output(output_file):
+    """Count records and matches in a verified output file"""
+    df = pd.read_csv(output_file)
+    status_col = find_status_column(df)
+    if status_col is None:
+        return {'Records': len(df), 'Matched': None, 'Not_Matched': None, 'Missing_Input': None}
+    counts = status_counts(df[status_col].astype('string').str.strip())
+    return {
+        'Records': len(df),
+        'Matched': counts[MATCHED],
+        'Not_Matched': counts[NOT_MATCHED],
+        'Missing_Input': counts[MISSING_INPUT],
+    }
+
+
+def run_station(station, root=ROOT_DIR, args=(), log_file=LOG_NAME, output_file=None):
+    """Run one station script inside the current worker process
+
+    args are passed to the script on its command line (e.g. --invoice);
+    output_file is where the script was told to write, when it was told.
+    """
+    station_dir = os.path.join(root, station)
+    script = os.path.join(station_dir, SCRIPT_NAME)
+    row = {col: None for col in SUMMARY_COLUMNS}
+    row['Station'] = station
+
+    started = time.time()
+    previous_dir, previous_argv = os.getcwd(), sys.argv
+    os.chdir(station_dir)
+    sys.argv = [script] + list(args)
+    reset_stages()
+    try:
+        with open(log_file, 'w', encoding='utf-8') as log, \
+                contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            try:
+                runpy.run_path(script, run_name='__main__')
+                row['Status'] = 'OK'
+            except SystemExit as e:
+                # Scripts call exit() when an input file is missing
+                row['Status'] = 'OK' if e.code in (None, 0) else 'Failed'
+                if e.code not in (None, 0):
+                    row['Error'] = f"exit({e.code})"
+            except Exception as e:
+                row['Status'] = 'Failed'
+                row['Error'] = f"{type(e).__name__}: {e}"
+                traceback.print_exc()
+            if trace_enabled():
+                try:
+                    write_trace(station=station)
+                except OSError as e:
+                    print(f"Could not write stage trace: {e}")
+    finally:
+        os.chdir(previous_dir)
+        sys.argv = previous_argv
+    row['Seconds'] = round(time.time() - started, 2)
+
+    # Output = the results file the script wrote during this run
+    candidates = [output_file] if output_file else station_files(load_manifest(station_dir), 'output')
+    outputs = [f for f in candidates if os.path.exists(f) and os.path.getmtime(f) >= started - 1]
+    if outputs:
+        output_file = max(outputs, key=os.path.getmtime)
+        row['Output_File'] = os.path.relpath(output_file, root)
+        try:
+            row.update(summarize_output(output_file))
+        except Exception as e:
+            row['Error'] = row['Error'] or f"Could not read output: {e}"
+    elif row['Status'] == 'OK':
+        row['Status'] = 'No Output'
+    return row
+
+
+def run_batch(stations=None, workers=None, root=ROOT_DIR):
+    """Run many stations on a process pool and return the summary frame"""
+    if not stations:
+        stations = find_stations(root)
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(stations)))
+
+    print(f"Running {len(stations)} stations on {workers} workers...")
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=preload_masters, initargs=(root,)) as pool:
+        futures = {pool.submit(run_station, station, root): station for station in stations}
+        for future in as_completed(futures):
+            station = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                row = {col: None for col in SUMMARY_COLUMNS}
+                row.update({'Station': station, 'Status': 'Failed', 'Error': str(e)})
+            rows.append(row)
+            print(f"  {station:<35} {row['Status']:<10} {row['Seconds'] or 0:>7.2f}s")
+
+    summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS).sort_values('Station').reset_index(drop=True)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify every station's charges in parallel")
+    parser.add_argument('--stations', nargs='+', help="Station directories to run (default: all)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: all cores)")
+    parser.add_argument('--root', default=ROOT_DIR, help="Directory that holds the station folders")
+    args = parser.parse_args(argv)
+
+    root = os.path.abspath(args.root)
+    stations = args.stations or find_stations(root)
+    missing = [s for s in stations if not os.path.isfile(os.path.join(root, s, SCRIPT_NAME))]
+    if missing:
+        print(f"ERROR: No {SCRIPT_NAME} for: {', '.join(missing)}")
+        return 1
+
+    summary = run_batch(stations, args.workers, root)
+
+    print("\n" + "=" * 80)
+    print("BATCH SUMMARY")
+    print("=" * 80)
+    print(summary.to_string(index=False))
+
+    summary_file = os.path.join(root, SUMMARY_FILE)
+    summary.to_csv(summary_file, index=False)
+    print(f"\nSummary saved to: {summary_file}")
+    return 0 if (summary['Status'] != 'Failed').all() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
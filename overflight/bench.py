@@ -0,0 +1,213 @@
+"""Synthetic scale benchmark for the station scripts
+
+Usage:
+    python -m overflight.bench
+    python -m overflight.bench --stations YYZ MCT RGN --rows 1000 100000
+
+For every station and size a synthetic vendor file is built in the
+station's real layout: the real header row(s) are kept as they are, the
+real data records (multi-line cells, "@ UOM" cells, padded columns,
+repeated page headers and all) are repeated until the file has the
+requested number of rows, and trailing total rows are kept at the end.
+The station script then runs on a scratch copy of its folder in its own
+process, and the time spent in each stage (see overflight.stages) is
+recorded. Results are printed and saved to Benchmark_Results.csv.
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from overflight.stages import STAGES
+from overflight.store import master_kind
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = 'Benchmark_Results.csv'
+DEFAULT_ROWS = [1_000, 100_000, 1_000_000]
+DEFAULT_TIMEOUT = 600
+
+# Vendor file each station script reads
+VENDOR_FILES = {
+    'ASB': 'Vendor Master.csv',
+    'AUH': '1900373598.csv',
+    'CMB': 'Vendor data.csv',
+    'DAC': 'Vendor data.csv',
+    'DOH': 'Vendor Data.csv',
+    'EGYPT(No Data in vendor master)': 'Vendor data.csv',
+    'IKA': '1900357153.csv',
+    'JED': 'Vendor Master.csv',
+    'KAZ': 'Vendor Master.csv',
+    'LHE': 'Vendor Master.csv',
+    'LHR': '1900374945.csv',
+    'MCT': 'MDETLST-0320860591.csv',
+    'MGQ': '0320746474.csv',
+    'PNH': 'Vendor Master.csv',
+    'RGN': '1900077514 annexure.csv',
+    'Russia': '1900374834.csv',
+    'SGN': '00003015 vietnam.csv',
+    'YYZ': 'CS434278DE.csv',
+}
+
+RESULT_COLUMNS = ['Station', 'Rows', 'Status'] + [s.capitalize() for s in STAGES] + ['Total', 'CPU', 'Peak_MB', 'Error']
+
+
+def is_footer(record):
+    """Blank records and total / subtotal lines at the end of a vendor file"""
+    cells = [cell.strip().lower() for cell in record]
+    return not any(cells) or any('total' in cell for cell in cells)
+
+
+def split_vendor_file(path):
+    """Split a vendor CSV into (header, data, footer) records and the encoding"""
+    with open(path, 'rb') as f:
+        encoding = 'utf-8-sig' if f.read(3) == b'\xef\xbb\xbf' else 'utf-8'
+    with open(path, newline='', encoding=encoding) as f:
+        records = list(csv.reader(f))
+
+    header, body = records[:1], records[1:]
+    end = len(body)
+    while end > 0 and is_footer(body[end - 1]):
+        end -= 1
+    data, footer = body[:end], body[end:]
+    return header, data, footer, encoding
+
+
+def write_synthetic_vendor_file(source, target, rows):
+    """Write a vendor file with the layout of source and `rows` data records"""
+    header, data, footer, encoding = split_vendor_file(source)
+    if not data:
+        raise ValueError(f"No data records in {source}")
+    with open(target, 'w', newline='', encoding=encoding) as f:
+        writer = csv.writer(f)
+        writer.writerows(header)
+        for start in range(0, rows, len(data)):
+            writer.writerows(data[:rows - start])
+        writer.writerows(footer)
+
+
+def run_child(station, station_dir, trace_file):
+    """Run a station script in this process and write its stage trace"""
+    import contextlib
+    import runpy
+
+    from overflight.stages import write_trace
+
+    script = os.path.join(station_dir, 'verify_charges.py')
+    os.chdir(station_dir)
+    sys.argv = [script]
+    started = time.perf_counter()
+    with open('benchmark.log', 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        runpy.run_path(script, run_name='__main__')
+    total = time.perf_counter() - started
+    write_trace(trace_file, station)
+    with open(trace_file) as f:
+        trace = json.load(f)
+    trace['total'] = total
+    with open(trace_file, 'w') as f:
+        json.dump(trace, f, indent=2)
+
+
+def link_or_copy(source, target):
+    """Symlink a shared folder into the scratch root, copying where links are not allowed"""
+    try:
+        os.symlink(source, target, target_is_directory=True)
+    except OSError:
+        shutil.copytree(source, target)
+
+
+def bench_station(station, rows, timeout=DEFAULT_TIMEOUT, root=ROOT_DIR):
+    """Benchmark one station at one size; returns a result row"""
+    row = {col: None for col in RESULT_COLUMNS}
+    row.update({'Station': station, 'Rows': rows})
+
+    scratch = tempfile.mkdtemp(prefix='overflight-bench-')
+    try:
+        for shared in ('overflight', 'masters'):
+            link_or_copy(os.path.join(root, shared), os.path.join(scratch, shared))
+        # Only the script, the vendor file and the masters: earlier results
+        # must not be picked up by the scripts that glob("*.csv")
+        station_dir = os.path.join(scratch, station)
+        shutil.copytree(os.path.join(root, station), station_dir, ignore=lambda folder, names: [
+            name for name in names
+            if name.endswith('.csv') and name != VENDOR_FILES[station] and master_kind(name) is None
+        ])
+
+        vendor_file = os.path.join(station_dir, VENDOR_FILES[station])
+        write_synthetic_vendor_file(os.path.join(root, station, VENDOR_FILES[station]), vendor_file, rows)
+
+        trace_file = os.path.join(scratch, 'trace.json')
+        command = [sys.executable, '-c',
+                   'import sys; from overflight.bench import run_child; run_child(*sys.argv[1:4])',
+                   station, station_dir, trace_file]
+        # Every run verifies every row: results cached by earlier runs would hide the cost.
+        # The trace goes to the scratch folder only, not to the station's run history,
+        # and synthetic lines stay out of the results dataset.
+        env = dict(os.environ, OVERFLIGHT_INCREMENTAL='0', OVERFLIGHT_TRACE='0', OVERFLIGHT_RESULTS='0')
+        try:
+            result = subprocess.run(command, cwd=scratch, env=env, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            row.update({'Status': 'Timeout', 'Error': f"over {timeout}s"})
+            return row
+
+        if result.returncode != 0 or not os.path.exists(trace_file):
+            last_line = (result.stderr.strip().splitlines() or ['exit code %d' % result.returncode])[-1]
+            row.update({'Status': 'Failed', 'Error': last_line})
+            return row
+
+        with open(trace_file) as f:
+            trace = json.load(f)
+        row['Status'] = 'OK'
+        for name in STAGES:
+            row[name.capitalize()] = round(trace['stages'].get(name, {}).get('wall', 0.0), 3)
+        row['Total'] = round(trace['total'], 3)
+        row['CPU'] = round(trace['cpu'], 3)
+        row['Peak_MB'] = None if trace.get('peak_mb') is None else round(trace['peak_mb'], 1)
+        return row
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every station on synthetic vendor files")
+    parser.add_argument('--stations', nargs='+', default=sorted(VENDOR_FILES), help="Stations to benchmark (default: all)")
+    parser.add_argument('--rows', nargs='+', type=int, default=DEFAULT_ROWS, help="Vendor file sizes in data rows")
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT, help="Seconds allowed per run")
+    args = parser.parse_args(argv)
+
+    unknown = [s for s in args.stations if s not in VENDOR_FILES]
+    if unknown:
+        print(f"ERROR: No vendor file known for: {', '.join(unknown)}")
+        return 1
+
+    rows = []
+    for station in args.stations:
+        # Larger sizes are skipped once a station has failed or timed out
+        for size in sorted(args.rows):
+            row = bench_station(station, size, args.timeout)
+            rows.append(row)
+            total = f"{row['Total']:.2f}s" if row['Total'] is not None else row['Error']
+            print(f"  {station:<35} {size:>9} rows  {row['Status']:<8} {total}")
+            if row['Status'] != 'OK':
+                break
+
+    results = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    print("\n" + "=" * 100)
+    print("BENCHMARK RESULTS (seconds per stage)")
+    print("=" * 100)
+    print(results.to_string(index=False))
+
+    results_file = os.path.join(ROOT_DIR, RESULTS_FILE)
+    results.to_csv(results_file, index=False)
+    print(f"\nResults saved to: {results_file}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Binary cache for parsed master files, keyed by the CSV's content hash
+
+The first read of a master parses the CSV and stores the resulting frame
+under CACHE_DIR as Parquet, a columnar format that only holds data.
+Later reads of a file with the same bytes load that file instead of
+parsing again. Editing the CSV changes its hash, and editing the module
+of the reader that parsed it changes its code hash, so a stale entry is
+never used.
+
+Parquet needs pyarrow. Without it, frames are cached as pickles: Python
+object serialization, which runs whatever code the file holds when it is
+loaded. Keep CACHE_DIR (OVERFLIGHT_CACHE_DIR) writable only by the users
+who run the scripts. With pyarrow installed, pickles are never loaded.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # optional: cache as pickles without pyarrow
+    pq = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.environ.get('OVERFLIGHT_CACHE_DIR', os.path.join(ROOT_DIR, '.master_cache'))
+
+# Bump when the cached layout changes so old entries are ignored
+CACHE_VERSION = 1
+
+# File suffix of cached frames: Parquet where pyarrow is installed, else pickle
+FRAME_SUFFIX = '.parquet' if pq is not None else '.pkl'
+
+_code_hashes = {}  # module name -> hash of its source file
+
+
+def file_hash(path, block_size=1 << 20):
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def reader_code_hash(reader):
+    """Hash of the source file of the reader's module ('' where it has none)
+
+    Covers the reader and every helper in its module, so changing how a
+    master is parsed invalidates the entries parsed the old way.
+    """
+    module = reader.__module__
+    if module not in _code_hashes:
+        source = getattr(sys.modules.get(module), '__file__', None)
+        _code_hashes[module] = file_hash(source)[:16] if source and os.path.exists(source) else ''
+    return _code_hashes[module]
+
+
+def cache_key(path, reader=pd.read_csv, **read_kwargs):
+    """Cache key for a file, the reader (name and code) and the options used to parse it"""
+    options = json.dumps(read_kwargs, sort_keys=True, default=repr)
+    reader_name = f"{reader.__module__}.{reader.__qualname__}"
+    options_hash = hashlib.sha256(
+        f"{CACHE_VERSION}:{pd.__version__}:{reader_name}:{reader_code_hash(reader)}:{options}".encode()
+    ).hexdigest()
+    return f"{file_hash(path)[:32]}-{options_hash[:12]}"
+
+
+def read_master_csv(path, use_cache=True, **read_kwargs):
+    """Read a master CSV through the content-hash cache
+
+    Returns the same frame as pd.read_csv(path, **read_kwargs). Identical
+    files in different station folders share one cache entry.
+    """
+    return cached_read(path, pd.read_csv, use_cache, **read_kwargs)
+
+
+def read_frame(cache_file):
+    """A cached frame, or None when there is none or it cannot be read"""
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        if pq is not None:
+            return pd.read_parquet(cache_file, engine='pyarrow')
+        return pd.read_pickle(cache_file)
+    except Exception:
+        return None  # Unreadable entry (e.g. interrupted write): parse again
+
+
+def write_frame(df, cache_file):
+    """Store a frame in the cache; raises OSError when it cannot be written"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write then rename, so parallel stations never see a partial file
+    fd, tmp_file = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    os.close(fd)
+    try:
+        if pq is not None:
+            df.to_parquet(tmp_file, engine='pyarrow')
+        else:
+            df.to_pickle(tmp_file)
+    except Exception as e:
+        os.remove(tmp_file)
+        # e.g. a column Arrow cannot type; the frame is simply not cached
+        raise OSError(f"not cacheable as {FRAME_SUFFIX[1:]}: {e}") from e
+    os.replace(tmp_file, cache_file)
+
+
+def cached_read(path, reader, use_cache=True, **read_kwargs):
+    """Call reader(path, **read_kwargs) through the content-hash cache"""
+    if not use_cache:
+        return reader(path, **read_kwargs)
+
+    cache_file = os.path.join(CACHE_DIR, cache_key(path, reader, **read_kwargs) + FRAME_SUFFIX)
+    df = read_frame(cache_file)
+    if df is not None:
+        return df
+
+    df = reader(path, **read_kwargs)
+    try:
+        write_frame(df, cache_file)
+    except OSError as e:
+        print(f"  Warning: could not cache {os.path.basename(path)}: {e}")
+    return df
+
+
+def clear_cache():
+    """Delete every cached master, file manifest and column layout, returning how many files were removed"""
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(('.pkl', '.parquet', '.tmp')) or (name.startswith(('manifest-', 'columns-')) and name.endswith('.json')):
+            os.remove(os.path.join(CACHE_DIR, name))
+            removed += 1
+    return removed
@@ -0,0 +1,46 @@
+"""Repeated strings of a working frame as categorical (dictionary-encoded) columns
+
+Registrations, aircraft types, callsigns, airport codes, flight types and
+statuses repeat thousands of times in a vendor file. As categoricals each
+distinct string is stored once and every row holds a small integer code,
+so the frame takes several times less memory, and comparisons, group-bys
+and lookups work on the codes (overflight.mtow and overflight.parsing
+only clean and look up the distinct values of a categorical column).
+Categoricals are written to CSV as their strings, so outputs do not change.
+
+    df_working = encode_categories(df_vendor.copy(deep=False))      # every repetitive string column
+    df_working = encode_categories(df_working, ['Acft. Reg.', 'Acft. Type Code'])
+"""
+import pandas as pd
+
+# A string column is encoded when its distinct values are at most this share of its rows
+DEFAULT_MAX_RATIO = 0.5
+
+
+def is_text_column(values):
+    """True for object / string columns (not yet categorical)"""
+    return not isinstance(values.dtype, pd.CategoricalDtype) and (
+        values.dtype == object or pd.api.types.is_string_dtype(values.dtype))
+
+
+def encode_categories(df, columns=None, max_ratio=DEFAULT_MAX_RATIO):
+    """Convert repeated string columns to categoricals; returns the frame
+
+    columns names the columns to encode (names not in the frame are
+    skipped); by default every string column whose distinct values are at
+    most max_ratio of its rows is encoded.
+    """
+    names = df.columns if columns is None else [col for col in columns if col in df.columns]
+    for col in names:
+        values = df[col]
+        if not isinstance(values, pd.Series) or not is_text_column(values):
+            continue  # duplicate column names, numbers, already encoded
+        if columns is None and values.nunique() > max_ratio * len(values):
+            continue
+        df[col] = values.astype('category')
+    return df
+
+
+def memory_mb(df):
+    """Memory of a frame in MB, strings included"""
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
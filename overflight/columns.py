@@ -0,0 +1,205 @@
+"""Vendor column roles, detected once per header layout
+
+Stations find the registration, distance, MTOW, charge and flight date
+columns of a vendor file by name fragments. The rules are written down per station in
+STATION_COLUMN_RULES: each role has a list of rules tried in order, and
+the first rule that matches a column decides. A rule matches a column
+when its normalized name (lower case, single spaces) satisfies every key:
+
+    all      - every fragment is in the name
+    any      - at least one fragment is in the name
+    none     - no fragment is in the name
+    equals   - the name is one of these
+    either   - a list of rules, one of which matches
+    numeric  - the column has a numeric dtype
+    last     - take the last matching column instead of the first
+
+The result is cached under a hash of the normalized header, which columns
+are numeric (the numeric rules depend on it) and the station's rules, so later invoices in a known layout resolve without
+running the rules, and always to the same columns. The cache holds
+column positions and lives in the master cache directory.
+
+    columns = resolve_columns(df_working, 'KAZ')
+    reg_col = columns['registration']
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from overflight.cache import CACHE_DIR
+
+# Bump when the rule semantics change so cached layouts are ignored
+RULES_VERSION = 1
+
+# Registration and charge rules shared by the flat-rate stations
+_FLAT_RATE_ROLES = {
+    'registration': [
+        {'all': ['reg', 'no']},
+        {'any': ['reg', 'aircraft']},
+    ],
+    'charge': [
+        {'any': ['charge', 'cost', 'amount', 'total'], 'none': ['holiday', 'ot', 'vat']},
+        # Fallback: the last numeric column
+        {'numeric': True, 'last': True},
+    ],
+    'date': [{'all': ['date']}],
+}
+
+# Per-station column rules
+STATION_COLUMN_RULES = {
+    'KAZ': {
+        **_FLAT_RATE_ROLES,
+        'mtow': [{'all': ['mtow']}],
+        'distance': [{'either': [{'equals': ['dist']}, {'all': ['distance', 'km']}]}],
+        'origin': [{'equals': ['from']}],
+        'destination': [{'equals': ['to']}],
+    },
+    'LHE': {
+        **_FLAT_RATE_ROLES,
+        'distance': [{'all': ['distance', 'km']}],
+    },
+    'MGQ': _FLAT_RATE_ROLES,
+    'RGN': _FLAT_RATE_ROLES,
+    'LHR': {
+        'nats_charge': [{'all': ['nats', 'core']}],
+        'satellite_charge': [{'all': ['satellite', 'data']}],
+        'charge': [{'all': ['total', 'charge']}],
+        'date': [{'equals': ['date']}],
+    },
+    'CMB': {
+        'distance': [{'all': ['distance', 'nm']}, {'all': ['distance']}],
+        'mtow': [{'all': ['mtow', 'ton']}],
+        'origin': [{'equals': ['from']}],
+        'destination': [{'equals': ['to']}],
+        'date': [{'equals': ['date']}],
+    },
+    'DAC': {
+        'charge': [{'any': ['rnc', 'usd']}],
+        'registration': [{'any': ['regn', 'registration', 'acft_reg'], 'last': True}],
+        'mtow': [{'all': ['mtow', 'kg'], 'last': True}],
+        'date': [{'all': ['date']}],
+    },
+    'EGYPT': {
+        'distance': [{'any': ['dist', 'km']}],
+        'charge': [{'any': ['charge', 'cost', 'price']}],
+    },
+    'RUSSIA': {
+        'distance': [{'all': ['distance', 'km'], 'last': True}],
+        'mtow': [{'all': ['mtow'], 'any': ['tons', 'ton'], 'last': True}],
+        'charge': [{'all': ['en-route', 'amount', 'usd'], 'last': True}],
+        'registration': [{'any': ['registration', 'registr'], 'last': True}],
+        'origin': [{'all': ['departure', 'airport']}],
+        'destination': [{'all': ['airport'], 'any': ['destination', 'destina-tion']}],
+        'date': [{'all': ['date', 'flight']}],
+    },
+}
+
+_layouts = {}  # header signature -> {role: column position or None}
+
+
+def get_column_rules(station):
+    """Get the column rules of a station"""
+    key = str(station).upper()
+    if key not in STATION_COLUMN_RULES:
+        raise KeyError(f"No column rules defined for station {station}")
+    return STATION_COLUMN_RULES[key]
+
+
+def normalize_header(name):
+    """Lower case, non-breaking spaces and line breaks as single spaces"""
+    return re.sub(r'\s+', ' ', str(name).replace('\xa0', ' ')).strip().lower()
+
+
+def numeric_columns(df):
+    """True for every column with a numeric dtype, in column order"""
+    return [getattr(dtype, 'kind', 'O') in 'iuf' for dtype in df.dtypes]
+
+
+def header_signature(columns, rules, numeric=None):
+    """Hash of a normalized header layout, its numeric columns and the rules applied to it"""
+    names = [normalize_header(col) for col in columns]
+    numeric = [bool(flag) for flag in numeric] if numeric is not None else None
+    payload = json.dumps([RULES_VERSION, rules, names, numeric], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _rule_matches(name, is_numeric, rule):
+    if 'either' in rule and not any(_rule_matches(name, is_numeric, r) for r in rule['either']):
+        return False
+    if 'all' in rule and not all(fragment in name for fragment in rule['all']):
+        return False
+    if 'any' in rule and not any(fragment in name for fragment in rule['any']):
+        return False
+    if 'none' in rule and any(fragment in name for fragment in rule['none']):
+        return False
+    if 'equals' in rule and name not in rule['equals']:
+        return False
+    if rule.get('numeric') and not is_numeric:
+        return False
+    return True
+
+
+def detect_columns(df, rules):
+    """Run the rules on a frame's header; returns {role: column position or None}"""
+    names = [normalize_header(col) for col in df.columns]
+    numeric = numeric_columns(df)
+    positions = {}
+    for role, role_rules in rules.items():
+        positions[role] = None
+        for rule in role_rules:
+            matches = [i for i, name in enumerate(names) if _rule_matches(name, numeric[i], rule)]
+            if matches:
+                positions[role] = matches[-1] if rule.get('last') else matches[0]
+                break
+    return positions
+
+
+def _cache_file(signature):
+    return os.path.join(CACHE_DIR, f"columns-{signature[:32]}.json")
+
+
+def _load_layout(signature, roles):
+    try:
+        with open(_cache_file(signature), encoding='utf-8') as f:
+            layout = json.load(f)
+    except (OSError, ValueError):
+        return None
+    positions = layout.get('positions', {})
+    return positions if set(positions) == set(roles) else None
+
+
+def _save_layout(signature, station, columns, positions):
+    layout = {
+        'station': station,
+        'header': [str(col) for col in columns],
+        'positions': positions,
+        'columns': {role: None if i is None else str(columns[i]) for role, i in positions.items()},
+    }
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(layout, f, indent=2)
+        os.replace(tmp_file, _cache_file(signature))
+    except OSError as e:
+        print(f"  Warning: could not cache the column layout of {station}: {e}")
+
+
+def resolve_columns(df, station, rules=None):
+    """Column name per role for a vendor frame (None where no column matches)
+
+    A header layout seen before resolves from the cache; an unseen one runs
+    the station's rules once and is cached for the next invoice.
+    """
+    rules = get_column_rules(station) if rules is None else rules
+    signature = header_signature(df.columns, rules, numeric_columns(df))
+    positions = _layouts.get(signature)
+    if positions is None:
+        positions = _load_layout(signature, rules)
+        if positions is None:
+            positions = detect_columns(df, rules)
+            _save_layout(signature, str(station), list(df.columns), positions)
+        _layouts[signature] = positions
+    return {role: None if i is None else df.columns[i] for role, i in positions.items()}
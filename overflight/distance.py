@@ -0,0 +1,227 @@
+"""Great-circle cross-check of the billed distance against the airport table
+
+Stations take the vendor's distance as the base reference. This check
+puts it next to the great-circle distance between the flight's origin and
+destination airports (coordinates from masters/airports.csv, IATA or ICAO
+codes) and flags lines whose billed distance is implausibly long for the
+route:
+
+    billed distance > ratio * great-circle distance + slack_km
+
+A FIR charges only the part of the route flown in its airspace, so the
+billed distance is normally well below the great-circle distance; the
+ratio allows for airways that are not straight and the slack for very
+short routes. Lines whose airports are not in the table, or whose billed
+distance is missing, are not flagged.
+
+The coordinates are preloaded once per process into contiguous radian
+arrays by airport id (see overflight.airports), and a whole column of
+flight lines is checked in one vectorized haversine pass:
+
+    checked = check_distance(df['DEPART'], df['DEST'], df['BILLDIST'], station='YYZ')
+    df['GC_Distance_km'] = checked['GC_Distance_km']
+    df['Distance_Flag'] = checked['Distance_Flag']
+
+    python -m overflight.distance history.csv --origin DEPART --destination DEST --distance BILLDIST
+    python -m overflight.distance --benchmark 1000000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from overflight.airports import airport_index
+
+EARTH_RADIUS_KM = 6371.0088  # mean Earth radius
+KM_PER_NM = 1.852
+UNITS = {'km': 1.0, 'nm': KM_PER_NM}
+
+DEFAULT_DISTANCE_CHECK = {
+    'ratio': 1.5,      # billed distance / great-circle distance
+    'slack_km': 50.0,  # allowance on top, for very short routes
+}
+
+# Per-station profiles, on top of DEFAULT_DISTANCE_CHECK
+STATION_DISTANCE_CHECKS = {}
+
+_coordinates = {}  # airport index -> AirportCoordinates
+
+
+class AirportCoordinates:
+    """Latitude / longitude of every airport in contiguous radian arrays, by airport id"""
+
+    def __init__(self, index):
+        self.index = index
+        self.lat = np.ascontiguousarray(np.radians(index.airports['Latitude'].to_numpy(dtype=float)))
+        self.lon = np.ascontiguousarray(np.radians(index.airports['Longitude'].to_numpy(dtype=float)))
+
+    def __len__(self):
+        return len(self.lat)
+
+    def distance_km(self, origin_ids, destination_ids):
+        """Great-circle distance in km between two columns of airport ids (NaN if unknown)"""
+        i = np.asarray(origin_ids)
+        j = np.asarray(destination_ids)
+        known = (i >= 0) & (j >= 0)
+        distance = np.full(len(i), np.nan)
+        distance[known] = haversine_km(self.lat[i[known]], self.lon[i[known]],
+                                       self.lat[j[known]], self.lon[j[known]])
+        return distance
+
+    def great_circle_km(self, origin, destination):
+        """Great-circle distance in km between two columns of IATA / ICAO codes (NaN if unknown)"""
+        return self.distance_km(self.index.encode(origin), self.index.encode(destination))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between points given in radians"""
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def airport_coordinates():
+    """The airport coordinates, built once per process (again if the table changes)"""
+    index = airport_index()
+    if index not in _coordinates:
+        _coordinates[index] = AirportCoordinates(index)
+    return _coordinates[index]
+
+
+def great_circle_km(origin, destination):
+    """Great-circle distance in km between two columns of IATA / ICAO codes"""
+    return airport_coordinates().great_circle_km(origin, destination)
+
+
+def get_distance_check(station=None, **overrides):
+    """Get the distance check profile for a station, with optional overrides"""
+    profile = dict(DEFAULT_DISTANCE_CHECK)
+    if station is not None:
+        profile.update(STATION_DISTANCE_CHECKS.get(str(station).upper(), {}))
+    profile.update(overrides)
+    return profile
+
+
+def check_distance(origin, destination, billed, unit='km', station=None, **overrides):
+    """Cross-check billed distances against the great-circle distance of each route
+
+    origin / destination hold airport codes and billed the vendor's
+    distance in unit ('km' or 'nm', or a column of them per line). Returns
+    a frame with the index of billed:
+
+        GC_Distance_km  - great-circle distance of the route
+        Distance_Ratio  - billed distance (in km) / great-circle distance
+        Distance_Flag   - True where the billed distance is implausibly long
+    """
+    billed = pd.Series(billed)
+    profile = get_distance_check(station, **overrides)
+
+    if isinstance(unit, str):
+        factor = UNITS[unit.lower()]
+    else:
+        factor = pd.Series(unit, dtype=object).astype('string').str.strip().str.lower().map(UNITS)
+        factor = factor.astype(float).fillna(1.0).to_numpy()
+    billed_km = pd.to_numeric(billed, errors='coerce').to_numpy(dtype=float) * factor
+    gc_km = great_circle_km(origin, destination)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(gc_km > 0, billed_km / gc_km, np.nan)
+    flag = billed_km > profile['ratio'] * gc_km + profile['slack_km']  # False wherever NaN
+
+    return pd.DataFrame({
+        'GC_Distance_km': np.round(gc_km, 1),
+        'Distance_Ratio': np.round(ratio, 3),
+        'Distance_Flag': flag,
+    }, index=billed.index)
+
+
+def location_code(values, location_type):
+    """Airport code tagged with a location type, in cells like 'VABB @ Origin  OERK @ Destination'"""
+    pattern = rf'([A-Za-z0-9]{{3,4}})\s*@\s*{re.escape(location_type)}\b'
+    return pd.Series(values, dtype=object).astype('string').str.extract(pattern, flags=re.IGNORECASE)[0]
+
+
+def distance_unit(values):
+    """Unit of cells like "774.000  @  KM" ('km' or 'nm', missing if not given)"""
+    unit = pd.Series(values, dtype=object).astype('string').str.extract(r'@\s*(KM|NM)\b', flags=re.IGNORECASE)[0]
+    return unit.str.lower()
+
+
+def distance_counts(checked):
+    """Lines checked, lines with known airports and lines flagged"""
+    return {
+        'lines': len(checked),
+        'known': int(checked['GC_Distance_km'].notna().sum()),
+        'flagged': int(checked['Distance_Flag'].sum()),
+    }
+
+
+def distance_line(checked, station=None, **overrides):
+    """Print how many lines the distance check flagged
+
+    checked is the frame from check_distance, or its distance_counts.
+    """
+    counts = checked if isinstance(checked, dict) else distance_counts(checked)
+    profile = get_distance_check(station, **overrides)
+    print(f"[DISTANCE CHECK] {counts['flagged']} of {counts['known']} lines with known airports billed over "
+          f"{profile['ratio']:g} x great-circle + {profile['slack_km']:g} km "
+          f"({counts['lines'] - counts['known']} with unknown airports)")
+    return counts['flagged']
+
+
+def benchmark(rows, seed=0):
+    """Check rows random routes between known airports; returns the seconds taken"""
+    coordinates = airport_coordinates()
+    rng = np.random.default_rng(seed)
+    codes = coordinates.index.codes.to_numpy(dtype=object)
+    origin = codes[rng.integers(len(codes), size=rows)]
+    destination = codes[rng.integers(len(codes), size=rows)]
+    billed = rng.uniform(0, 3000, size=rows)
+    started = time.perf_counter()
+    checked = check_distance(origin, destination, billed)
+    seconds = time.perf_counter() - started
+    print(f"{rows} lines checked in {seconds:.2f}s ({int(checked['Distance_Flag'].sum())} flagged)")
+    return seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cross-check billed distances against great-circle distances")
+    parser.add_argument('file', nargs='?', help="CSV of flight lines")
+    parser.add_argument('--origin', help="Column with the origin airport code")
+    parser.add_argument('--destination', help="Column with the destination airport code")
+    parser.add_argument('--distance', help="Column with the billed distance")
+    parser.add_argument('--unit', default='km', choices=sorted(UNITS), help="Unit of the billed distance")
+    parser.add_argument('--ratio', type=float, default=DEFAULT_DISTANCE_CHECK['ratio'])
+    parser.add_argument('--slack-km', type=float, default=DEFAULT_DISTANCE_CHECK['slack_km'])
+    parser.add_argument('--output', help="Write the flagged lines here (default: print them)")
+    parser.add_argument('--benchmark', type=int, metavar='ROWS', help="Time the check on random routes")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return 0
+    if not (args.file and args.origin and args.destination and args.distance):
+        parser.error("give a file with --origin, --destination and --distance, or --benchmark ROWS")
+    if not os.path.exists(args.file):
+        print(f"ERROR: File not found: {args.file}")
+        return 1
+
+    df = pd.read_csv(args.file, usecols=[args.origin, args.destination, args.distance])
+    checked = check_distance(df[args.origin], df[args.destination], df[args.distance], args.unit,
+                             ratio=args.ratio, slack_km=args.slack_km)
+    distance_line(checked, ratio=args.ratio, slack_km=args.slack_km)
+    flagged = pd.concat([df, checked], axis=1)[checked['Distance_Flag']]
+    if args.output:
+        flagged.to_csv(args.output, index=False)
+        print(f"Flagged lines saved to: {args.output}")
+    elif len(flagged):
+        print(flagged.to_string())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
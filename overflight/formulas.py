@@ -0,0 +1,238 @@
+"""Station charge formulas as declarative specs evaluated on whole columns
+
+Each station's tariff is written down once in STATION_FORMULAS, in the
+words of the Formula column its Rate Master carries: named constants and
+an ordered set of steps, each an arithmetic expression over the inputs,
+the constants and earlier steps.
+
+    'EGYPT': {
+        'constants': {'unit_rate': 21.38},
+        'steps': {
+            'weight_factor': 'round(sqrt(mtow) / 50, 6)',
+            'distance_factor': 'round(distance / 100, 4)',
+            'charge': 'round(unit_rate * distance_factor * weight_factor, 2)',
+        },
+    }
+
+compile_formula checks every expression once (only arithmetic, comparisons
+and the functions in FUNCTIONS are allowed) and compiles it; evaluate_formula
+runs the steps on NumPy arrays, so a new tariff is a config change that
+runs at array speed.
+
+A spec's 'master' is the Rate Master's Formula column in the spec's
+names, e.g. CMB's '(distance + mtow) / 3' for "(Distance+MTOW)/3" (the
+capping and rounding are in the master's remarks). Given the rate master,
+compile_formula reads its Formula column through the same whitelist and
+fails when it no longer says what the spec was written from.
+"""
+import ast
+import re
+
+import numpy as np
+import pandas as pd
+
+# Functions a formula may call
+FUNCTIONS = {
+    'abs': np.abs,
+    'ceil': np.ceil,
+    'clip': np.clip,
+    'floor': np.floor,
+    'maximum': np.maximum,
+    'minimum': np.minimum,
+    'round': np.round,
+    'sqrt': np.sqrt,
+    'where': np.where,
+}
+
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.BoolOp, ast.Call,
+    ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.USub, ast.UAdd,
+    ast.Gt, ast.GtE, ast.Lt, ast.LtE, ast.Eq, ast.NotEq,
+    ast.BitAnd, ast.BitOr, ast.Invert,
+)
+
+# Per-station tariffs
+STATION_FORMULAS = {
+    # BILLDIST x Weight Factor x 0.03524
+    'YYZ': {
+        'constants': {'unit_rate': 0.03524},
+        'steps': {
+            'charge': 'round(distance * weight_factor * unit_rate, 2)',
+        },
+    },
+    # (Unit Rate x MTOW) + 0.18 over 150 tonnes, x distance in km (NM x 1.852)
+    'IKA': {
+        'constants': {'unit_rate': 0.00286, 'additional_charge': 0.18,
+                      'mtow_threshold': 150, 'nm_to_km': 1.852},
+        'steps': {
+            'distance_km': 'distance_nm * nm_to_km',
+            'final_unit_rate': 'where(mtow > mtow_threshold, mtow * unit_rate + additional_charge, mtow * unit_rate)',
+            'charge': 'round(final_unit_rate * distance_km, 2)',
+        },
+    },
+    # (Distance + MTOW) / 3, distance capped to 300..600 NM
+    'CMB': {
+        'master': '(distance + mtow) / 3',
+        'constants': {'min_distance': 300, 'max_distance': 600},
+        'steps': {
+            'distance_capped': 'clip(distance, min_distance, max_distance)',
+            'charge': 'round((distance_capped + mtow) / 3, 2)',
+        },
+    },
+    # Unit Rate x (Distance / 100), distance rounded up to the next hundred
+    'RUSSIA': {
+        'master': 'unit_rate * (distance / 100)',
+        'constants': {},
+        'steps': {
+            'distance_rounded': 'ceil(distance / 100) * 100',
+            'charge': 'round(unit_rate * (distance_rounded / 100), 2)',
+        },
+    },
+    # Unit rate x Distance factor x Weight factor, Weight factor = SQRT(MTOW) / 50
+    'EGYPT': {
+        'master': 'unit_rate * distance_factor * weight_factor',
+        'constants': {'unit_rate': 21.38},
+        'steps': {
+            'weight_factor': 'round(sqrt(mtow) / 50, 6)',
+            'distance_factor': 'round(distance / 100, 4)',
+            'charge': 'round(unit_rate * distance_factor * weight_factor, 2)',
+        },
+    },
+}
+
+
+def get_formula(station):
+    """Get the formula spec of a station"""
+    key = str(station).upper()
+    if key not in STATION_FORMULAS:
+        raise KeyError(f"No formula defined for station {station}")
+    return STATION_FORMULAS[key]
+
+
+def parse_expression(label, expression):
+    """Parse one formula expression through the whitelist; returns (tree, names it uses)"""
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        raise ValueError(f"{label}: not a formula: {expression}") from None
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ValueError(f"{label}: {type(node).__name__} is not allowed in a formula: {expression}")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+            raise ValueError(f"{label}: only {', '.join(sorted(FUNCTIONS))} may be called: {expression}")
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+            names.add(node.id)
+    return tree, names
+
+
+def master_expression(text):
+    """A Rate Master's Formula cell in formula names: 'Unit Rate* (Distance/100)' -> 'unit_rate* (distance/100)'"""
+    return re.sub(r'[A-Za-z]+(?: +[A-Za-z]+)*', lambda m: '_'.join(m.group().lower().split()), str(text).strip())
+
+
+def check_master_formula(station, df_rate_master):
+    """Check a rate master's Formula column against the station's spec
+
+    Returns the formulas found (empty when the master has no Formula
+    column). Raises ValueError when a formula cannot be read or differs
+    from the spec's 'master'.
+    """
+    spec = station if isinstance(station, dict) else get_formula(station)
+    column = next((col for col in df_rate_master.columns if str(col).strip().lower() == 'formula'), None)
+    if column is None:
+        return []
+    texts = [text for text in df_rate_master[column].dropna().astype(str).str.strip().unique() if text]
+    if texts and 'master' not in spec:
+        raise ValueError(f"{station}: the Rate Master has a Formula column but STATION_FORMULAS records none")
+    expected = ast.dump(parse_expression(f"{station} spec 'master'", spec.get('master', '0'))[0])
+    for text in texts:
+        tree, _ = parse_expression(f"{station} Rate Master formula", master_expression(text))
+        if ast.dump(tree) != expected:
+            raise ValueError(f"{station}: Rate Master formula '{text}' differs from the tariff in "
+                             f"STATION_FORMULAS ('{spec['master']}'); update the spec")
+    return texts
+
+
+def compile_formula(spec, rate_master=None):
+    """Check and compile a formula spec (or a station name) once per run
+
+    With the station's rate master, its Formula column is checked against
+    the spec first (see check_master_formula). Returns a dict with the
+    constants, the compiled steps in order, each step's dependencies, and
+    the inputs the formula needs.
+    """
+    if rate_master is not None:
+        check_master_formula(spec, rate_master)
+    if not isinstance(spec, dict):
+        spec = get_formula(spec)
+    constants = dict(spec.get('constants', {}))
+
+    steps = {}
+    depends = {}
+    inputs = []
+    for name, expression in spec['steps'].items():
+        tree, names = parse_expression(f"Step '{name}'", expression)
+        for var in sorted(names):
+            if var not in constants and var not in steps and var not in inputs:
+                if var in spec['steps']:
+                    raise ValueError(f"Step '{name}' uses '{var}' before it is computed")
+                inputs.append(var)
+        steps[name] = compile(tree, f"<formula step {name}>", 'eval')
+        depends[name] = names
+
+    if 'master' in spec:
+        _, names = parse_expression("Spec 'master'", spec['master'])
+        unknown = sorted(names - set(constants) - set(steps) - set(inputs))
+        if unknown:
+            raise ValueError(f"Spec 'master' uses names the steps do not: {', '.join(unknown)}")
+
+    return {'constants': constants, 'steps': steps, 'depends': depends, 'inputs': inputs}
+
+
+def evaluate_formula(formula, outputs=None, **inputs):
+    """Evaluate a compiled formula on whole columns
+
+    inputs  - one value per formula input: a Series, array or scalar
+    outputs - step names to compute (default: every step); only the steps
+              they depend on are evaluated, so a formula can be run in parts
+
+    Returns a DataFrame with one column per output step, indexed like the
+    first Series input.
+    """
+    if not isinstance(formula, dict) or 'depends' not in formula:
+        formula = compile_formula(formula)
+    outputs = list(formula['steps']) if outputs is None else list(outputs)
+
+    # Steps needed for the requested outputs, in formula order
+    needed = set()
+    pending = list(outputs)
+    while pending:
+        name = pending.pop()
+        if name not in formula['steps']:
+            raise KeyError(f"Unknown formula step: {name}")
+        if name not in needed:
+            needed.add(name)
+            pending.extend(dep for dep in formula['depends'][name] if dep in formula['steps'])
+    required = {var for name in needed for var in formula['depends'][name] if var in formula['inputs']}
+    missing = sorted(required - set(inputs))
+    if missing:
+        raise ValueError(f"Missing formula inputs: {', '.join(missing)}")
+
+    index = next((value.index for value in inputs.values() if isinstance(value, pd.Series)), None)
+    namespace = dict(formula['constants'])
+    for var, value in inputs.items():
+        if np.ndim(value) == 0:
+            namespace[var] = value
+        else:
+            namespace[var] = pd.to_numeric(pd.Series(value), errors='coerce').to_numpy(dtype=float)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for name, code in formula['steps'].items():
+            if name in needed:
+                namespace[name] = eval(code, {'__builtins__': {}, **FUNCTIONS}, namespace)
+
+    length = len(index) if index is not None else max((np.size(namespace[name]) for name in outputs), default=0)
+    return pd.DataFrame({name: np.broadcast_to(namespace[name], (length,)).astype(float) for name in outputs}, index=index)
@@ -0,0 +1,35 @@
+"""Copy-free working frames over the vendor data
+
+The scripts used to start from df_working = df_vendor.copy() and to copy
+again for every mismatch listing and output table, so a run held several
+copies of the invoice. With Copy-on-Write (always on from pandas 3, and
+switched on here for pandas 2) a frame can share its columns with the one
+it came from and only copies a column when it is written to:
+
+    df_working = working_frame(df_vendor)          # shares every vendor column
+    df_working['Calculated_Charge'] = ...          # derived columns live only here
+    df_output = df_working[output_cols]            # no copy until written to
+
+The vendor frame is never modified, derived columns are the only new
+data, and filters and column selections need no .copy(), so peak memory
+stays close to one copy of the input. Masters are compiled once per run
+(overflight.rates, overflight.mtow) and shared through overflight.store.
+"""
+import pandas as pd
+
+from overflight.categories import encode_categories
+
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+def working_frame(df_vendor, rows=None, categories=True):
+    """Working frame over the vendor data, sharing its columns instead of copying them
+
+    rows optionally selects the rows to verify (a boolean mask). Repeated
+    string columns are encoded as categoricals (see overflight.categories)
+    unless categories is False.
+    """
+    df = df_vendor if rows is None else df_vendor[rows]
+    df = df.copy(deep=False)
+    return encode_categories(df) if categories else df
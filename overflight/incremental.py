@@ -0,0 +1,156 @@
+"""Incremental re-verification of re-issued invoices
+
+Vendors often re-send a corrected invoice in which only a few lines
+changed. Each vendor row is fingerprinted on the fields its charge and
+status depend on, and the computed columns are kept per station and
+invoice file in the master cache directory, keyed by that fingerprint. A
+rerun of the invoice verifies only new or changed rows and takes the
+rest from the cache.
+
+    row_cache = RowCache('IKA', csv_file, [__file__])
+    fingerprints = fingerprint_rows(df, ['MTOW', 'Distance(NM)', 'Charge'])
+    todo = row_cache.todo(fingerprints)
+    df_new = working_frame(df, todo)   # ... verify only these rows ...
+    df_all = row_cache.merge(df, fingerprints, df_new)
+    row_cache.save(fingerprints, df_all)
+
+A streamed invoice merges chunk by chunk, add()s each merged chunk and
+calls save() once at the end.
+
+Each run replaces its invoice's entry with the rows of that run only, so
+an entry never outgrows its invoice, and invoices of one station
+verified at the same time (batch workers, the watcher) write separate
+files. The cache is tied to the script, the files it lists (masters) and
+the shared overflight code: editing any of them starts a fresh cache,
+and entries of an older context, or not rerun for ROW_CACHE_DAYS, are
+removed. Set OVERFLIGHT_INCREMENTAL=0 to always verify every row.
+"""
+import glob
+import hashlib
+import os
+import time
+
+import pandas as pd
+
+from overflight.cache import CACHE_DIR, CACHE_VERSION, FRAME_SUFFIX, file_hash, read_frame, write_frame
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROW_CACHE_DAYS = 90  # entries of invoices not rerun for this long are removed
+
+
+def incremental_enabled():
+    """False when OVERFLIGHT_INCREMENTAL is set to 0 / false / no"""
+    return os.environ.get('OVERFLIGHT_INCREMENTAL', '1').strip().lower() not in ('0', 'false', 'no')
+
+
+def fingerprint_rows(df, columns):
+    """64-bit fingerprint of every row over the given columns"""
+    return pd.util.hash_pandas_object(df[list(columns)], index=False)
+
+
+def context_hash(paths):
+    """Hash of the files a station's results depend on, plus the shared code"""
+    digest = hashlib.sha256(f"{CACHE_VERSION}:{pd.__version__}".encode())
+    for path in list(paths) + sorted(glob.glob(os.path.join(PACKAGE_DIR, '*.py'))):
+        digest.update(file_hash(path).encode())
+    return digest.hexdigest()[:16]
+
+
+def invoice_stem(invoice):
+    """File-name-safe stem of an invoice path"""
+    stem = os.path.splitext(os.path.basename(str(invoice)))[0]
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in stem) or 'invoice'
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # already pruned by a concurrent run
+
+
+class RowCache:
+    """Computed columns of earlier runs of one invoice, keyed by row fingerprint"""
+
+    def __init__(self, station, invoice, depends_on=()):
+        self.station = station
+        self.enabled = incremental_enabled()
+        self.context = context_hash(depends_on)
+        self.path = os.path.join(CACHE_DIR, f"rows-{station}-{invoice_stem(invoice)}-{self.context}{FRAME_SUFFIX}")
+        self.table = None
+        self.columns = []
+        self.parts = []  # derived columns of this run, added chunk by chunk
+        if self.enabled:
+            self.table = read_frame(self.path)  # None (verify everything) when missing or unreadable
+
+    def todo(self, fingerprints):
+        """Boolean mask of the rows that are new or changed since the cached run"""
+        if self.table is None:
+            return pd.Series(True, index=fingerprints.index)
+        return ~fingerprints.isin(self.table.index)
+
+    def merge(self, df, fingerprints, computed):
+        """All rows of df with the columns computed for the new rows, the rest from the cache
+
+        computed holds the verified new/changed rows (same index labels as
+        in df) with the columns of df, unchanged, plus the derived ones. The
+        result has the rows of df in file order and the columns of computed.
+        """
+        todo = self.todo(fingerprints)
+        derived = [col for col in computed.columns if col not in df.columns]
+        self.columns = derived
+        parts = []
+        if todo.any():
+            parts.append(computed[derived])
+        if not todo.all():
+            reused = self.table.loc[fingerprints[~todo].to_numpy(), derived]
+            reused.index = df.index[~todo.to_numpy()]
+            parts.append(reused)
+        if not parts:
+            return computed
+        results = pd.concat(parts) if len(parts) > 1 else parts[0]
+        merged = df.copy(deep=False)  # vendor columns shared, not copied
+        for col in derived:
+            merged[col] = results[col].reindex(df.index)
+        return merged[list(computed.columns)]
+
+    def add(self, fingerprints, df_all):
+        """Keep the derived columns of these merged rows for save()"""
+        if self.enabled:
+            self.parts.append(df_all[self.columns].set_axis(fingerprints.to_numpy(), axis=0))
+
+    def save(self, fingerprints=None, df_all=None):
+        """Store the derived columns of this run's rows (and of the chunks added) for the next run"""
+        if not self.enabled:
+            return
+        if fingerprints is not None:
+            self.add(fingerprints, df_all)
+        if not self.parts:
+            return
+        table = pd.concat(self.parts) if len(self.parts) > 1 else self.parts[0]
+        table = table[~table.index.duplicated(keep='last')]
+        self.parts = []
+        try:
+            write_frame(table, self.path)
+            self.prune()
+        except OSError as e:
+            print(f"  Warning: could not save row cache for {self.station}: {e}")
+        self.table = table
+
+    def prune(self):
+        """Remove the station's entries of an older context or not rerun for ROW_CACHE_DAYS"""
+        cutoff = time.time() - ROW_CACHE_DAYS * 86400
+        for old in glob.glob(os.path.join(CACHE_DIR, f"rows-{glob.escape(self.station)}-*.*")):
+            if old == self.path or not old.endswith(('.pkl', '.parquet')):
+                continue
+            try:
+                stale = not old.endswith(f"-{self.context}{FRAME_SUFFIX}") or os.path.getmtime(old) < cutoff
+            except FileNotFoundError:
+                continue
+            if stale:
+                _remove(old)
+
+    def report(self, todo):
+        """Print how many rows are verified this run and how many are reused"""
+        reused = int((~todo).sum())
+        print(f"Incremental verification: {int(todo.sum())} new or changed rows, {reused} reused from the previous run")
@@ -0,0 +1,174 @@
+"""Verify many invoice files of one station in parallel
+
+Usage:
+    python -m overflight.invoices AUH                          # every invoice file in AUH/
+    python -m overflight.invoices IKA --invoices inbox/        # every invoice file in a folder
+    python -m overflight.invoices Russia --invoices 1900374834.csv 1900374999.csv --workers 4
+
+Every station script takes its vendor file from --invoice PATH and writes
+its results to --output PATH when they are given (invoice_path and
+output_path below), and otherwise uses its usual files. The runner hands
+each invoice to a worker process; the workers load the masters once when
+they start and share them across the invoices they verify. Each invoice
+gets <invoice>_Verified.csv (and a .log) in the output folder (default:
+the station folder), and all results are combined into
+<STATION>_Combined_Verified.csv with an Invoice column, next to a
+<STATION>_Invoice_Summary.csv with one row per invoice.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from overflight.batch import ROOT_DIR, SCRIPT_NAME, SUMMARY_COLUMNS, run_station
+from overflight.manifest import classify_file, load_manifest, station_files
+from overflight.store import preload_masters
+
+INVOICE_SUMMARY_COLUMNS = ['Invoice'] + SUMMARY_COLUMNS[1:]
+
+
+def _invoice_options(argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--invoice')
+    parser.add_argument('--output')
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    return args
+
+
+def invoice_path(default=None):
+    """Vendor file given with --invoice, else the script's own default"""
+    return _invoice_options().invoice or default
+
+
+def output_path(default):
+    """Results file given with --output, else the script's own default"""
+    return _invoice_options().output or default
+
+
+def find_invoices(station_dir, paths=None):
+    """Invoice files to verify: the given files and the vendor files in the given folders
+
+    With no paths, the vendor files of the station folder itself.
+    """
+    if not paths:
+        return station_files(load_manifest(station_dir), 'vendor')
+    invoices = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            invoices.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                   if name.lower().endswith('.csv') and classify_file(name) == 'vendor'))
+        else:
+            invoices.append(path)
+    return invoices
+
+
+def verified_path(invoice, output_dir):
+    """Results file of one invoice: <invoice>_Verified.csv in output_dir"""
+    stem = os.path.splitext(os.path.basename(invoice))[0]
+    return os.path.join(output_dir, f"{stem}_Verified.csv")
+
+
+def run_invoice(station, invoice, output_file, root=ROOT_DIR):
+    """Verify one invoice with the station's script inside the current worker"""
+    log_file = os.path.splitext(output_file)[0] + '.log'
+    row = run_station(station, root, args=['--invoice', invoice, '--output', output_file],
+                      log_file=log_file, output_file=output_file)
+    row['Invoice'] = os.path.basename(invoice)
+    return row
+
+
+def combine_results(rows):
+    """All per-invoice results in one frame, with the invoice file first"""
+    parts = []
+    for row in rows:
+        if row.get('Output_File') and os.path.exists(row['Output_File']):
+            df = pd.read_csv(row['Output_File'])
+            df.insert(0, 'Invoice', row['Invoice'])
+            parts.append(df)
+    if not parts:
+        return pd.DataFrame(columns=['Invoice'])
+    return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+
+def run_invoices(station, invoices, workers=None, root=ROOT_DIR, output_dir=None):
+    """Verify many invoices of one station on a process pool
+
+    Returns (summary, combined): one summary row per invoice and the
+    combined results of every invoice.
+    """
+    output_dir = os.path.abspath(output_dir or os.path.join(root, station))
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(invoices)))
+
+    print(f"Verifying {len(invoices)} {station} invoices on {workers} workers...")
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=preload_masters, initargs=(root,)) as pool:
+        futures = {pool.submit(run_invoice, station, invoice, verified_path(invoice, output_dir), root): invoice
+                   for invoice in invoices}
+        for future in as_completed(futures):
+            invoice = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                row = {col: None for col in SUMMARY_COLUMNS}
+                row.update({'Station': station, 'Status': 'Failed', 'Error': str(e)})
+                row['Invoice'] = os.path.basename(invoice)
+            rows.append(row)
+            print(f"  {row['Invoice']:<40} {row['Status']:<10} {row['Seconds'] or 0:>7.2f}s")
+
+    rows.sort(key=lambda row: row['Invoice'])
+    combined = combine_results(rows)
+    for row in rows:
+        if row.get('Output_File'):
+            row['Output_File'] = os.path.relpath(row['Output_File'], output_dir)
+    summary = pd.DataFrame(rows, columns=INVOICE_SUMMARY_COLUMNS)
+    return summary, combined
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify many invoice files of one station in parallel")
+    parser.add_argument('station', help="Station folder whose script verifies the invoices")
+    parser.add_argument('--invoices', nargs='+', help="Invoice files or folders (default: the station's own)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: all cores)")
+    parser.add_argument('--output-dir', help="Folder for the results (default: the station folder)")
+    parser.add_argument('--root', default=ROOT_DIR, help="Directory that holds the station folders")
+    args = parser.parse_args(argv)
+
+    root = os.path.abspath(args.root)
+    station_dir = os.path.join(root, args.station)
+    if not os.path.isfile(os.path.join(station_dir, SCRIPT_NAME)):
+        print(f"ERROR: No {SCRIPT_NAME} for: {args.station}")
+        return 1
+    invoices = find_invoices(station_dir, args.invoices)
+    missing = [path for path in invoices if not os.path.isfile(path)]
+    if missing:
+        print(f"ERROR: Invoice files not found: {', '.join(missing)}")
+        return 1
+    if not invoices:
+        print("ERROR: No invoice files to verify")
+        return 1
+
+    output_dir = os.path.abspath(args.output_dir or station_dir)
+    summary, combined = run_invoices(args.station, invoices, args.workers, root, output_dir)
+
+    print("\n" + "=" * 80)
+    print(f"{args.station} INVOICE SUMMARY")
+    print("=" * 80)
+    print(summary.to_string(index=False))
+
+    safe_station = ''.join(c if c.isalnum() or c in '-_' else '_' for c in args.station)
+    combined_file = os.path.join(output_dir, f"{safe_station}_Combined_Verified.csv")
+    summary_file = os.path.join(output_dir, f"{safe_station}_Invoice_Summary.csv")
+    combined.to_csv(combined_file, index=False)
+    summary.to_csv(summary_file, index=False)
+    print(f"\nCombined results ({len(combined)} rows) saved to: {combined_file}")
+    print(f"Summary saved to: {summary_file}")
+    return 0 if (summary['Status'] != 'Failed').all() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Cached manifest of the files in a station folder and their roles
+
+Instead of globbing "*.csv" and guessing from the file names on every
+run, a station looks its files up in a manifest:
+
+    vendor    - the invoice file(s) to verify
+    fleet     - MTOW master
+    rates     - rate master
+    airports  - airport table
+    output    - results written by the scripts (never read as input)
+
+The manifest records each CSV's role, size, modification time and
+content hash, and is kept as JSON in the master cache directory. A run
+only lists the folder: files whose size and modification time are
+unchanged keep their entry, so roles are worked out and files hashed
+again only when the folder changes.
+
+    manifest = load_manifest(BASE_DIR)
+    vendor_file = station_file(manifest, 'vendor')
+
+    python -m overflight.manifest    # roles of every station's files
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+from overflight.cache import CACHE_DIR, file_hash
+from overflight.store import master_kind
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bump when the manifest layout or the role rules change
+MANIFEST_VERSION = 2
+
+ROLES = ('vendor', 'fleet', 'rates', 'airports', 'output')
+
+# File name fragments (lower case) of files the scripts and tools write
+OUTPUT_MARKERS = ('verified', 'verification', 'summary', 'benchmark_results')
+
+
+def classify_file(path):
+    """Role of a CSV from its file name (see ROLES)"""
+    kind = master_kind(path)
+    if kind is not None:
+        return kind
+    name = os.path.basename(path).lower()
+    if any(marker in name for marker in OUTPUT_MARKERS):
+        return 'output'
+    return 'vendor'
+
+
+def list_station(station_dir):
+    """Size and modification time of every CSV in a station folder"""
+    listing = {}
+    with os.scandir(station_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith('.csv'):
+                stat = entry.stat()
+                listing[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return listing
+
+
+def manifest_path(station_dir):
+    """Where the manifest of a station folder is kept"""
+    station_dir = os.path.abspath(station_dir)
+    station = os.path.basename(station_dir)
+    safe_station = ''.join(c if c.isalnum() or c in '-_' else '_' for c in station)
+    folder_hash = hashlib.sha256(station_dir.encode()).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, f"manifest-{safe_station}-{folder_hash}.json")
+
+
+def _read_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def load_manifest(station_dir):
+    """Manifest of a station folder, refreshed where its files have changed"""
+    station_dir = os.path.abspath(station_dir)
+    path = manifest_path(station_dir)
+    manifest = _read_manifest(path)
+    listing = list_station(station_dir)
+
+    known = manifest['files'] if manifest else {}
+    unchanged = {name: entry for name, entry in known.items()
+                 if listing.get(name) == (entry['size'], entry['mtime_ns'])}
+    if manifest and len(unchanged) == len(known) == len(listing):
+        return manifest
+
+    files = {}
+    for name, (size, mtime_ns) in sorted(listing.items()):
+        if name in unchanged:
+            files[name] = unchanged[name]
+            continue
+        role = classify_file(name)
+        # Outputs are rewritten every run and never read back: no need to hash them
+        content_hash = None if role == 'output' else file_hash(os.path.join(station_dir, name))
+        files[name] = {'role': role, 'size': size, 'mtime_ns': mtime_ns, 'hash': content_hash}
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'station': os.path.basename(station_dir),
+        'dir': station_dir,
+        'files': files,
+    }
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write then rename, so parallel runs never see a partial file
+        fd, tmp_file = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_file, path)
+    except OSError as e:
+        print(f"  Warning: could not save the file manifest of {manifest['station']}: {e}")
+    return manifest
+
+
+def station_files(manifest, role):
+    """Paths of every file with the given role, by name"""
+    return [os.path.join(manifest['dir'], name)
+            for name, entry in sorted(manifest['files'].items()) if entry['role'] == role]
+
+
+def station_file(manifest, role):
+    """Path of the file with the given role (None if there is none)
+
+    Where a folder holds several, the first by name is used and the
+    others are listed.
+    """
+    paths = station_files(manifest, role)
+    if len(paths) > 1:
+        others = ', '.join(os.path.basename(p) for p in paths[1:])
+        print(f"  Note: {len(paths)} {role} files in {manifest['station']}; using "
+              f"{os.path.basename(paths[0])} (also: {others})")
+    return paths[0] if paths else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the role of every file in the station folders")
+    parser.add_argument('--stations', nargs='+', help="Station folders to show (default: all with a script)")
+    parser.add_argument('--root', default=ROOT_DIR, help="Directory that holds the station folders")
+    args = parser.parse_args(argv)
+
+    root = os.path.abspath(args.root)
+    stations = args.stations or sorted(os.path.basename(os.path.dirname(p))
+                                       for p in glob.glob(os.path.join(root, '*', 'verify_charges.py')))
+    for station in stations:
+        manifest = load_manifest(os.path.join(root, station))
+        print(f"\n{station}")
+        for name, entry in sorted(manifest['files'].items(), key=lambda item: (ROLES.index(item[1]['role']), item[0])):
+            content_hash = (entry['hash'] or '-')[:12]
+            print(f"  {entry['role']:<9} {content_hash:<12} {entry['size']:>10}  {name}")
+        if not station_files(manifest, 'vendor'):
+            print("  [NO VENDOR FILE]")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Match status of calculated vs vendor charges, as whole-column operations
+
+Every station compares its calculated charge with the vendor's and labels
+each row:
+
+    Matched        - |calculated - vendor| is within the station's tolerance
+    Not Matched    - both charges are present but differ by more than that
+    Missing Input  - the calculated or the vendor charge is missing, so the
+                     row could not be verified
+
+A row matches when the difference is within the absolute tolerance or
+within the relative tolerance times the vendor charge, whichever is larger.
+"""
+import numpy as np
+import pandas as pd
+
+MATCHED = 'Matched'
+NOT_MATCHED = 'Not Matched'
+MISSING_INPUT = 'Missing Input'
+STATUSES = (MATCHED, NOT_MATCHED, MISSING_INPUT)
+
+# Status columns are categorical: one small code per row instead of a string
+STATUS_DTYPE = pd.CategoricalDtype(list(STATUSES))
+
+DEFAULT_TOLERANCE = {
+    'absolute': 0.01,  # currency units
+    'relative': 0.0,   # fraction of the vendor charge
+}
+
+# Per-station tolerance profiles, on top of DEFAULT_TOLERANCE
+STATION_TOLERANCES = {
+    # Vendors round to whole currency units
+    'ASB': {'absolute': 0.5},
+    'JED': {'absolute': 0.5},
+}
+
+
+def get_tolerance(station=None, **overrides):
+    """Get the tolerance profile for a station, with optional overrides"""
+    tolerance = dict(DEFAULT_TOLERANCE)
+    if station is not None:
+        tolerance.update(STATION_TOLERANCES.get(str(station).upper(), {}))
+    tolerance.update(overrides)
+    return tolerance
+
+
+def compare_charges(calculated, vendor, station=None, **overrides):
+    """Compare two charge columns; returns (difference, status) Series
+
+    difference is |calculated - vendor| (NaN where either is missing) and
+    status holds one of STATUSES per row (categorical, STATUS_DTYPE). Both
+    keep the index of calculated.
+    """
+    calculated = pd.Series(calculated)
+    index = calculated.index
+    calc = pd.to_numeric(calculated, errors='coerce').to_numpy(dtype=float)
+    vend = pd.to_numeric(pd.Series(vendor), errors='coerce').to_numpy(dtype=float)
+
+    tolerance = get_tolerance(station, **overrides)
+    difference = np.abs(calc - vend)
+    allowed = np.maximum(tolerance['absolute'], tolerance['relative'] * np.abs(vend))
+    missing = np.isnan(calc) | np.isnan(vend)
+
+    codes = np.where(missing, 2, np.where(difference <= allowed, 0, 1))  # positions in STATUSES
+    status = pd.Categorical.from_codes(codes, dtype=STATUS_DTYPE)
+    return pd.Series(difference, index=index), pd.Series(status, index=index)
+
+
+def status_counts(status):
+    """Number of rows per status, with every status present"""
+    counts = pd.Series(status).value_counts()
+    return {name: int(counts.get(name, 0)) for name in STATUSES}
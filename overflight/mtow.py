@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from overflight.store import compiled_lookup
+
+
+def normalize_registration(values):
+    """Normalize aircraft registrations for matching (upper case, letters and digits only)"""
+    keys = values.astype('string').str.upper().str.replace(r'[^A-Z0-9]', '', regex=True)
+    return keys.mask(keys == '')
+
+
+def build_registration_index(df_mtow_master, reg_col='Aircraft', mtow_col='MTOW_in_KGs'):
+    """Build a normalized registration -> MTOW (kg) index from the MTOW master
+
+    Built once per process for each master content (see overflight.store).
+    """
+    columns = {str(col).replace('\ufeff', '').strip(): col for col in df_mtow_master.columns}
+    df = df_mtow_master[[columns[reg_col], columns[mtow_col]]]
+    return compiled_lookup(_registration_index, df)
+
+
+def _registration_index(df):
+    keys = normalize_registration(df.iloc[:, 0])
+    mtow = pd.to_numeric(df.iloc[:, 1], errors='coerce')
+
+    index = pd.Series(mtow.to_numpy(dtype=float), index=keys.to_numpy(dtype=object))
+    index = index[index.index.notna()]
+    # Keep the first entry for a registration, same as the old per-row lookup
+    return index[~index.index.duplicated(keep='first')]
+
+
+def lookup_mtow(registrations, index):
+    """Resolve a whole registration column to MTOW (kg) with a single hash join
+
+    Only the distinct registrations are normalized and looked up (for a
+    categorical column these are its categories); rows take their value.
+    """
+    registrations = pd.Series(registrations)
+    codes, uniques = pd.factorize(registrations)
+    mtow = normalize_registration(pd.Series(uniques, dtype=object)).map(index).to_numpy(dtype=float)
+    return pd.Series(np.append(mtow, np.nan)[codes], index=registrations.index)  # code -1: missing
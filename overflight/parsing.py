@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+# First complete number in a cell (decimal or integer), as the old per-cell regex
+NUMBER_PATTERN = r'(\d+(?:\.\d*)?)'
+
+DEFAULT_RULES = {
+    'thousands': [','],
+    'decimal': '.',
+    'currency': ['$', 'USD'],
+    'units': [],  # regular expressions, matched case-insensitively
+    'line': None,  # 'first' / 'last': parse only that line of a multi-line cell
+}
+
+# Per-station locale rules, on top of DEFAULT_RULES
+STATION_RULES = {
+    # "280.0000  @ TON", "774.000  @  KM"
+    'MCT': {'units': [r'@\s*(TON|KG|KM|NM)\b']},
+    'MGQ': {'units': [r'@\s*(TON|KG|KM|NM)\b']},
+    # "4 779.40" - space as thousands separator
+    'RUSSIA': {'thousands': [' ', ',']},
+    # "667,42" - comma as decimal separator
+    'EGYPT': {'thousands': [' ', '.'], 'decimal': ','},
+    # "7,492\n119" - at a page break the brought-forward total sits above the line charge
+    'RGN': {'line': 'last'},
+}
+
+
+def get_parse_rules(station=None, **overrides):
+    """Get the numeric parsing rules for a station, with optional overrides"""
+    rules = dict(DEFAULT_RULES)
+    if station is not None:
+        rules.update(STATION_RULES.get(str(station).upper(), {}))
+    rules.update(overrides)
+    return rules
+
+
+def extract_numeric_column(values, station=None, label=None, **overrides):
+    """Extract the first numeric value from every cell of a vendor column
+
+    Handles currency tokens, unit suffixes and thousands/decimal separators
+    per station (see STATION_RULES) with vectorized string operations.
+    When label is given the parse rate is printed.
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Parse each distinct value once; the rows take their category's number
+        numbers = extract_numeric_column(pd.Series(values.cat.categories), station, **overrides).to_numpy()
+        codes = values.cat.codes.to_numpy()
+        parsed = pd.Series(np.append(numbers, np.nan)[codes], index=values.index)
+    elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        parsed = values.astype(float)
+    else:
+        rules = get_parse_rules(station, **overrides)
+        text = values.astype('string')
+        if rules['line'] in ('first', 'last'):
+            text = text.str.strip().str.split(r'[\r\n]+', regex=True).str[0 if rules['line'] == 'first' else -1]
+        text = text.str.replace(r'[\r\n]+', ' ', regex=True).str.upper()
+        for pattern in rules['units']:
+            text = text.str.replace(pattern, ' ', regex=True)
+        for token in rules['currency']:
+            text = text.str.replace(token.upper(), ' ', regex=False)
+        for separator in rules['thousands']:
+            text = text.str.replace(separator, '', regex=False)
+        if rules['decimal'] != '.':
+            text = text.str.replace(rules['decimal'], '.', regex=False)
+        parsed = pd.to_numeric(text.str.extract(NUMBER_PATTERN, expand=False), errors='coerce').astype(float)
+
+    if label is not None:
+        report_parse_rate(values, parsed, label)
+    return parsed
+
+
+def report_parse_rate(values, parsed, label):
+    """Print how many non-empty cells of a column parsed to a number"""
+    non_empty = pd.Series(values).astype('string').str.strip().replace('', pd.NA).notna().sum()
+    ok = parsed.notna().sum()
+    rate = (ok / non_empty) * 100 if non_empty > 0 else 0
+    print(f"  Parsed {label}: {ok}/{non_empty} non-empty cells ({rate:.1f}%)")
+    return rate
@@ -0,0 +1,189 @@
+import numpy as np
+import pandas as pd
+
+from overflight.store import compiled_lookup
+
+BAND_MATCHES = ('exact', 'floor', 'ceiling', 'nearest')
+
+
+def compile_rate_bands(df_rate_master, mtow_col, value_cols):
+    """Compile a rate master into MTOW bands sorted for binary search
+
+    Rows without a numeric MTOW are dropped. When the same MTOW appears more
+    than once the first row in the file wins, as it did with the old
+    exact-match lookups. Compiled once per process for each master content
+    (see overflight.store).
+    """
+    if isinstance(value_cols, str):
+        value_cols = [value_cols]
+    columns = list(dict.fromkeys([mtow_col] + list(value_cols)))
+    return compiled_lookup(_rate_bands, df_rate_master[columns], mtow_col, tuple(value_cols))
+
+
+def _rate_bands(df_rate_master, mtow_col, value_cols):
+    bands = pd.DataFrame({'MTOW': pd.to_numeric(df_rate_master[mtow_col], errors='coerce').to_numpy()})
+    for col in value_cols:
+        bands[col] = pd.to_numeric(df_rate_master[col], errors='coerce').to_numpy()
+    bands['Source_Row'] = np.arange(len(bands))
+
+    bands = bands[bands['MTOW'].notna()]
+    bands = bands.sort_values('MTOW', kind='stable')
+    bands = bands[~bands['MTOW'].duplicated(keep='first')]
+    return bands.reset_index(drop=True)
+
+
+def resolve_rate_bands(mtow, bands, match='nearest'):
+    """Resolve a whole MTOW column against compiled rate bands in one pass
+
+    match is one of:
+      exact   - only an identical MTOW in the rate master
+      floor   - the largest band MTOW at or below the aircraft MTOW
+      ceiling - the smallest band MTOW at or above the aircraft MTOW
+      nearest - exact match, else the closest band (ties go to the row
+                listed first in the rate master)
+
+    Returns a frame aligned to mtow with the band values and a Band_MTOW
+    column. Band_MTOW is NaN for every row that matched no band.
+    """
+    if match not in BAND_MATCHES:
+        raise ValueError(f"match must be one of {BAND_MATCHES}, got {match!r}")
+
+    mtow = pd.Series(mtow)
+    value_cols = [col for col in bands.columns if col not in ('MTOW', 'Source_Row')]
+    result = pd.DataFrame(np.nan, index=mtow.index, columns=value_cols + ['Band_MTOW'])
+    if len(bands) == 0:
+        return result
+
+    values = pd.to_numeric(mtow, errors='coerce').to_numpy(dtype=float)
+    keys = bands['MTOW'].to_numpy(dtype=float)
+    last = len(keys) - 1
+    valid = ~np.isnan(values)
+
+    # lower: last band <= MTOW, upper: first band >= MTOW
+    lower = np.searchsorted(keys, values, side='right') - 1
+    upper = np.searchsorted(keys, values, side='left')
+    has_lower = valid & (lower >= 0)
+    has_upper = valid & (upper <= last)
+    lower = np.clip(lower, 0, last)
+    upper = np.clip(upper, 0, last)
+
+    if match == 'exact':
+        position = upper
+        matched = has_upper & (keys[upper] == values)
+    elif match == 'floor':
+        position = lower
+        matched = has_lower
+    elif match == 'ceiling':
+        position = upper
+        matched = has_upper
+    else:
+        source_row = bands['Source_Row'].to_numpy()
+        lower_gap = np.where(has_lower, values - keys[lower], np.inf)
+        upper_gap = np.where(has_upper, keys[upper] - values, np.inf)
+        lower_first = source_row[lower] <= source_row[upper]
+        take_lower = (lower_gap < upper_gap) | ((lower_gap == upper_gap) & lower_first)
+        position = np.where(take_lower, lower, upper)
+        matched = has_lower | has_upper
+
+    for col in value_cols:
+        result[col] = pd.Series(bands[col].to_numpy()[position], index=mtow.index).where(matched)
+    result['Band_MTOW'] = np.where(matched, keys[position], np.nan)
+    return result
+
+
+def compile_rate_index(df_rate_master, key_col, mtow_col, value_col):
+    """Compile a rate master keyed by (key_col, MTOW band), e.g. landing status and MTOW
+
+    Returns a dict of key -> compiled bands. With key_col=None every row
+    shares one key (None). When the same key and MTOW carry different values
+    the band keeps the first value listed, as compile_rate_bands does, and
+    is marked Rate_Ambiguous with the competing values in Rate_Candidates,
+    so the row is still priced but not silently. Compiled once per process
+    for each master content (see overflight.store).
+    """
+    columns = list(dict.fromkeys(([] if key_col is None else [key_col]) + [mtow_col, value_col]))
+    return compiled_lookup(_rate_index, df_rate_master[columns], key_col, mtow_col, value_col)
+
+
+def _rate_index(df_rate_master, key_col, mtow_col, value_col):
+    if key_col is None:
+        keys = pd.Series(None, index=df_rate_master.index, dtype=object)
+    else:
+        keys = df_rate_master[key_col].astype('string').str.strip().astype(object)
+    frame = pd.DataFrame({
+        'Rate_Key': keys.to_numpy(),
+        'MTOW': pd.to_numeric(df_rate_master[mtow_col], errors='coerce').to_numpy(),
+        value_col: pd.to_numeric(df_rate_master[value_col], errors='coerce').to_numpy(),
+    })
+
+    index = {}
+    for key, group in frame.groupby('Rate_Key', sort=False, dropna=False):
+        key = None if pd.isna(key) else key
+        bands = _rate_bands(group, 'MTOW', [value_col])
+        candidates = group.dropna(subset=['MTOW']).groupby('MTOW')[value_col].agg(
+            lambda values: ' / '.join(f'{value:g}' for value in values.dropna().unique())
+        )
+        counts = group.dropna(subset=['MTOW']).groupby('MTOW')[value_col].nunique()
+        ambiguous = bands['MTOW'].map(counts).fillna(0).to_numpy() > 1
+        bands['Rate_Ambiguous'] = ambiguous
+        bands['Rate_Candidates'] = np.where(ambiguous, bands['MTOW'].map(candidates), None)
+        index[key] = bands
+    return index
+
+
+def pair_rate_keys(df_rate_master, mtow_col, value_col, keys):
+    """Key for every row of a rate master that lists two charges per MTOW without saying which is which
+
+    keys is (key of the lower charge, key of the higher charge), e.g. AUH's
+    landing and overflight rates. A charge listed alone for its MTOW takes
+    the key the same charge has in the pairs; rows that stay unresolved
+    get no key (None).
+    """
+    low_key, high_key = keys
+    frame = pd.DataFrame({
+        'MTOW': pd.to_numeric(df_rate_master[mtow_col], errors='coerce').to_numpy(),
+        'Value': pd.to_numeric(df_rate_master[value_col], errors='coerce').to_numpy(),
+    }, index=df_rate_master.index)
+    charges = frame.groupby('MTOW')['Value']
+    count = charges.transform('nunique')
+    is_low = (count == 2) & (frame['Value'] == charges.transform('min'))
+    is_high = (count == 2) & (frame['Value'] == charges.transform('max'))
+
+    low_values = set(frame.loc[is_low, 'Value'])
+    high_values = set(frame.loc[is_high, 'Value'])
+    single = count == 1
+    is_low |= single & frame['Value'].isin(low_values - high_values)
+    is_high |= single & frame['Value'].isin(high_values - low_values)
+
+    result = pd.Series(None, index=df_rate_master.index, dtype=object)
+    result[is_low] = low_key
+    result[is_high] = high_key
+    return result
+
+
+def resolve_rate_index(keys, mtow, index, match='nearest'):
+    """Price a whole invoice against a compiled rate index, one key group at a time
+
+    keys may be None when the index was compiled without a key column.
+    Rows whose key is not in the rate master get no band.
+    """
+    mtow = pd.Series(mtow)
+    if keys is None:
+        keys = pd.Series(None, index=mtow.index, dtype=object)
+    else:
+        keys = pd.Series(keys, index=mtow.index).astype('string').str.strip().astype(object)
+
+    first = next(iter(index.values()), None)
+    value_cols = [] if first is None else [col for col in first.columns if col not in ('MTOW', 'Source_Row')]
+    result = pd.DataFrame(np.nan, index=mtow.index, columns=value_cols + ['Band_MTOW'], dtype=object)
+
+    for key, bands in index.items():
+        rows = keys.isna() if key is None else (keys == key).fillna(False).astype(bool)
+        if rows.any():
+            result.loc[rows, :] = resolve_rate_bands(mtow[rows], bands, match=match)
+
+    for col in result.columns.drop(['Rate_Ambiguous', 'Rate_Candidates'], errors='ignore'):
+        result[col] = pd.to_numeric(result[col], errors='coerce')
+    if 'Rate_Ambiguous' in result.columns:
+        result['Rate_Ambiguous'] = result['Rate_Ambiguous'].fillna(False).astype(bool)
+    return result
@@ -0,0 +1,77 @@
+"""Bounded console reporting for the station scripts
+
+Full detail goes to each station's output file; the console only gets
+previews of the first rows of a table and a capped mismatch listing.
+Every station script accepts:
+
+    --quiet           print only the one-line result of the run
+    --top N           rows shown in table previews (default 20)
+    --mismatches N    mismatches listed (default 15)
+
+    python IKA/verify_charges.py --quiet
+"""
+import argparse
+import io
+import sys
+
+from overflight.matching import MATCHED, MISSING_INPUT, NOT_MATCHED, status_counts
+
+DEFAULT_TOP = 20
+DEFAULT_MISMATCHES = 15
+
+_settings = {'quiet': False, 'top': DEFAULT_TOP, 'mismatches': DEFAULT_MISMATCHES}
+_result_stream = None  # where result_line writes while the console is quiet
+
+
+class _Discard(io.TextIOBase):
+    """A text stream that drops everything written to it"""
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        return len(text)
+
+
+def configure_report(argv=None):
+    """Read --quiet / --top / --mismatches from the command line (other options are left alone)"""
+    global _result_stream
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--quiet', action='store_true')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP)
+    parser.add_argument('--mismatches', type=int, default=DEFAULT_MISMATCHES)
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    _settings.update(quiet=args.quiet, top=max(args.top, 0), mismatches=max(args.mismatches, 0))
+
+    _result_stream = None
+    if args.quiet:
+        _result_stream = sys.stdout
+        sys.stdout = _Discard()
+    return dict(_settings)
+
+
+def preview(df, columns=None, n=None, index=True):
+    """Print the first n rows of a table (default --top), noting how many were left out"""
+    n = _settings['top'] if n is None else n
+    head = df.head(n)
+    if columns is not None:
+        head = head[list(columns)]
+    print(head.to_string(index=index))
+    if len(df) > n:
+        print(f"... {len(df) - n} more rows (full detail in the output file)")
+
+
+def list_mismatches(df, columns=None, index=True):
+    """Print the first --mismatches rows of a mismatch table"""
+    preview(df, columns, n=_settings['mismatches'], index=index)
+
+
+def result_line(station, status, output_file):
+    """Print the one-line result of a run, shown even with --quiet
+
+    status is the status column of the output, or its counts per status.
+    """
+    counts = status if isinstance(status, dict) else status_counts(status)
+    line = (f"{station}: {sum(counts.values())} records, {counts[MATCHED]} matched, "
+            f"{counts[NOT_MATCHED]} not matched, {counts[MISSING_INPUT]} missing input -> {output_file}")
+    print(line, file=_result_stream or sys.stdout)
@@ -0,0 +1,463 @@
+"""Append-only columnar results dataset, partitioned by station and billing month
+
+Every station run still writes its own verified CSV, which the next run
+overwrites. Next to it, the run is appended to a Parquet dataset with one
+stable schema for all stations:
+
+    station, billing_month        - the partition keys (directory names)
+    invoice                       - the vendor file the line came from
+    line                          - position of the line in the verified output (from 1)
+    registration
+    mtow_tonnes, distance_km      - converted from the station's own units
+    calculated_charge, vendor_charge
+    difference                    - |calculated - vendor|
+    status                        - Matched / Not Matched / Missing Input
+    verified_at                   - when the run started
+
+laid out as
+
+    results/station=IKA/billing_month=2025-10/20251014T093012-4242-1900357153.parquet
+
+Nothing is ever overwritten: each run adds one new file per billing month
+it covers, written under a temporary name and renamed into place, so a
+reader never sees a partial file. A query for some stations and months
+opens only their partition folders and reads only the columns it asks
+for:
+
+    df = read_results(stations=['IKA', 'YYZ'], since='2025-07', columns=['status', 'vendor_charge'])
+
+The billing month comes from the flight date of each line: the output's
+own date column (YYZ, DOH, MCT), or the vendor date the script passes
+along as Flight_Date without writing it to its CSV (every other station
+whose invoices carry a full date). Lines without one, and EGYPT and SGN,
+whose invoices only give the day, take --billing-month YYYY-MM from the
+script's command line (or OVERFLIGHT_BILLING_MONTH), else the month of
+the run. Set OVERFLIGHT_RESULTS_DIR to move the dataset and
+OVERFLIGHT_RESULTS=0 to stop recording. Parquet needs pyarrow; without it
+the scripts note that the dataset was not updated and carry on.
+
+    python -m overflight.results                                   # lines and totals per station and month
+    python -m overflight.results --stations IKA --since 2025-09 --output ika.csv
+    python -m overflight.results --record IKA IKA/1900357153_Verified.csv --billing-month 2025-10
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import tempfile
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: the dataset is only written when pyarrow is installed
+    pa = pq = None
+
+from overflight.distance import KM_PER_NM
+from overflight.matching import STATUSES
+from overflight.streaming import read_csv_chunks
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.environ.get('OVERFLIGHT_RESULTS_DIR', os.path.join(ROOT_DIR, 'results'))
+
+KG = 0.001  # tonnes per kg
+
+PARTITION_COLUMNS = ['station', 'billing_month']
+FILE_COLUMNS = ['invoice', 'line', 'registration', 'mtow_tonnes', 'distance_km',
+                'calculated_charge', 'vendor_charge', 'difference', 'status', 'verified_at']
+RESULT_COLUMNS = PARTITION_COLUMNS + FILE_COLUMNS
+
+# Output column of each result field: a column name, or (column name, factor)
+# to convert MTOW to tonnes and distances to km; billing_date is
+# (column name, date format), Flight_Date being the vendor date the script
+# adds to the frame it records. Fields a station does not have stay empty.
+DEFAULT_RESULT_COLUMNS = {
+    'registration': 'Aircraft_Reg',
+    'mtow_tonnes': None,
+    'distance_km': None,
+    'calculated_charge': 'Calculated_Charge',
+    'vendor_charge': 'Vendor_Charge',
+    'status': 'Status',
+    'billing_date': None,
+}
+
+# Per-station output columns, on top of DEFAULT_RESULT_COLUMNS
+STATION_RESULT_COLUMNS = {
+    'ASB': {'registration': 'Reg', 'mtow_tonnes': 'tonn', 'distance_km': 'Dist.',
+            'calculated_charge': 'Calculated_Amount', 'vendor_charge': 'Amount',
+            'billing_date': ('Flight_Date', '%d-%b-%y')},
+    'AUH': {'registration': 'AIRCRAFT_REG', 'mtow_tonnes': 'MTOW_tonnes', 'calculated_charge': 'Unit_Rate_mapped',
+            'billing_date': ('Flight_Date', '%d-%b-%Y')},
+    'CMB': {'mtow_tonnes': 'MTOW_tonnes', 'distance_km': ('Distance_NM', KM_PER_NM),
+            'billing_date': ('Flight_Date', '%d-%b-%Y')},
+    'DAC': {'registration': 'Regn_No.', 'mtow_tonnes': ('MTOW_numeric', KG), 'calculated_charge': 'Rate_Master_Charge',
+            'billing_date': ('Flight_Date', '%d-%b-%Y')},
+    'DOH': {'registration': 'Registration', 'mtow_tonnes': 'MTOW_Tonnes', 'calculated_charge': 'CALCULATED_CHARGE',
+            'vendor_charge': 'TOTAL_BILL_NUM', 'status': 'STATUS', 'billing_date': ('FLIGHTDATE', '%d-%b-%y')},
+    'EGYPT': {'mtow_tonnes': ('MTOW_numeric', KG), 'distance_km': 'Distance_numeric'},
+    'IKA': {'registration': 'REG', 'mtow_tonnes': 'MTOW', 'distance_km': 'DISTANCE_KM',
+            'calculated_charge': 'CALCULATED_CHARGE', 'vendor_charge': 'Charge', 'status': 'VERIFICATION_STATUS',
+            'billing_date': ('Flight_Date', '%d-%m-%Y %H:%M')},
+    'JED': {'registration': 'Aircraft ID', 'distance_km': ('Distance Factor', 100),
+            'billing_date': ('Flight_Date', '%d-%b-%y')},
+    'KAZ': {'mtow_tonnes': 'MTOW', 'distance_km': 'Distance_km', 'billing_date': ('Flight_Date', '%d.%m.%y')},
+    'LHE': {'mtow_tonnes': ('MTOW', KG), 'distance_km': 'Distance_km', 'billing_date': ('Flight_Date', '%d-%b-%y')},
+    'LHR': {'registration': None, 'billing_date': ('Flight_Date', '%d-%b-%y')},
+    'MCT': {'mtow_tonnes': 'MTOW_Tonnes', 'distance_km': 'Distance_km',
+            'billing_date': ('Flight_DateTime', '%Y-%m-%d %H:%M')},
+    'MGQ': {'mtow_tonnes': ('MTOW', KG), 'billing_date': ('Flight_Date', '%Y-%m-%d %H:%M')},
+    'PNH': {'mtow_tonnes': ('MTOW', KG), 'billing_date': ('Flight_Date', '%d-%m-%Y')},
+    'RGN': {'mtow_tonnes': ('MTOW', KG), 'billing_date': ('Flight_Date', '%d-%m-%Y')},
+    'RUSSIA': {'mtow_tonnes': 'MTOW_tons', 'distance_km': 'Distance_km', 'billing_date': ('Flight_Date', '%d-%B-%Y')},
+    'SGN': {'mtow_tonnes': ('MTOW_in_KGs', KG), 'calculated_charge': 'CALCULATED_TOTAL_AMOUNT',
+            'vendor_charge': 'Total amount', 'status': 'VERIFICATION_STATUS'},
+    'YYZ': {'registration': 'AC_IDENT', 'mtow_tonnes': 'MTOW', 'distance_km': 'BILLDIST',
+            'calculated_charge': 'CALCULATED_CHARGE', 'vendor_charge': 'TOTAL', 'status': 'VERIFICATION_STATUS',
+            'billing_date': ('UTC_DATE', '%d-%m-%Y')},
+}
+
+MONTH_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+
+def results_enabled():
+    """False when OVERFLIGHT_RESULTS is set to 0 / false / no"""
+    return os.environ.get('OVERFLIGHT_RESULTS', '1').strip().lower() not in ('0', 'false', 'no')
+
+
+def _require_pyarrow():
+    if pq is None:
+        raise RuntimeError("The results dataset needs pyarrow (pip install pyarrow)")
+
+
+def file_schema():
+    """Arrow schema of every results file (the partition keys live in the folder names)"""
+    _require_pyarrow()
+    return pa.schema([
+        ('invoice', pa.string()),
+        ('line', pa.int32()),
+        ('registration', pa.string()),
+        ('mtow_tonnes', pa.float64()),
+        ('distance_km', pa.float64()),
+        ('calculated_charge', pa.float64()),
+        ('vendor_charge', pa.float64()),
+        ('difference', pa.float64()),
+        ('status', pa.dictionary(pa.int8(), pa.string())),
+        ('verified_at', pa.timestamp('s')),
+    ])
+
+
+def get_result_columns(station):
+    """Get the output column of every result field for a station"""
+    columns = dict(DEFAULT_RESULT_COLUMNS)
+    columns.update(STATION_RESULT_COLUMNS.get(str(station).upper(), {}))
+    return columns
+
+
+def check_month(month):
+    """A billing month as YYYY-MM (ValueError otherwise)"""
+    if not MONTH_PATTERN.match(str(month)):
+        raise ValueError(f"Billing month must be YYYY-MM, not {month}")
+    return str(month)
+
+
+def _results_options(argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--billing-month')
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    return args
+
+
+def billing_month(default=None):
+    """Billing month given with --billing-month or OVERFLIGHT_BILLING_MONTH, else default"""
+    month = _results_options().billing_month or os.environ.get('OVERFLIGHT_BILLING_MONTH') or default
+    return check_month(month) if month else None
+
+
+def _plain(values):
+    return values.astype(object) if isinstance(values.dtype, pd.CategoricalDtype) else values
+
+
+def _numbers(df, spec):
+    column, factor = spec if isinstance(spec, tuple) else (spec, 1)
+    if column is None or column not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    values = pd.to_numeric(_plain(df[column]), errors='coerce').astype(float)
+    return values * factor if factor != 1 else values
+
+
+def _text(df, column):
+    if column is None or column not in df.columns:
+        return pd.Series(None, index=df.index, dtype='string')
+    return _plain(df[column]).astype('string').str.strip()
+
+
+def billing_months(df, spec, default):
+    """Billing month (YYYY-MM) of every line, from its date column where it has one
+
+    Lines without a readable date take the month most dated lines fall in,
+    else default.
+    """
+    months = pd.Series(None, index=df.index, dtype=object)
+    if spec is not None and spec[0] in df.columns:
+        column, date_format = spec
+        # Only the distinct dates are parsed; the lines take their months
+        labels, uniques = pd.factorize(_plain(df[column]))
+        text = pd.Series(uniques, dtype=object).astype('string').str.replace(r'\s+', ' ', regex=True).str.strip()
+        dates = pd.to_datetime(text, format=date_format, errors='coerce')
+        unique_months = dates.dt.strftime('%Y-%m').astype(object).where(dates.notna(), None).to_numpy()
+        months = pd.Series(np.append(unique_months, None)[labels], index=df.index)
+        if months.notna().any():
+            default = months.mode().iloc[0]
+    return months.fillna(default)
+
+
+def result_frame(df, station, invoice='', first_line=1, month=None, verified_at=None):
+    """A station's verified output in the results schema (partition columns included)"""
+    columns = get_result_columns(station)
+    verified_at = pd.Timestamp.now().floor('s') if verified_at is None else verified_at
+    calculated = _numbers(df, columns['calculated_charge'])
+    vendor = _numbers(df, columns['vendor_charge'])
+    results = pd.DataFrame({
+        'station': str(station),
+        'billing_month': billing_months(df, columns['billing_date'], month or f"{verified_at:%Y-%m}"),
+        'invoice': invoice,
+        'line': np.arange(first_line, first_line + len(df), dtype=np.int32),
+        'registration': _text(df, columns['registration']),
+        'mtow_tonnes': _numbers(df, columns['mtow_tonnes']),
+        'distance_km': _numbers(df, columns['distance_km']),
+        'calculated_charge': calculated,
+        'vendor_charge': vendor,
+        'difference': (calculated - vendor).abs(),
+        'status': _text(df, columns['status']).astype('category'),
+        'verified_at': verified_at,
+    }, index=df.index)
+    return results.reset_index(drop=True)
+
+
+def partition_dir(root, station, month):
+    """Folder of one station and billing month"""
+    return os.path.join(root, f"station={quote(str(station), safe='')}", f"billing_month={month}")
+
+
+class ResultsWriter:
+    """Append one run's results to the dataset, chunk by chunk
+
+    Each billing month of the run gets one new file in its partition; the
+    files are written under temporary names and only renamed into place
+    by close(), so a failed run leaves nothing behind.
+    """
+
+    def __init__(self, station, invoice=None, root=None, month=None):
+        self.station = str(station)
+        self.invoice = os.path.basename(invoice) if invoice else ''
+        self.root = root or RESULTS_DIR
+        self.month = check_month(month) if month else billing_month()
+        self.verified_at = pd.Timestamp.now().floor('s')
+        self.enabled = results_enabled() and pq is not None
+        self.rows = 0
+        self.files = []
+        self._writers = {}  # billing month -> (temporary path, ParquetWriter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write(self, df):
+        """Append a frame of verified lines (the station's output columns)"""
+        first_line = self.rows + 1
+        self.rows += len(df)
+        if not self.enabled or not len(df):
+            return
+        results = result_frame(df, self.station, self.invoice, first_line, self.month, self.verified_at)
+        for month, part in results.groupby('billing_month', sort=True):
+            table = pa.Table.from_pandas(part[FILE_COLUMNS], schema=file_schema(), preserve_index=False)
+            self._writer(month).write_table(table)
+
+    def _writer(self, month):
+        if month not in self._writers:
+            directory = partition_dir(self.root, self.station, month)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+            os.close(fd)
+            self._writers[month] = (tmp_path, pq.ParquetWriter(tmp_path, file_schema()))
+        return self._writers[month][1]
+
+    def _file_name(self, directory):
+        stem = os.path.splitext(self.invoice)[0] or 'results'
+        stem = ''.join(c if c.isalnum() or c in '-_' else '_' for c in stem)
+        name = f"{self.verified_at:%Y%m%dT%H%M%S}-{os.getpid()}-{stem}"
+        path = os.path.join(directory, f"{name}.parquet")
+        copy = 1
+        while os.path.exists(path):
+            copy += 1
+            path = os.path.join(directory, f"{name}-{copy}.parquet")
+        return path
+
+    def close(self):
+        """Publish the run's files; returns their paths"""
+        for month, (tmp_path, writer) in sorted(self._writers.items()):
+            writer.close()
+            path = self._file_name(os.path.dirname(tmp_path))
+            os.replace(tmp_path, path)
+            self.files.append(path)
+        self._writers = {}
+        if results_enabled() and pq is None:
+            print("Note: results dataset not updated (pyarrow is not installed)")
+        return self.files
+
+    def discard(self):
+        """Drop the run's unpublished files"""
+        for tmp_path, writer in self._writers.values():
+            writer.close()
+            os.remove(tmp_path)
+        self._writers = {}
+
+
+def record_results(station, results, invoice=None, root=None, month=None):
+    """Append a run's verified output to the dataset; returns the files written
+
+    results is the output frame, or the path of the output CSV (read in
+    chunks, only the columns the dataset needs).
+    """
+    with ResultsWriter(station, invoice, root, month) as writer:
+        if isinstance(results, pd.DataFrame):
+            writer.write(results)
+        elif writer.enabled:
+            columns = get_result_columns(station)
+            wanted = {spec[0] if isinstance(spec, tuple) else spec for spec in columns.values()}
+            for chunk in read_csv_chunks(results, usecols=lambda name: name in wanted):
+                writer.write(chunk)
+    return writer.files
+
+
+def partitions(root=None, stations=None, months=None, since=None, until=None):
+    """(station, billing month, folder) of every partition a query needs, from the folder names alone"""
+    root = root or RESULTS_DIR
+    wanted = {str(station).upper() for station in stations} if stations else None
+    found = []
+    for station_dir in sorted(glob.glob(os.path.join(root, 'station=*'))):
+        station = unquote(os.path.basename(station_dir).split('=', 1)[1])
+        if wanted is not None and station.upper() not in wanted:
+            continue
+        for month_dir in sorted(glob.glob(os.path.join(station_dir, 'billing_month=*'))):
+            month = os.path.basename(month_dir).split('=', 1)[1]
+            if (months and month not in months) or (since and month < since) or (until and month > until):
+                continue
+            found.append((station, month, month_dir))
+    return found
+
+
+def read_results(stations=None, months=None, since=None, until=None, columns=None, latest=False, root=None):
+    """Results of the given stations and billing months (inclusive bounds), only the given columns
+
+    With latest=True, an invoice verified more than once keeps only the
+    lines of its latest run.
+    """
+    _require_pyarrow()
+    columns = list(columns or RESULT_COLUMNS)
+    unknown = [col for col in columns if col not in RESULT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown result columns: {', '.join(unknown)}")
+    needed = set(columns) | ({'invoice', 'verified_at'} if latest else set())
+    file_columns = [col for col in FILE_COLUMNS if col in needed]
+
+    parts = []
+    for station, month, directory in partitions(root, stations, months, since, until):
+        for path in sorted(glob.glob(os.path.join(directory, '*.parquet'))):
+            table = pq.read_table(path, columns=file_columns)
+            df = table.to_pandas() if file_columns else pd.DataFrame(index=pd.RangeIndex(table.num_rows))
+            df.insert(0, 'station', station)
+            df.insert(1, 'billing_month', month)
+            parts.append(df)
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+    if latest:
+        newest = df.groupby(['station', 'invoice'], observed=True)['verified_at'].transform('max')
+        df = df[df['verified_at'] == newest].reset_index(drop=True)
+    for col in ('station', 'billing_month', 'status'):
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df[columns]
+
+
+def summarize(df):
+    """Lines, lines per status and charge totals per station and billing month"""
+    status = df['status'].astype(object)
+    summary = df.assign(**{name: status == name for name in STATUSES}).groupby(
+        ['station', 'billing_month'], observed=True).agg(
+        Lines=('status', 'size'),
+        **{name.replace(' ', '_'): (name, 'sum') for name in STATUSES},
+        Calculated_Total=('calculated_charge', 'sum'),
+        Vendor_Total=('vendor_charge', 'sum'),
+    )
+    return summary.round(2).reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the results dataset, or add a verified CSV to it")
+    parser.add_argument('--stations', nargs='+', help="Stations to read (default: all)")
+    parser.add_argument('--months', nargs='+', help="Billing months to read (YYYY-MM)")
+    parser.add_argument('--since', help="First billing month to read (YYYY-MM)")
+    parser.add_argument('--until', help="Last billing month to read (YYYY-MM)")
+    parser.add_argument('--columns', nargs='+', choices=RESULT_COLUMNS, metavar='COLUMN',
+                        help=f"Columns to read ({', '.join(RESULT_COLUMNS)})")
+    parser.add_argument('--all-runs', action='store_true', help="Keep earlier runs of re-verified invoices")
+    parser.add_argument('--output', help="Write the lines read to this CSV instead of summarizing them")
+    parser.add_argument('--record', nargs=2, metavar=('STATION', 'CSV'),
+                        help="Append a station's verified CSV to the dataset")
+    parser.add_argument('--invoice', help="With --record: the vendor file the CSV was verified from")
+    parser.add_argument('--billing-month', help="With --record: billing month of lines without a date")
+    parser.add_argument('--root', default=RESULTS_DIR, help="Folder of the dataset")
+    args = parser.parse_args(argv)
+
+    if pq is None:
+        print("ERROR: The results dataset needs pyarrow (pip install pyarrow)")
+        return 1
+    try:
+        for month in (args.months or []) + [args.since, args.until, args.billing_month]:
+            if month:
+                check_month(month)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 1
+
+    if args.record:
+        station, path = args.record
+        if not os.path.exists(path):
+            print(f"ERROR: File not found: {path}")
+            return 1
+        files = record_results(station, path, args.invoice or path, args.root, args.billing_month)
+        for file in files:
+            print(f"Results appended: {file}")
+        return 0
+
+    if args.output:
+        df = read_results(args.stations, args.months, args.since, args.until, args.columns,
+                          latest=not args.all_runs, root=args.root)
+        df.to_csv(args.output, index=False)
+        print(f"{len(df)} result lines saved to: {args.output}")
+        return 0
+
+    df = read_results(args.stations, args.months, args.since, args.until,
+                      ['station', 'billing_month', 'calculated_charge', 'vendor_charge', 'status'],
+                      latest=not args.all_runs, root=args.root)
+    if df.empty:
+        print(f"No results in {args.root} for this query")
+        return 0
+    print(summarize(df).to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Schema-aware reading of master CSVs
+
+Several rate masters (AMM, ASB) are padded to 16,384 columns for a few
+dozen real rows, and pd.read_csv spends seconds building object columns
+out of that padding even with usecols. read_master_schema streams the
+file, drops the trailing empty cells of each line before the csv module
+tokenizes it, and prunes each row to the wanted columns, so neither
+pandas nor the tokenizer ever sees the padding.
+"""
+import csv
+import io
+
+import pandas as pd
+
+BOM = '\ufeff'
+
+
+def clean_column_name(name):
+    """Strip a BOM and surrounding whitespace from a header cell"""
+    return str(name).replace(BOM, '').strip()
+
+
+def _trimmed_lines(f):
+    """Lines of f without their trailing empty cells (a line of only empty cells stays one empty cell)"""
+    for line in f:
+        body = line.rstrip('\r\n')
+        trimmed = body.rstrip(',')
+        if body and not trimmed:
+            trimmed = '""'
+        yield trimmed + line[len(body):]
+
+
+def _content_width(row):
+    """Position after the last cell holding a value"""
+    return next((i + 1 for i in range(len(row) - 1, -1, -1) if row[i].strip()), 0)
+
+
+def read_master_schema(path, columns=None, numeric=(), encoding='utf-8-sig'):
+    """Read a master CSV keeping only real content
+
+    columns - header names to keep (after cleaning); every column whose
+              header matches is kept, in file order. With None, every
+              column up to the last one holding any value is kept and
+              trailing empty padding is dropped.
+    numeric - columns converted with pd.to_numeric (non-numbers -> NaN)
+
+    Header names are returned cleaned (no BOM, no surrounding whitespace).
+    """
+    wanted = None if columns is None else {clean_column_name(col) for col in columns}
+
+    with open(path, newline='', encoding=encoding) as f:
+        reader = csv.reader(_trimmed_lines(f))
+        header_row = next(reader, None)
+        if header_row is None:
+            return pd.DataFrame(columns=list(columns or []))
+        header = [clean_column_name(name) for name in header_row]
+        if wanted is not None:
+            missing = wanted - set(header)
+            if missing:
+                raise ValueError(f"Columns not found in {path}: {sorted(missing)}")
+            positions = [i for i, name in enumerate(header) if name in wanted]
+            end = max(positions, default=-1) + 1
+
+        rows = []
+        width = _content_width(header_row)
+        for row in reader:
+            if not row:
+                continue  # blank line, skipped by read_csv too
+            if wanted is None:
+                width = max(width, _content_width(row))
+            else:
+                row = row[:end]
+            rows.append(row)
+    if wanted is None:
+        positions = list(range(width))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header[i] if i < len(header) else '' for i in positions])
+    for row in rows:
+        writer.writerow([row[i] if i < len(row) else '' for i in positions])
+    buffer.seek(0)
+
+    df = pd.read_csv(buffer)
+    for col in numeric:
+        df[clean_column_name(col)] = pd.to_numeric(df[clean_column_name(col)], errors='coerce')
+    return df
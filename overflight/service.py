@@ -0,0 +1,342 @@
+"""Local HTTP service that verifies invoices with warm station workers
+
+Usage:
+    python -m overflight.service                      # http://127.0.0.1:8765
+    python -m overflight.service --port 9000 --workers 4
+
+Endpoints (JSON responses):
+
+    POST /verify/<STATION>   body: the vendor CSV, as the station receives it
+                             (name it with ?name=1900373598.csv if you like),
+                             or JSON {"rows": [{column: value, ...}, ...]}
+                             with the station's vendor columns
+    GET  /stations           stations that can be verified
+    GET  /stats              requests by outcome and latency percentiles per station
+    GET  /health
+
+    curl --data-binary @IKA/1900357153.csv http://127.0.0.1:8765/verify/IKA
+
+Requests are verified by the station scripts on a pool of worker
+processes started with the service: each loads the masters once and
+keeps them, and pandas, in memory between requests, so a request costs
+only its own rows. Requests are served concurrently, up to --workers at
+a time. The server only listens on the loopback interface.
+
+A request that runs past REQUEST_TIMEOUT gets 504. A job still waiting
+for a worker is cancelled; one already running cannot be stopped without
+breaking the pool, so it is left to finish, counted under /health until
+it does, and cleans up its scratch folder then. If a worker dies (out of
+memory, a crash in a C extension), the request it was verifying fails,
+/health reports the pool as broken, and the next request replaces the
+pool with a new one.
+"""
+import argparse
+import collections
+import ipaddress
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from overflight.batch import ROOT_DIR, find_stations
+from overflight.invoices import run_invoice
+from overflight.store import preload_masters
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_BODY_MB = 50
+REQUEST_TIMEOUT = 120  # seconds
+LATENCY_WINDOW = 1000  # latest requests kept per station for the percentiles
+
+
+OUTCOMES = ['ok', 'failed', 'timed_out']
+
+
+class LatencyStats:
+    """Latency and outcome of the latest requests per station, safe to share between threads"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.counts = collections.Counter()
+        self.running_timed_out = 0
+        self.lock = threading.Lock()
+
+    def record(self, station, seconds, outcome='ok'):
+        """One finished request: 'ok', 'failed' (any error response) or 'timed_out'"""
+        with self.lock:
+            self.samples.setdefault(station, collections.deque(maxlen=self.window)).append(seconds)
+            self.counts[station, outcome] += 1
+
+    def track_timed_out(self, future, cleanup):
+        """Count a timed-out job that is still running until it finishes, then call cleanup"""
+        with self.lock:
+            self.running_timed_out += 1
+
+        def finished(_):
+            cleanup()
+            with self.lock:
+                self.running_timed_out -= 1
+
+        future.add_done_callback(finished)
+
+    def summary(self):
+        """Requests by outcome and p50 / p90 / p99 / max latency in ms per station"""
+        with self.lock:
+            samples = {station: np.array(values) * 1000 for station, values in self.samples.items()}
+            counts = dict(self.counts)
+        summary = {}
+        for station, ms in sorted(samples.items()):
+            p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+            outcomes = {outcome: counts.get((station, outcome), 0) for outcome in OUTCOMES}
+            summary[station] = {
+                'requests': sum(outcomes.values()),
+                **outcomes,
+                'p50_ms': round(float(p50), 1),
+                'p90_ms': round(float(p90), 1),
+                'p99_ms': round(float(p99), 1),
+                'max_ms': round(float(ms.max()), 1),
+            }
+        return summary
+
+
+def start_worker(root):
+    """Pool initializer: load the masters once; traces and the results dataset are left to batch runs"""
+    os.environ['OVERFLIGHT_TRACE'] = '0'
+    os.environ['OVERFLIGHT_RESULTS'] = '0'
+    preload_masters(root)
+
+
+def start_pool(root, workers):
+    """Worker pool with every worker started, so the first requests do not wait for the masters"""
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=start_worker, initargs=(root,))
+    for future in [pool.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return pool
+
+
+def replace_pool(server, broken):
+    """Swap a pool whose worker died for a new one, once however many requests noticed"""
+    with server.pool_lock:
+        if server.pool is broken:
+            print("A worker process died: starting a new pool", flush=True)
+            broken.shutdown(wait=False, cancel_futures=True)
+            server.pool = start_pool(server.root, server.workers)
+            server.pool_restarts += 1
+        return server.pool
+
+
+def pool_broken(pool):
+    """True when a worker of the pool died (a broken pool refuses new work)"""
+    try:
+        pool.submit(os.getpid)
+    except BrokenProcessPool:
+        return True
+    return False
+
+
+def rows_to_csv(payload, path):
+    """Write a JSON batch of flight lines as a vendor CSV"""
+    rows = payload.get('rows') if isinstance(payload, dict) else payload
+    if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+        raise ValueError('expected {"rows": [{column: value, ...}, ...]}')
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def verify_request(server, station, body, content_type, name):
+    """Verify one request body with the station's script; returns the response dict"""
+    scratch = tempfile.mkdtemp(prefix='overflight-service-')
+    try:
+        name = os.path.basename(name or 'invoice.csv')
+        if not name.lower().endswith('.csv'):
+            name += '.csv'
+        invoice = os.path.join(scratch, name)
+        if 'json' in content_type:
+            rows_to_csv(json.loads(body.decode('utf-8')), invoice)
+        else:
+            with open(invoice, 'wb') as f:
+                f.write(body)
+        output_file = os.path.join(scratch, os.path.splitext(name)[0] + '_Verified.csv')
+
+        pool = server.pool
+        try:
+            future = pool.submit(run_invoice, station, invoice, output_file, server.root)
+        except BrokenProcessPool:
+            pool = replace_pool(server, pool)
+            future = pool.submit(run_invoice, station, invoice, output_file, server.root)
+        try:
+            row = future.result(timeout=REQUEST_TIMEOUT)
+        except BrokenProcessPool as e:
+            replace_pool(server, pool)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {
+                'station': station, 'status': 'Failed', 'error': f"worker process died: {e}",
+            }
+        except FutureTimeoutError:
+            if not future.cancel():
+                # Already running: the worker still needs the scratch folder
+                server.stats.track_timed_out(future, lambda folder=scratch: shutil.rmtree(folder, ignore_errors=True))
+                scratch = None
+            return HTTPStatus.GATEWAY_TIMEOUT, {
+                'station': station, 'status': 'Timed out', 'error': f"no result within {REQUEST_TIMEOUT}s",
+            }
+        if row['Status'] != 'OK' or not os.path.exists(output_file):
+            log_file = os.path.splitext(output_file)[0] + '.log'
+            log_tail = []
+            if os.path.exists(log_file):
+                with open(log_file, encoding='utf-8', errors='replace') as f:
+                    log_tail = f.read().strip().splitlines()[-10:]
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {
+                'station': station, 'status': row['Status'], 'error': row['Error'], 'log': log_tail,
+            }
+
+        results = pd.read_csv(output_file)
+        return HTTPStatus.OK, {
+            'station': station,
+            'invoice': name,
+            'status': row['Status'],
+            'records': row['Records'],
+            'matched': row['Matched'],
+            'not_matched': row['Not_Matched'],
+            'missing_input': row['Missing_Input'],
+            'seconds': row['Seconds'],
+            'results': json.loads(results.to_json(orient='records')),
+        }
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+class VerificationHandler(BaseHTTPRequestHandler):
+    server_version = 'OverflightVerification/1.0'
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip('/')
+        if path == '/health':
+            broken = pool_broken(self.server.pool)
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE if broken else HTTPStatus.OK, {
+                'status': 'broken' if broken else 'ok',
+                'workers': self.server.workers,
+                'pool_restarts': self.server.pool_restarts,
+                'timed_out_running': self.server.stats.running_timed_out,
+            })
+        elif path == '/stations':
+            self.send_json(HTTPStatus.OK, {'stations': self.server.stations})
+        elif path == '/stats':
+            self.send_json(HTTPStatus.OK, self.server.stats.summary())
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {'error': f"unknown path {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/', 1)
+        if len(parts) != 2 or parts[0] != 'verify':
+            self.send_json(HTTPStatus.NOT_FOUND, {'error': f"unknown path {url.path}"})
+            return
+        station = parts[1]
+        if station not in self.server.stations:
+            self.send_json(HTTPStatus.NOT_FOUND, {'error': f"unknown station {station}"})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self.send_json(HTTPStatus.BAD_REQUEST, {'error': 'empty request body'})
+            return
+        if length > MAX_BODY_MB * 1024 * 1024:
+            self.send_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': f"body over {MAX_BODY_MB} MB"})
+            return
+        body = self.rfile.read(length)
+        name = parse_qs(url.query).get('name', [None])[0]
+        content_type = self.headers.get('Content-Type', '').lower()
+
+        started = time.perf_counter()
+        try:
+            status, payload = verify_request(self.server, station, body, content_type, name)
+        except ValueError as e:
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(e).__name__}: {e}"}
+        seconds = time.perf_counter() - started
+        if status == HTTPStatus.OK:
+            outcome = 'ok'
+        elif status == HTTPStatus.GATEWAY_TIMEOUT:
+            outcome = 'timed_out'
+        else:
+            outcome = 'failed'
+        self.server.stats.record(station, seconds, outcome)
+        payload['latency_ms'] = round(seconds * 1000, 1)
+        self.send_json(status, payload)
+
+    def log_message(self, format, *args):
+        print(f"{self.log_date_time_string()} {self.address_string()} {format % args}", flush=True)
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, root=ROOT_DIR):
+    """Start the worker pool and return the (not yet serving) HTTP server"""
+    if not is_loopback(host):
+        raise ValueError(f"The service only listens on the loopback interface, not {host}")
+    server = ThreadingHTTPServer((host, port), VerificationHandler)
+    server.root = root
+    server.stations = find_stations(root)
+    server.workers = workers or os.cpu_count() or 1
+    server.pool = start_pool(root, server.workers)
+    server.pool_lock = threading.Lock()
+    server.pool_restarts = 0
+    server.stats = LatencyStats()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP service that verifies invoices")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="Loopback address to listen on")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, help="Worker processes (default: all cores)")
+    parser.add_argument('--root', default=ROOT_DIR, help="Directory that holds the station folders")
+    args = parser.parse_args(argv)
+
+    try:
+        server = make_server(args.host, args.port, args.workers, os.path.abspath(args.root))
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 1
+    print(f"Verifying {len(server.stations)} stations on http://{args.host}:{args.port} "
+          f"with {server.workers} workers (Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Per-stage timing and memory of a station run, with a JSON trace
+
+Scripts call stage('load'), stage('lookup'), ... as they move from one
+part of the pipeline to the next. Time is charged to the current stage
+until the next call, so a stage may be entered more than once (e.g. AUH
+parses the vendor charge after the rate lookup) and its times add up.
+
+    load    - read the vendor file and masters, parse and clean vendor columns
+    lookup  - MTOW and rate master lookups
+    compute - the station's charge formula
+    compare - match status and the console report
+    write   - save the verified output
+
+For every stage the trace records wall and CPU seconds, the rows going
+in and out (scripts pass rows= at each boundary: rows_in is the count at
+the first entry, rows_out at the last exit) and how far the stage raised
+the process's peak memory. When the run ends the trace is written as
+JSON to TRACE_DIR/<station>-<timestamp>.json; set OVERFLIGHT_TRACE=0 to
+turn that off.
+
+    python -m overflight.stages    # latest run of every station vs the run before
+"""
+import argparse
+import atexit
+import datetime
+import glob
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+STAGES = ('load', 'lookup', 'compute', 'compare', 'write')
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRACE_DIR = os.environ.get('OVERFLIGHT_TRACE_DIR', os.path.join(ROOT_DIR, '.traces'))
+
+_records = {}
+_current = None
+_mark = None  # (wall, cpu, peak MB) when the current stage started
+_run = {'started': None, 'written': True, 'exit_hook': False}
+
+
+def trace_enabled():
+    """False when OVERFLIGHT_TRACE is set to 0 / false / no"""
+    return os.environ.get('OVERFLIGHT_TRACE', '1').strip().lower() not in ('0', 'false', 'no')
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process so far, in MB (None where unknown)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _new_record():
+    return {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'rows_in': None, 'rows_out': None, 'peak_mb_delta': None}
+
+
+def _now():
+    return time.perf_counter(), time.process_time(), peak_memory_mb()
+
+
+def _charge_current(now, rows=None):
+    """Add the time and memory since the mark to the current stage"""
+    global _mark
+    record = _records[_current]
+    record['wall'] += now[0] - _mark[0]
+    record['cpu'] += now[1] - _mark[1]
+    if now[2] is not None:
+        record['peak_mb_delta'] = (record['peak_mb_delta'] or 0.0) + (now[2] - _mark[2])
+    if rows is not None:
+        record['rows_out'] = int(rows)
+    _mark = now
+
+
+def stage(name, rows=None):
+    """Close the current stage and start the named one (None to stop)
+
+    rows - rows in the working frame at this boundary: rows out of the
+           stage being closed and rows into the one being started
+    """
+    global _current, _mark
+    now = _now()
+    if _current is not None:
+        _charge_current(now, rows)
+    elif _run['started'] is None:
+        _run['started'] = datetime.datetime.now()
+        if not _run['exit_hook']:
+            atexit.register(_write_trace_at_exit)
+            _run['exit_hook'] = True
+
+    if name is not None:
+        record = _records.setdefault(name, _new_record())
+        record['calls'] += 1
+        if rows is not None and record['rows_in'] is None:
+            record['rows_in'] = int(rows)
+    _current, _mark = name, now
+    _run['written'] = False
+
+
+def stage_timings():
+    """Wall seconds spent in each stage so far, closing the stage in progress"""
+    return {name: record['wall'] for name, record in stage_trace().items()}
+
+
+def stage_trace():
+    """Everything recorded per stage so far, closing the stage in progress"""
+    if _current is not None:
+        _charge_current(_now())
+    records = {name: _records.get(name, _new_record()) for name in STAGES}
+    records.update({name: record for name, record in _records.items() if name not in STAGES})
+    return {name: dict(record) for name, record in records.items()}
+
+
+def reset_stages():
+    """Forget all timings and start a new run"""
+    global _current, _mark
+    _records.clear()
+    _current = _mark = None
+    _run.update(started=None, written=True)
+
+
+def current_station():
+    """Station of the running script: the folder it lives in"""
+    script = sys.argv[0] if sys.argv and sys.argv[0] else os.getcwd()
+    return os.path.basename(os.path.dirname(os.path.abspath(script))) or 'unknown'
+
+
+def write_trace(path=None, station=None):
+    """Write the trace of the current run as JSON and return its path"""
+    station = station or current_station()
+    stages = stage_trace()
+    finished = datetime.datetime.now()
+    started = _run['started'] or finished
+    trace = {
+        'station': station,
+        'started': started.isoformat(timespec='seconds'),
+        'finished': finished.isoformat(timespec='seconds'),
+        'argv': sys.argv[1:],
+        'python': sys.version.split()[0],
+        'wall': sum(record['wall'] for record in stages.values()),
+        'cpu': sum(record['cpu'] for record in stages.values()),
+        'peak_mb': peak_memory_mb(),
+        'stages': stages,
+    }
+    if path is None:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        safe_station = ''.join(c if c.isalnum() or c in '-_' else '_' for c in station)
+        path = os.path.join(TRACE_DIR, f"{safe_station}-{started:%Y%m%d-%H%M%S}-{os.getpid()}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(trace, f, indent=2)
+    _run['written'] = True
+    return path
+
+
+def _write_trace_at_exit():
+    if _run['written'] or not trace_enabled():
+        return
+    try:
+        write_trace()
+    except OSError:
+        pass  # a read-only checkout must not fail the run
+
+
+def load_traces(trace_dir=TRACE_DIR):
+    """Every trace in trace_dir, oldest first"""
+    traces = []
+    for path in glob.glob(os.path.join(trace_dir, '*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                trace = json.load(f)
+        except (OSError, ValueError):
+            continue
+        trace['path'] = path
+        traces.append(trace)
+    return sorted(traces, key=lambda t: (t.get('started', ''), t['path']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the latest stage trace of each station with the run before")
+    parser.add_argument('--dir', default=TRACE_DIR, help="Directory with the JSON traces")
+    parser.add_argument('--stations', nargs='+', help="Stations to show (default: all)")
+    args = parser.parse_args(argv)
+
+    runs = {}
+    for trace in load_traces(args.dir):
+        runs.setdefault(trace['station'], []).append(trace)
+    if args.stations:
+        runs = {station: traces for station, traces in runs.items() if station in args.stations}
+    if not runs:
+        print(f"No traces in {args.dir}")
+        return 1
+
+    header = f"{'Station':<35} " + ' '.join(f"{name.capitalize():>9}" for name in STAGES) + f" {'Wall':>9} {'CPU':>9} {'Peak MB':>9}"
+    print(header)
+    print('-' * len(header))
+    for station in sorted(runs):
+        latest = runs[station][-1]
+        stages = latest['stages']
+        cells = ' '.join(f"{stages.get(name, {}).get('wall', 0.0):>9.3f}" for name in STAGES)
+        peak = '-' if latest.get('peak_mb') is None else f"{latest['peak_mb']:.1f}"
+        print(f"{station:<35} {cells} {latest['wall']:>9.3f} {latest['cpu']:>9.3f} {peak:>9}")
+        if len(runs[station]) > 1:
+            previous = runs[station][-2]
+            change = ' '.join(
+                f"{stages.get(name, {}).get('wall', 0.0) - previous['stages'].get(name, {}).get('wall', 0.0):>+9.3f}"
+                for name in STAGES
+            )
+            print(f"{'  vs ' + previous['started']:<35} {change} {latest['wall'] - previous['wall']:>+9.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""One in-memory store for the master files shared by the stations
+
+Master CSVs are held once per process, keyed by their content hash: the
+MTOW Master copied into a dozen station folders is parsed (through the
+binary cache) and kept in memory once, however many stations ask for it.
+The airport table lives once in masters/airports.csv.
+
+The lookups compiled from the masters (registration index, rate bands)
+are kept the same way by compiled_lookup, keyed by the content of the
+columns they are built from, so a warm batch, watch or service worker
+compiles them once and not for every invoice.
+
+    python -m overflight.store    # report masters that have drifted apart
+"""
+import glob
+import hashlib
+import os
+
+import pandas as pd
+
+from overflight.cache import cached_read, file_hash
+from overflight.schema import read_master_schema
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MASTERS_DIR = os.path.join(ROOT_DIR, 'masters')
+AIRPORTS_FILE = os.path.join(MASTERS_DIR, 'airports.csv')
+
+# File name fragments (lower case) that identify a master file
+MASTER_KINDS = {
+    'fleet': ('mtow master',),
+    'rates': ('rate master',),
+    'airports': ('iata icao', 'airports'),
+}
+
+_tables = {}  # (content hash, columns, numeric) -> parsed frame
+_compiled = {}  # (builder, frame content hash, options) -> compiled lookup
+
+
+def load_master(path, columns=None, numeric=()):
+    """Load a master file through the shared store
+
+    Headers come back without BOM or surrounding whitespace and trailing
+    empty padding columns are dropped. columns / numeric restrict the read
+    to the named columns and declare which of them are numbers (see
+    read_master_schema).
+
+    Files with the same bytes resolve to the same frame. Each caller gets a
+    shallow copy, so renaming or adding columns in one station never leaks
+    into another (pandas Copy-on-Write protects the shared data).
+    """
+    columns = None if columns is None else tuple(columns)
+    numeric = tuple(numeric)
+    key = (file_hash(path), columns, numeric)
+    if key not in _tables:
+        _tables[key] = cached_read(path, read_master_schema, columns=columns, numeric=numeric)
+    return _tables[key].copy(deep=False)
+
+
+def frame_hash(df):
+    """Content hash of a frame: its column names and values"""
+    digest = hashlib.sha256(repr([str(col) for col in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _shallow(value):
+    if isinstance(value, dict):
+        return {key: _shallow(item) for key, item in value.items()}
+    return value.copy(deep=False) if isinstance(value, (pd.DataFrame, pd.Series)) else value
+
+
+def compiled_lookup(builder, df, *args, **kwargs):
+    """builder(df, *args, **kwargs), built once per process for each content of df
+
+    df should hold only the columns the builder reads. Callers get shallow
+    copies, so changing a compiled lookup never changes the shared one.
+    """
+    key = (f"{builder.__module__}.{builder.__qualname__}", frame_hash(df), repr(args), repr(sorted(kwargs.items())))
+    if key not in _compiled:
+        _compiled[key] = builder(df, *args, **kwargs)
+    return _shallow(_compiled[key])
+
+
+def load_airports():
+    """The airport table (IATA, ICAO, name, latitude, longitude)"""
+    return load_master(AIRPORTS_FILE)
+
+
+def master_kind(path):
+    """Return 'fleet', 'rates' or 'airports' for a master file name, else None"""
+    name = os.path.basename(path).lower()
+    for kind, fragments in MASTER_KINDS.items():
+        if any(fragment in name for fragment in fragments):
+            return kind
+    return None
+
+
+def find_master_files(root=ROOT_DIR):
+    """Every master CSV in the station folders and in masters/"""
+    files = glob.glob(os.path.join(root, '*', '*.csv'))
+    return sorted(f for f in files if master_kind(f) is not None)
+
+
+def preload_masters(root=ROOT_DIR):
+    """Load every master once, e.g. when a batch worker starts, and index the fleet masters"""
+    from overflight.mtow import build_registration_index
+
+    for path in find_master_files(root):
+        df = load_master(path)
+        if master_kind(path) == 'fleet':
+            try:
+                build_registration_index(df)
+            except KeyError:
+                pass  # not the usual Aircraft / MTOW_in_KGs layout: indexed when a station first uses it
+    return len(_tables)
+
+
+def store_report(root=ROOT_DIR):
+    """One row per master file: kind, station, content hash and variant number"""
+    rows = []
+    for path in find_master_files(root):
+        rows.append({
+            'Kind': master_kind(path),
+            'Station': os.path.basename(os.path.dirname(path)),
+            'File': os.path.basename(path),
+            'Hash': file_hash(path)[:12],
+        })
+    report = pd.DataFrame(rows, columns=['Kind', 'Station', 'File', 'Hash'])
+    report['Variant'] = report.groupby('Kind')['Hash'].transform(lambda h: pd.factorize(h)[0] + 1)
+    return report
+
+
+def fleet_conflicts(root=ROOT_DIR):
+    """Registrations whose MTOW differs between the fleet master copies"""
+    from overflight.mtow import build_registration_index
+
+    variants = {}
+    for path in find_master_files(root):
+        if master_kind(path) == 'fleet':
+            key = file_hash(path)[:12]
+            if key not in variants:
+                variants[key] = build_registration_index(load_master(path))
+    if len(variants) < 2:
+        return pd.DataFrame()
+
+    fleet = pd.DataFrame(variants)
+    differs = fleet.nunique(axis=1, dropna=False) > 1
+    return fleet[differs].sort_index()
+
+
+def main():
+    report = store_report()
+    print("=" * 80)
+    print("MASTER STORE")
+    print("=" * 80)
+    for kind, group in report.groupby('Kind'):
+        print(f"\n{kind}: {len(group)} files, {group['Hash'].nunique()} distinct")
+        for (variant, file_hash_), files in group.groupby(['Variant', 'Hash']):
+            print(f"  variant {variant} ({file_hash_}): {', '.join(files['Station'])}")
+
+    conflicts = fleet_conflicts()
+    if len(conflicts) > 0:
+        print(f"\n[FLEET DRIFT] {len(conflicts)} registrations have a different MTOW between copies:")
+        print(conflicts.to_string())
+
+
+if __name__ == '__main__':
+    main()
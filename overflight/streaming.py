@@ -0,0 +1,77 @@
+"""Helpers for verifying vendor files too large to load in one go"""
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def read_csv_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """Read a CSV in fixed-size chunks of rows
+
+    Every column is read as text unless dtype is given, so a column keeps
+    the same type from one chunk to the next. Quoted cells that span
+    several lines are kept whole.
+    """
+    kwargs.setdefault('dtype', str)
+    return pd.read_csv(path, chunksize=chunk_size, **kwargs)
+
+
+class ChunkWriter:
+    """Write verified chunks to one CSV, header first, then appending"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.chunks = 0
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        df.to_csv(self.path, mode='a', header=self.chunks == 0, index=False)
+        self.rows += len(df)
+        self.chunks += 1
+
+
+class RunningStats:
+    """Count / min / max / sum / mean of a numeric column, updated chunk by chunk"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = np.nan
+        self.max = np.nan
+
+    def update(self, values):
+        values = pd.to_numeric(pd.Series(values), errors='coerce').dropna()
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.total += values.sum()
+        self.min = values.min() if np.isnan(self.min) else min(self.min, values.min())
+        self.max = values.max() if np.isnan(self.max) else max(self.max, values.max())
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+
+class HeadCollector:
+    """Keep the first n rows seen across all chunks, for previews"""
+
+    def __init__(self, n):
+        self.n = n
+        self.parts = []
+        self.rows = 0
+
+    def update(self, df):
+        if self.rows < self.n and len(df) > 0:
+            part = df.head(self.n - self.rows)
+            self.parts.append(part)
+            self.rows += len(part)
+
+    def frame(self, columns=None):
+        if not self.parts:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(self.parts)
@@ -0,0 +1,207 @@
+"""Watch the station folders and verify invoices as they arrive
+
+Usage:
+    python -m overflight.watch
+    python -m overflight.watch --stations AUH IKA --workers 2 --interval 5 --settle 10
+
+A long-running process polls the station folders for new or changed
+vendor files (see overflight.manifest for how files are told apart). A
+file is verified once its size and modification time have stayed the
+same for --settle seconds, so a CSV still being written by the PDF
+conversion is not picked up half-way. Results go to <invoice>_Verified.csv
+(and a .log) next to the invoice.
+
+Invoices are verified by a pool of --workers processes that live as long
+as the watcher: each loads the masters once when it starts and keeps
+them (and pandas) in memory, so a new drop only pays for its own rows. A
+master edited in the meantime is picked up by its content hash. If a
+worker dies (out of memory on a large drop, a crash in a C extension),
+the invoices it took down are logged as failed and the watcher carries
+on with a new pool.
+
+Files already in the folders when the watcher starts are left alone,
+unless --catch-up is given: then every invoice without an up-to-date
+*_Verified.csv is verified first. --once does a single pass and exits.
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from overflight.batch import ROOT_DIR, SCRIPT_NAME, find_stations
+from overflight.invoices import run_invoice, verified_path
+from overflight.manifest import classify_file, list_station
+from overflight.store import preload_masters
+
+DEFAULT_INTERVAL = 5  # seconds between scans
+DEFAULT_SETTLE = 10   # seconds a file must stay unchanged before it is verified
+DEFAULT_WORKERS = 2
+
+
+def scan_invoices(root, stations):
+    """(station, size, mtime) of every vendor file in the station folders, by path"""
+    found = {}
+    for station in stations:
+        station_dir = os.path.join(root, station)
+        try:
+            listing = list_station(station_dir)
+        except OSError:
+            continue  # folder removed or unreadable; try again next scan
+        for name, (size, mtime_ns) in listing.items():
+            if classify_file(name) == 'vendor':
+                found[os.path.join(station_dir, name)] = (station, size, mtime_ns)
+    return found
+
+
+def is_verified(invoice):
+    """True when the invoice has a results file newer than itself"""
+    output = verified_path(invoice, os.path.dirname(invoice))
+    return os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(invoice)
+
+
+class Watcher:
+    """Debounced queue of arriving invoices, verified on a warm process pool"""
+
+    def __init__(self, root=ROOT_DIR, stations=None, workers=DEFAULT_WORKERS,
+                 settle=DEFAULT_SETTLE, catch_up=False):
+        self.root = root
+        self.stations = stations or find_stations(root)
+        self.workers = workers
+        self.settle = settle
+        self.pending = {}  # path -> (station, size, mtime, first seen unchanged)
+        self.running = {}  # future -> (path, signature)
+        self.done = {}     # path -> signature it was verified (or left alone) at
+        self.pool = None
+        self.broken = False  # a worker died; the pool is replaced after collecting
+
+        for path, signature in scan_invoices(root, self.stations).items():
+            if not catch_up or is_verified(path):
+                self.done[path] = signature
+
+    def poll(self, now=None):
+        """Scan the folders; returns the invoices that have settled"""
+        now = time.monotonic() if now is None else now
+        in_flight = {path for path, _ in self.running.values()}
+        found = scan_invoices(self.root, self.stations)
+        for path in [path for path in self.pending if path not in found]:
+            del self.pending[path]  # removed before it settled
+
+        ready = []
+        for path, signature in found.items():
+            if self.done.get(path) == signature or path in in_flight:
+                continue
+            seen = self.pending.get(path)
+            if seen is None or seen[:3] != signature:
+                # New, or still being written: start the settle clock again
+                seen = self.pending[path] = signature + (now,)
+            if now - seen[3] >= self.settle:
+                ready.append(path)
+        return ready
+
+    def start_pool(self):
+        """A pool of warm workers, each loading the masters when it starts"""
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=preload_masters,
+                                        initargs=(self.root,))
+        self.broken = False
+
+    def replace_pool(self):
+        """Drop a pool whose worker died and start a new one"""
+        log("A worker process died: starting a new pool")
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.start_pool()
+
+    def submit(self, path):
+        """Hand one settled invoice to the pool"""
+        station, size, mtime_ns, _ = self.pending.pop(path)
+        output_file = verified_path(path, os.path.dirname(path))
+        try:
+            future = self.pool.submit(run_invoice, station, path, output_file, self.root)
+        except BrokenProcessPool as e:
+            self.done[path] = (station, size, mtime_ns)
+            log(f"{station}: {os.path.basename(path)} failed: {e}")
+            self.replace_pool()
+            return
+        self.running[future] = (path, (station, size, mtime_ns))
+        log(f"{station}: verifying {os.path.basename(path)}")
+
+    def collect(self, futures):
+        """Report finished invoices"""
+        for future in futures:
+            path, signature = self.running.pop(future)
+            self.done[path] = signature
+            station = signature[0]
+            try:
+                row = future.result()
+            except BrokenProcessPool as e:
+                self.broken = True
+                log(f"{station}: {os.path.basename(path)} failed: {e}")
+                continue
+            except Exception as e:
+                log(f"{station}: {os.path.basename(path)} failed: {e}")
+                continue
+            if row['Status'] == 'OK' and row.get('Records') is not None:
+                log(f"{station}: {row['Invoice']}: {row['Records']} records, {row['Matched']} matched, "
+                    f"{row['Not_Matched']} not matched, {row['Missing_Input']} missing input "
+                    f"-> {row['Output_File']} ({row['Seconds']:.2f}s)")
+            else:
+                log(f"{station}: {row['Invoice']}: {row['Status']} {row['Error'] or ''}".rstrip())
+
+    def run(self, interval=DEFAULT_INTERVAL, once=False):
+        """Scan, verify settled invoices and report, until interrupted"""
+        log(f"Watching {len(self.stations)} station folders with {self.workers} workers "
+            f"(scan every {interval}s, settle {self.settle}s)")
+        self.start_pool()
+        try:
+            while True:
+                for path in self.poll():
+                    self.submit(path)
+                if once and not self.running:
+                    break
+                finished, _ = wait(list(self.running), timeout=interval, return_when=FIRST_COMPLETED)
+                self.collect(finished)
+                if self.broken:
+                    self.replace_pool()
+                if once and not self.running:
+                    break
+                if not self.running:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            log("Stopping: waiting for the invoices being verified")
+            self.collect(wait(list(self.running))[0])
+        finally:
+            self.pool.shutdown()
+
+
+def log(message):
+    print(f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} {message}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify invoices as they arrive in the station folders")
+    parser.add_argument('--stations', nargs='+', help="Station folders to watch (default: all)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Invoices verified at the same time")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="Seconds between scans")
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE, help="Seconds a file must stay unchanged")
+    parser.add_argument('--catch-up', action='store_true', help="First verify invoices without up-to-date results")
+    parser.add_argument('--once', action='store_true', help="Verify what is there, then exit")
+    parser.add_argument('--root', default=ROOT_DIR, help="Directory that holds the station folders")
+    args = parser.parse_args(argv)
+
+    root = os.path.abspath(args.root)
+    stations = args.stations or find_stations(root)
+    missing = [s for s in stations if not os.path.isfile(os.path.join(root, s, SCRIPT_NAME))]
+    if missing:
+        print(f"ERROR: No {SCRIPT_NAME} for: {', '.join(missing)}")
+        return 1
+
+    settle = 0 if args.once else args.settle
+    watcher = Watcher(root, stations, max(1, args.workers), settle, args.catch_up)
+    watcher.run(args.interval, args.once)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
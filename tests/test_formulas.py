@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from overflight.formulas import (check_master_formula, compile_formula, evaluate_formula,
+                                 parse_expression)
+
+
+def spec(**steps):
+    return {'constants': {'unit_rate': 2}, 'steps': steps}
+
+
+@pytest.mark.parametrize('expression', [
+    '__import__("os").system("true")',
+    'mtow.real',
+    'mtow.__class__',
+    'mtow[0]',
+    '(lambda: 1)()',
+    'open("x")',
+    'round.__self__',
+    '[mtow]',
+    'mtow if mtow else 0',
+])
+def test_whitelist_rejects_non_arithmetic(expression):
+    with pytest.raises(ValueError):
+        parse_expression('test', expression)
+    with pytest.raises(ValueError):
+        compile_formula(spec(charge=expression))
+
+
+def test_whitelist_rejects_syntax_errors():
+    with pytest.raises(ValueError):
+        parse_expression('test', 'mtow +')
+
+
+def test_parse_returns_the_names_used():
+    _, names = parse_expression('test', 'round(unit_rate * sqrt(mtow) / 50, 2)')
+    assert names == {'unit_rate', 'mtow'}
+
+
+def test_step_used_before_it_is_computed():
+    with pytest.raises(ValueError):
+        compile_formula(spec(charge='factor * unit_rate', factor='mtow / 50'))
+
+
+def test_egypt_tariff():
+    result = evaluate_formula(compile_formula('EGYPT'), mtow=pd.Series([100.0, 'n/a']), distance=pd.Series([500, 500]))
+    assert result['weight_factor'].iloc[0] == 0.2
+    assert result['distance_factor'].iloc[0] == 5.0
+    assert result['charge'].iloc[0] == 21.38
+    assert np.isnan(result['charge'].iloc[1])
+
+
+def test_cmb_distance_is_capped():
+    result = evaluate_formula('CMB', distance=pd.Series([200, 450, 700]), mtow=pd.Series([60, 60, 60]))
+    assert result['distance_capped'].tolist() == [300, 450, 600]
+    assert result['charge'].tolist() == [120, 170, 220]
+
+
+def test_outputs_need_only_their_inputs():
+    result = evaluate_formula('CMB', outputs=['distance_capped'], distance=pd.Series([700], index=[5]))
+    assert list(result.columns) == ['distance_capped']
+    assert result.index.tolist() == [5]
+    with pytest.raises(ValueError):
+        evaluate_formula('CMB', distance=pd.Series([700]))
+
+
+def test_scalar_inputs_broadcast():
+    result = evaluate_formula(compile_formula(spec(charge='unit_rate * mtow')), mtow=pd.Series([1, 2]))
+    assert result['charge'].tolist() == [2, 4]
+
+
+def test_master_formula_matches_the_spec():
+    assert check_master_formula('CMB', pd.DataFrame({'Formula': ['(Distance+MTOW)/3', None]})) == ['(Distance+MTOW)/3']
+    assert check_master_formula('CMB', pd.DataFrame({'Rate': [1]})) == []
+
+
+def test_master_formula_that_differs_fails():
+    with pytest.raises(ValueError):
+        check_master_formula('CMB', pd.DataFrame({'Formula': ['(Distance*MTOW)/3']}))
+    with pytest.raises(ValueError):
+        check_master_formula('CMB', pd.DataFrame({'Formula': ['__import__("os")']}))
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from overflight.rates import compile_rate_bands, resolve_rate_bands
+
+
+def bands(mtows, rates):
+    return compile_rate_bands(pd.DataFrame({'Mtow': mtows, 'Rate': rates}), 'Mtow', 'Rate')
+
+
+def resolved(mtow, rate_bands, match):
+    result = resolve_rate_bands(pd.Series(mtow, dtype=object), rate_bands, match=match)
+    return result['Rate'].tolist(), result['Band_MTOW'].tolist()
+
+
+def assert_values(actual, expected):
+    np.testing.assert_array_equal(np.array(actual, dtype=float), np.array(expected, dtype=float))
+
+
+MTOW = [5, 10, 14, 16, 35, np.nan, 'n/a']
+
+
+@pytest.mark.parametrize('match, rates, band_mtow', [
+    ('exact', [np.nan, 1, np.nan, np.nan, np.nan, np.nan, np.nan],
+              [np.nan, 10, np.nan, np.nan, np.nan, np.nan, np.nan]),
+    ('floor', [np.nan, 1, 1, 1, 3, np.nan, np.nan],
+              [np.nan, 10, 10, 10, 30, np.nan, np.nan]),
+    ('ceiling', [1, 1, 2, 2, np.nan, np.nan, np.nan],
+                [10, 10, 20, 20, np.nan, np.nan, np.nan]),
+    ('nearest', [1, 1, 1, 2, 3, np.nan, np.nan],
+                [10, 10, 10, 20, 30, np.nan, np.nan]),
+])
+def test_band_matches(match, rates, band_mtow):
+    actual_rates, actual_band_mtow = resolved(MTOW, bands([10, 20, 30], [1, 2, 3]), match)
+    assert_values(actual_rates, rates)
+    assert_values(actual_band_mtow, band_mtow)
+
+
+def test_below_lowest_and_above_highest_band():
+    rate_bands = bands([10, 20, 30], [1, 2, 3])
+    assert_values(resolved([9.9, 30.1], rate_bands, 'floor')[0], [np.nan, 3])
+    assert_values(resolved([9.9, 30.1], rate_bands, 'ceiling')[0], [1, np.nan])
+    assert_values(resolved([0, 1000], rate_bands, 'nearest')[0], [1, 3])
+
+
+def test_nearest_tie_goes_to_the_row_listed_first():
+    # 15 is as close to 10 as to 20: the band listed first in the master wins
+    assert_values(resolved([15], bands([10, 20, 30], [1, 2, 3]), 'nearest')[0], [1])
+    assert_values(resolved([15], bands([20, 10, 30], [2, 1, 3]), 'nearest')[0], [2])
+
+
+def test_compile_keeps_first_duplicate_and_drops_non_numeric_mtow():
+    rate_bands = bands(['10', 'x', '20', '10'], [1, 9, 2, 5])
+    assert rate_bands['MTOW'].tolist() == [10, 20]
+    assert rate_bands['Rate'].tolist() == [1, 2]
+
+
+def test_result_is_aligned_to_the_mtow_index():
+    mtow = pd.Series([20, 10], index=['b', 'a'])
+    result = resolve_rate_bands(mtow, bands([10, 20], [1, 2]), match='exact')
+    assert result.index.tolist() == ['b', 'a']
+    assert result['Rate'].tolist() == [2, 1]
+
+
+def test_no_bands_match_nothing():
+    result = resolve_rate_bands(pd.Series([10, 20]), bands(['x'], [1]), match='nearest')
+    assert result['Rate'].isna().all() and result['Band_MTOW'].isna().all()
+
+
+def test_unknown_match_is_rejected():
+    with pytest.raises(ValueError):
+        resolve_rate_bands(pd.Series([10]), bands([10], [1]), match='closest')